@@ -0,0 +1,130 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows: slots are counted per process only
+    fcntl = None
+
+
+class AdmissionRejected(Exception):
+    """Raised when a generation cannot be admitted; status is 429 (queue full) or 503 (waited too long)"""
+
+    def __init__(self, reason, status, retry_after):
+        super().__init__(f"Server busy ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit in front of Ollama with a bounded FIFO wait queue and a queue-time deadline
+
+    With slot_dir the limit is shared by every process on the host: a slot is an flock on one of
+    `limit` files, released by the kernel if a worker dies while holding it.
+    """
+
+    def __init__(self, limit=2, max_queue=8, queue_timeout=30, slot_dir=None, poll_interval=0.05):
+        self.limit = max(1, limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.slot_dir = slot_dir if fcntl is not None else None
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._waiters = deque()
+        self._active = 0
+        self._admitted = 0
+        self._rejected = {"queue_full": 0, "queue_timeout": 0}
+        self._wait_total = 0.0
+        self._service_time = None  # Moving average of how long a slot is held
+        if self.slot_dir:
+            os.makedirs(self.slot_dir, exist_ok=True)
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up for a new arrival"""
+        service_time = self._service_time or self.queue_timeout
+        return max(1, math.ceil(service_time * (len(self._waiters) + 1) / self.limit))
+
+    def _try_slot(self):
+        # Caller must hold self._lock
+        if not self.slot_dir:
+            return "local" if self._active < self.limit else None
+        for index in range(self.limit):
+            f = open(os.path.join(self.slot_dir, f"slot_{index}.lock"), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except OSError:
+                f.close()
+        return None
+
+    def acquire(self, timeout=None, bounded=True):
+        """Wait in line for a slot and return it; raises AdmissionRejected when the queue is full or the wait runs out.
+        timeout=None uses queue_timeout and 0 waits indefinitely; bounded=False skips the queue-length
+        check (for callers that are already queued elsewhere)."""
+        timeout = self.queue_timeout if timeout is None else timeout
+        ticket = object()
+        start = time.time()
+        deadline = start + timeout if timeout > 0 else None
+        with self._lock:
+            if bounded and len(self._waiters) >= self.max_queue:
+                self._rejected["queue_full"] += 1
+                raise AdmissionRejected("queue_full", 429, self.retry_after())
+            self._waiters.append(ticket)
+            try:
+                while True:
+                    # Only the head of the line may take a slot, so waiters are served in arrival order
+                    if self._waiters[0] is ticket:
+                        slot = self._try_slot()
+                        if slot is not None:
+                            break
+                    remaining = deadline - time.time() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        self._rejected["queue_timeout"] += 1
+                        raise AdmissionRejected("queue_timeout", 503, self.retry_after())
+                    # Slots freed by other processes are not signalled, so poll when sharing them
+                    wait = self.poll_interval if self.slot_dir else None
+                    if remaining is not None:
+                        wait = min(wait, remaining) if wait else remaining
+                    self._changed.wait(wait)
+            finally:
+                self._waiters.remove(ticket)
+                self._changed.notify_all()
+            self._active += 1
+            self._admitted += 1
+            self._wait_total += time.time() - start
+        return {"slot": slot, "acquired_at": time.time(), "released": False}
+
+    def release(self, slot):
+        """Give a slot back; safe to call more than once"""
+        with self._lock:
+            if slot is None or slot["released"]:
+                return
+            slot["released"] = True
+            if slot["slot"] != "local":
+                fcntl.flock(slot["slot"], fcntl.LOCK_UN)
+                slot["slot"].close()
+            self._active -= 1
+            held = time.time() - slot["acquired_at"]
+            self._service_time = held if self._service_time is None else 0.8 * self._service_time + 0.2 * held
+            self._changed.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "shared_across_processes": bool(self.slot_dir),
+                "active": self._active,
+                "queue_depth": len(self._waiters),
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "admitted": self._admitted,
+                "rejected": dict(self._rejected),
+                "avg_wait": round(self._wait_total / self._admitted, 3) if self._admitted else 0.0,
+                "avg_service_time": round(self._service_time, 2) if self._service_time is not None else None,
+                "retry_after": self.retry_after()
+            }
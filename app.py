@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context, g
 import json
 import os
 import time
@@ -6,18 +6,38 @@ import datetime
 import traceback
 import requests  # Use requests directly instead of ollama client
 import io
+import re
+import hashlib
+import math
 from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 import threading
-import subprocess
-import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
+from ollama_health import OllamaHealthMonitor
+from ollama_pool import OLLAMA_HOSTS, OllamaHostPool
+from completion_cache import CompletionCache
+from jobs import JobManager, JobQueueFull
+from token_calibration import TokenCalibrationStore
+from circuit_breaker import CircuitBreaker
+from docx_fast import DOCX_RENDERER_VERSION, render_sop_docx
+from pdf_converter import PdfConverterPool
+from export_cache import ExportCache
+from sop_store import SopStore
+from tracing import Tracer
+from admission import AdmissionController, AdmissionRejected
+from singleflight import SingleFlight
+from model_warmup import ModelWarmer
+from metrics import (MetricsRegistry, LATENCY_BUCKETS, SECTION_LATENCY_BUCKETS,
+                     TOKENS_PER_SECOND_BUCKETS, TOKEN_COUNT_BUCKETS)
+import sop_generator
 
-# Ollama API configuration
-OLLAMA_API_BASE = "http://localhost:11434"
-OLLAMA_LIST_ENDPOINT = f"{OLLAMA_API_BASE}/api/tags"
-OLLAMA_GENERATE_ENDPOINT = f"{OLLAMA_API_BASE}/api/generate"
+# Ollama API configuration (requests go through the shared keep-alive client)
+OLLAMA_LIST_ENDPOINT = "/api/tags"
+OLLAMA_GENERATE_ENDPOINT = "/api/generate"
+OLLAMA_PS_ENDPOINT = "/api/ps"  # Models currently loaded in memory
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 1 * 1024 * 1024  # 1 MB max upload size
@@ -26,6 +46,109 @@ app.config['MAX_CONTENT_LENGTH'] = 1 * 1024 * 1024  # 1 MB max upload size
 MODEL_NAME = "llama3.1:8b"  # Exact model name as shown in ollama list
 TEMPERATURE = 0.7
 MAX_TOKENS = 3000  # Increased to generate much longer content
+SECTION_CONCURRENCY = int(os.environ.get("SOP_SECTION_CONCURRENCY", 4))  # Sections generated in parallel per SOP
+OLLAMA_HEALTH_TTL = float(os.environ.get("OLLAMA_HEALTH_TTL", 30))  # Seconds a health check result stays valid
+MIN_SECTION_WORDS = 10  # Shorter outputs are treated as failed generations
+
+# Tiered model routing: a section may name its own "model" in SOP_SECTION_PROMPTS (the short, formulaic
+# ones use SMALL_MODEL_NAME); sections fall back to MODEL_NAME when their model is on no host
+MODEL_ROUTING = os.environ.get("SOP_MODEL_ROUTING", "1") != "0"
+SMALL_MODEL_NAME = os.environ.get("SOP_SMALL_MODEL", "llama3.2:3b")  # Q4_K_M quantized by default in Ollama
+
+# Prompt -> completion cache shared by all worker processes
+COMPLETION_CACHE_ENABLED = os.environ.get("SOP_COMPLETION_CACHE", "1") != "0"
+COMPLETION_CACHE_PATH = os.environ.get("SOP_COMPLETION_CACHE_PATH", "data/completion_cache.db")
+COMPLETION_CACHE_MAX_ENTRIES = int(os.environ.get("SOP_COMPLETION_CACHE_MAX_ENTRIES", 5000))
+COMPLETION_CACHE_TTL = float(os.environ.get("SOP_COMPLETION_CACHE_TTL", 7 * 24 * 3600))
+
+# Background generation jobs
+JOB_WORKERS = int(os.environ.get("SOP_JOB_WORKERS", 2))  # SOPs generated at once per process
+JOB_MAX_PENDING = int(os.environ.get("SOP_JOB_MAX_PENDING", 20))
+JOB_RETENTION = float(os.environ.get("SOP_JOB_RETENTION", 3600))  # Seconds finished jobs stay queryable
+
+# num_predict calibration from observed tokens per word
+TOKEN_CALIBRATION_PATH = os.environ.get("SOP_TOKEN_CALIBRATION_PATH", "data/token_calibration.json")
+TOKEN_BUDGET_PERCENTILE = float(os.environ.get("SOP_TOKEN_BUDGET_PERCENTILE", 95))
+
+# Hybrid generation: fall back to sop_generator's template writer when Ollama is slow or failing
+HYBRID_GENERATION = os.environ.get("SOP_HYBRID_GENERATION", "1") != "0"
+# Wall-clock seconds an AI section may take in hybrid mode. A non-streaming call gets it as its read timeout
+# (Ollama sends nothing until it is done); a stream checks it between tokens. Either way the connection is
+# closed when it runs out, which makes Ollama stop generating
+SECTION_LATENCY_BUDGET = float(os.environ.get("SOP_SECTION_LATENCY_BUDGET", 60))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("OLLAMA_BREAKER_FAILURES", 3))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("OLLAMA_BREAKER_RESET", 30))
+
+# DOCX export: "fast" writes the XML directly, "python-docx" builds it through the docx object model
+DOCX_RENDERER = os.environ.get("SOP_DOCX_RENDERER", "fast")
+
+# PDF export through a pool of warm LibreOffice converters
+PDF_CONVERTERS = int(os.environ.get("SOP_PDF_CONVERTERS", 2))  # Long-lived soffice processes per worker
+PDF_CONVERT_TIMEOUT = float(os.environ.get("SOP_PDF_CONVERT_TIMEOUT", 60))
+PDF_QUEUE_TIMEOUT = float(os.environ.get("SOP_PDF_QUEUE_TIMEOUT", 30))  # Seconds to wait for a free converter
+
+# Rendered downloads keyed by content hash; the disk tier is shared by all workers when a directory is set
+EXPORT_CACHE_ENABLED = os.environ.get("SOP_EXPORT_CACHE", "1") != "0"
+EXPORT_CACHE_MAX_BYTES = int(float(os.environ.get("SOP_EXPORT_CACHE_MB", 64)) * 1024 * 1024)
+EXPORT_CACHE_DIR = os.environ.get("SOP_EXPORT_CACHE_DIR") or None
+EXPORT_CACHE_DISK_MAX_BYTES = int(float(os.environ.get("SOP_EXPORT_CACHE_DISK_MB", 512)) * 1024 * 1024)
+
+# Applicants and generated SOPs (SQLite, WAL); legacy JSON files can be imported with `python sop_store.py`
+SOP_STORE_PATH = os.environ.get("SOP_STORE_PATH", "data/sop_store.db")
+
+# Prompt layout: "shared_prefix" puts the persona and every applicant fact first and the short section
+# instruction last, so Ollama can reuse the prefilled prefix across the sections of one SOP;
+# "per_section" is the original section-first prompt with only that section's fields. With the completion
+# cache on, sections that depend only on the program (CACHE_SHARED_SECTIONS) keep the per_section prompt:
+# the shared prefix carries every applicant fact, so their cache entries would never match another applicant
+PROMPT_LAYOUT = os.environ.get("SOP_PROMPT_LAYOUT", "shared_prefix")
+PROMPT_CONTEXT_REUSE = os.environ.get("SOP_PROMPT_CONTEXT_REUSE", "0") == "1"  # Prefill the prefix once and pass Ollama's context
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")  # Keep the model (and its KV cache) loaded between requests
+
+# "per_section" makes one Ollama call per section; "single_call" asks for the whole SOP in one call
+# with section markers and regenerates only the sections that come back missing or malformed
+GENERATION_MODE = os.environ.get("SOP_GENERATION_MODE", "per_section")
+GENERATION_MODES = ("per_section", "single_call")
+SINGLE_CALL_MAX_CONTEXT = int(os.environ.get("SOP_SINGLE_CALL_MAX_CONTEXT", 8192))  # Upper bound on the single call's num_ctx
+
+# Prometheus metrics. Each worker process writes its values to METRICS_DIR/metrics_<pid>_<start>.json and
+# /metrics sums the files of live processes, so counts add up across gunicorn workers
+METRICS_DIR = os.environ.get("SOP_METRICS_DIR", "data/metrics")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("SOP_METRICS_FLUSH_INTERVAL", 5))
+
+# Admission control: at most ADMISSION_LIMIT SOPs generate at once (across all workers on the host
+# when ADMISSION_DIR is set), others wait in a bounded queue and get 429/503 with Retry-After.
+# The limit scales with the Ollama hosts in OLLAMA_HOSTS unless SOP_ADMISSION_LIMIT pins it
+ADMISSION_LIMIT_PER_HOST = int(os.environ.get("SOP_ADMISSION_LIMIT_PER_HOST", 2))
+ADMISSION_LIMIT = int(os.environ.get("SOP_ADMISSION_LIMIT", ADMISSION_LIMIT_PER_HOST * len(OLLAMA_HOSTS)))
+ADMISSION_MAX_QUEUE = int(os.environ.get("SOP_ADMISSION_MAX_QUEUE", 8))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("SOP_ADMISSION_QUEUE_TIMEOUT", 30))  # Seconds a request may wait for a slot
+ADMISSION_DIR = os.environ.get("SOP_ADMISSION_DIR", "data/admission") or None
+
+# Identical concurrent submissions share one generation (keyed on the normalized form, across workers
+# via COALESCE_DIR), and identical concurrent section prompts share one Ollama call
+COALESCE_ENABLED = os.environ.get("SOP_COALESCE", "1") != "0"
+COALESCE_DIR = os.environ.get("SOP_COALESCE_DIR", "data/coalesce") or None
+COALESCE_GRACE = float(os.environ.get("SOP_COALESCE_GRACE", 5))  # Seconds a finished SOP still answers duplicates
+
+# Model warm-up: load WARMUP_MODELS on every host at startup, then re-send keep_alive every
+# WARMUP_INTERVAL seconds during WARMUP_HOURS (e.g. "8-22", local time; empty means always)
+WARMUP_ENABLED = os.environ.get("SOP_WARMUP", "1") != "0"
+WARMUP_MODELS = [model.strip() for model in os.environ.get("SOP_WARMUP_MODELS", f"{MODEL_NAME},{SMALL_MODEL_NAME}" if MODEL_ROUTING else MODEL_NAME).split(",") if model.strip()]
+WARMUP_INTERVAL = float(os.environ.get("SOP_WARMUP_INTERVAL", 600))
+WARMUP_HOURS = os.environ.get("SOP_WARMUP_HOURS", "")
+WARMUP_LOCK_PATH = os.environ.get("SOP_WARMUP_LOCK", "data/model_warmup.lock") or None  # One warming process per machine
+COLD_START_THRESHOLD = float(os.environ.get("SOP_COLD_START_THRESHOLD", 2))  # Seconds of load_duration that count as a cold start
+
+# Request tracing: the last TRACE_BUFFER_SIZE traces are kept for /debug/traces, and every finished
+# trace is also appended to TRACE_EXPORT_PATH (JSONL) when set
+TRACE_BUFFER_SIZE = int(os.environ.get("SOP_TRACE_BUFFER", 200))
+TRACE_EXPORT_PATH = os.environ.get("SOP_TRACE_EXPORT_PATH") or None
+TRACE_EXCLUDED_PREFIXES = ("/metrics", "/debug/traces", "/static", "/jobs/")  # Polled endpoints that would flood the buffer
+
+# Token and timing counters kept from each Ollama generate response
+OLLAMA_STAT_FIELDS = ("eval_count", "prompt_eval_count", "eval_duration", "prompt_eval_duration",
+                      "load_duration", "total_duration", "done_reason")
 
 # Ensure directories exist
 os.makedirs("generated_sops", exist_ok=True)
@@ -34,16 +157,108 @@ os.makedirs('data', exist_ok=True)
 os.makedirs('templates', exist_ok=True)
 os.makedirs('static', exist_ok=True)
 
+completion_cache = CompletionCache(
+    COMPLETION_CACHE_PATH,
+    max_entries=COMPLETION_CACHE_MAX_ENTRIES,
+    ttl=COMPLETION_CACHE_TTL
+) if COMPLETION_CACHE_ENABLED else None
+
+job_manager = JobManager(max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, retention=JOB_RETENTION)
+
+# Ollama hosts from OLLAMA_HOSTS (default: OLLAMA_API_BASE), each behind its own circuit breaker
+ollama_pool = OllamaHostPool(failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT)
+
+pdf_converter = PdfConverterPool(
+    size=PDF_CONVERTERS,
+    convert_timeout=PDF_CONVERT_TIMEOUT,
+    queue_timeout=PDF_QUEUE_TIMEOUT
+)
+
+export_cache = ExportCache(
+    max_bytes=EXPORT_CACHE_MAX_BYTES,
+    disk_path=EXPORT_CACHE_DIR,
+    disk_max_bytes=EXPORT_CACHE_DISK_MAX_BYTES
+) if EXPORT_CACHE_ENABLED else None
+
+sop_store = SopStore(SOP_STORE_PATH)
+
+admission = AdmissionController(
+    limit=ADMISSION_LIMIT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    slot_dir=ADMISSION_DIR
+)
+
+sop_flights = SingleFlight(shared_dir=COALESCE_DIR, grace=COALESCE_GRACE,
+                           shareable=lambda result: result.get("success", False)) if COALESCE_ENABLED else None
+prompt_flights = SingleFlight() if COALESCE_ENABLED else None
+
+model_warmer = ModelWarmer(
+    ollama_pool,
+    WARMUP_MODELS,
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    interval=WARMUP_INTERVAL,
+    warm_hours=WARMUP_HOURS,
+    lock_path=WARMUP_LOCK_PATH,
+    cold_start_threshold=COLD_START_THRESHOLD
+)
+if WARMUP_ENABLED:
+    model_warmer.start()
+
+tracer = Tracer(max_traces=TRACE_BUFFER_SIZE, export_path=TRACE_EXPORT_PATH)
+
+metrics = MetricsRegistry(METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL)
+http_requests = metrics.counter("sop_http_requests_total", "HTTP requests by route, method and status")
+http_request_seconds = metrics.histogram(
+    "sop_http_request_duration_seconds", "Time to build the response (streamed bodies not included)", LATENCY_BUCKETS)
+section_seconds = metrics.histogram(
+    "sop_section_duration_seconds", "Wall time per generated SOP section", SECTION_LATENCY_BUCKETS)
+generation_seconds = metrics.histogram(
+    "sop_generation_duration_seconds", "Wall time per complete SOP", SECTION_LATENCY_BUCKETS)
+ollama_tokens_per_second = metrics.histogram(
+    "sop_ollama_tokens_per_second", "Ollama decode speed (eval_count / eval_duration)", TOKENS_PER_SECOND_BUCKETS)
+ollama_prompt_tokens = metrics.histogram(
+    "sop_ollama_prompt_tokens", "Prompt tokens evaluated per Ollama call", TOKEN_COUNT_BUCKETS)
+ollama_tokens = metrics.counter("sop_ollama_tokens_total", "Tokens processed by Ollama by kind (prompt, eval)")
+generation_errors = metrics.counter("sop_generation_errors_total", "Failed Ollama generations by kind")
+export_render_seconds = metrics.histogram(
+    "sop_export_render_seconds", "Time to render a download on a cache miss", LATENCY_BUCKETS)
+admission_wait_seconds = metrics.histogram(
+    "sop_admission_wait_seconds", "Time generations waited for an admission slot", SECTION_LATENCY_BUCKETS)
+ollama_call_seconds = metrics.histogram(
+    "sop_ollama_call_seconds", "Wall time of successful Ollama generate calls per host", SECTION_LATENCY_BUCKETS)
+coalesced_requests = metrics.counter("sop_coalesced_total", "Duplicate work avoided by sharing an in-flight result, by level")
+routed_section_seconds = metrics.histogram(
+    "sop_routed_section_seconds", "Ollama time per AI-written section by the model it was routed to", SECTION_LATENCY_BUCKETS)
+ollama_cold_starts = metrics.counter("sop_ollama_cold_starts_total", "User-facing Ollama calls that had to load the model")
+admission_rejections = metrics.counter("sop_admission_rejections_total", "Generations turned away by reason")
+
+# Per-mode running totals so responses can compare single-call and per-section generation
+generation_mode_stats = {}
+generation_mode_lock = threading.Lock()
+
+# Per (section, model) running totals of routed calls
+model_routing_stats = {}
+model_routing_lock = threading.Lock()
+
+token_calibration = TokenCalibrationStore(
+    TOKEN_CALIBRATION_PATH,
+    pct=TOKEN_BUDGET_PERCENTILE,
+    max_tokens=MAX_TOKENS
+)
+
 # Define section prompts with specific content requirements and exact word limits
 SOP_SECTION_PROMPTS = {
     "introduction": {
         "title": "Respected Sir/Ma'am",
         "word_limit": 54,
+        "model": SMALL_MODEL_NAME,
         "content": "Write a formal and respectful introduction paragraph for a Statement of Purpose. Address it to the admissions committee or visa officer. Mention the purpose of the letter (to apply for admission to the mentioned course at the mentioned university). Use sophisticated language but keep it EXACTLY 54 words. No more, no less."
     },
     "academic_background": {
         "title": "Academic Background",
         "word_limit": 71,
+        "model": SMALL_MODEL_NAME,
         "content": "Write about the educational background, starting from 10th grade to the highest level of education completed. Include details about board/university, percentages/CGPA, and years of completion. Keep it EXACTLY 71 words. No more, no less."
     },
     "language_proficiency": {
@@ -74,15 +289,36 @@ SOP_SECTION_PROMPTS = {
     "conclusion": {
         "title": "Conclusion",
         "word_limit": 70,
+        "model": SMALL_MODEL_NAME,
         "content": "Provide a concise conclusion summarizing the key points of the SOP. Express gratitude for considering the application, and mention enthusiasm for joining the program. End with formal closing. Keep it EXACTLY 70 words. No more, no less."
     }
 }
 
 def check_ollama_status():
-    """Check if Ollama is running and if the required model is available using direct REST API"""
+    """Probe every Ollama host and report whether any of them can serve the model"""
+    statuses = ollama_pool.probe(probe_ollama_host)
+    if len(statuses) == 1:
+        return next(iter(statuses.values()))
+    
+    running = [status for status in statuses.values() if status["ollama_running"]]
+    serving = [status for status in running if status["model_available"]]
+    status = {
+        "ollama_running": bool(running),
+        "model_available": bool(serving),
+        "models": sorted({name for host_status in running for name in host_status["models"]}),
+        "exact_match": any(host_status["exact_match"] for host_status in running),
+        "flexible_match": any(host_status["flexible_match"] for host_status in running),
+        "hosts_serving": f"{len(serving)}/{len(statuses)}"
+    }
+    if not running:
+        status["error"] = "; ".join(f"{url}: {host_status.get('error')}" for url, host_status in statuses.items())
+    return status
+
+def probe_ollama_host(host):
+    """Check if one Ollama host is running and if the required model is available using direct REST API"""
     try:
         # Try to list models using REST API
-        response = requests.get(OLLAMA_LIST_ENDPOINT, timeout=5)
+        response = host.client.get(OLLAMA_LIST_ENDPOINT, read_timeout=5)
         
         if response.status_code == 200:
             data = response.json()
@@ -102,24 +338,22 @@ def check_ollama_status():
                         if 'name' in model:
                             model_names.append(model['name'])
             
-            print(f"Available models from API: {model_names}")
-            print(f"Looking for model: '{MODEL_NAME}'")
-            
             # Check if our model is available
             exact_match = MODEL_NAME in model_names
             flexible_match = any(MODEL_NAME in model_name for model_name in model_names)
             
-            print(f"Exact match: {exact_match}, Flexible match: {flexible_match}")
+            print(f"Ollama health check ({host.base_url}): {len(model_names)} models, '{MODEL_NAME}' available: {exact_match or flexible_match}")
             
             return {
                 "ollama_running": True,
                 "model_available": exact_match or flexible_match,
                 "models": model_names,
+                "loaded_models": loaded_ollama_models(host),
                 "exact_match": exact_match,
                 "flexible_match": flexible_match
             }
         else:
-            print(f"Ollama API returned status code {response.status_code}")
+            print(f"Ollama API at {host.base_url} returned status code {response.status_code}")
             return {
                 "ollama_running": False,
                 "model_available": False,
@@ -127,7 +361,7 @@ def check_ollama_status():
             }
             
     except requests.exceptions.RequestException as e:
-        print(f"Failed to connect to Ollama API: {str(e)}")
+        print(f"Failed to connect to Ollama API at {host.base_url}: {str(e)}")
         traceback.print_exc()
         return {
             "ollama_running": False,
@@ -135,8 +369,93 @@ def check_ollama_status():
             "error": f"Failed to connect to Ollama API: {str(e)}"
         }
 
-def generate_with_ollama_api(model, prompt, temperature=0.7, max_tokens=1000):
-    """Generate text using Ollama REST API directly"""
+def loaded_ollama_models(host):
+    """Names of the models a host has in memory right now (empty if its Ollama has no /api/ps)"""
+    try:
+        response = host.client.get(OLLAMA_PS_ENDPOINT, read_timeout=5)
+        if response.status_code == 200:
+            return [str(model.get('name', '')) for model in response.json().get('models', [])]
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Could not list loaded models on {host.base_url}: {str(e)}")
+    return []
+
+# Last known Ollama state, refreshed in the background instead of once per section
+health_monitor = OllamaHealthMonitor(check_ollama_status, ttl=OLLAMA_HEALTH_TTL)
+
+def record_ollama_usage(model, result):
+    """Feed one finished Ollama response's token counters into the metrics"""
+    prompt_tokens = result.get("prompt_eval_count")
+    eval_tokens = result.get("eval_count")
+    if result.get("load_duration") and model_warmer.record_load(model, result.get("host"), result["load_duration"] / 1e9):
+        ollama_cold_starts.inc(model=model)
+    if prompt_tokens is not None:
+        ollama_prompt_tokens.observe(prompt_tokens, model=model)
+        ollama_tokens.inc(prompt_tokens, model=model, kind="prompt")
+    if eval_tokens is not None:
+        ollama_tokens.inc(eval_tokens, model=model, kind="eval")
+        if result.get("eval_duration"):
+            ollama_tokens_per_second.observe(eval_tokens / (result["eval_duration"] / 1e9), model=model)
+
+def stream_error_kind(error):
+    """Error kind label for an exception raised while streaming from Ollama"""
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "connection"
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(error, requests.exceptions.RequestException):
+        return "request"
+    return "stream"
+
+def ollama_status():
+    """Cached Ollama status, recorded as a span of the active trace"""
+    with tracer.span("health_check") as span:
+        status = health_monitor.get_status()
+        if span:
+            span.set(ollama_running=status["ollama_running"], model_available=status["model_available"])
+        return status
+
+def generate_with_ollama_api_detailed(model, prompt, temperature=0.7, max_tokens=1000, read_timeout=None,
+                                      context=None, cache_prompt=None, num_ctx=None):
+    """Generate text using Ollama REST API directly, keeping Ollama's token and timing counters
+    
+    With context (from prime_prompt_context), prompt is only the part after the primed prefix and
+    cache_prompt is the full prompt the completion cache is keyed on. num_ctx overrides the model's
+    context window for prompts that would not fit Ollama's default.
+    """
+    with tracer.span("ollama.generate", model=model, num_predict=max_tokens) as span:
+        args = (model, prompt, temperature, max_tokens, read_timeout, context, cache_prompt, num_ctx)
+        if prompt_flights is None:
+            details = request_ollama_generate(*args)
+        else:
+            # Identical prompts in flight at the same time wait for one call; everyone gets their own copy
+            key = CompletionCache.make_key(model, cache_prompt or prompt, temperature, max_tokens)
+            shared_details, coalesced = prompt_flights.do(key, request_ollama_generate, *args)
+            details = dict(shared_details, coalesced=coalesced)
+            if coalesced:
+                coalesced_requests.inc(level="section")
+        if span:
+            span.set(**{field: details.get(field) for field in ("host", "cached", "coalesced", "error", "prompt_eval_count", "eval_count")})
+        return details
+
+def request_ollama_generate(model, prompt, temperature, max_tokens, read_timeout, context, cache_prompt, num_ctx=None):
+    """Completion cache lookup, then one non-streaming /api/generate call on the least busy healthy host"""
+    cache_key = None
+    if completion_cache is not None:
+        cache_key = CompletionCache.make_key(model, cache_prompt or prompt, temperature, max_tokens)
+        cached = completion_cache.get(cache_key)
+        if cached is not None:
+            print(f"Completion cache hit for model: {model}")
+            return {"text": cached, "cached": True}
+    
+    host = ollama_pool.acquire(model)
+    if host is None:
+        generation_errors.inc(kind="circuit_open")
+        return {"text": "Error: Ollama circuit breaker is open, backend recently failing", "error": "circuit_open"}
+    
+    call_start = time.time()
+    success = False
+    host_failure = False  # Only connection failures, timeouts and 5xx count against the host
+    responded = False
     try:
         payload = {
             "model": model,
@@ -145,70 +464,453 @@ def generate_with_ollama_api(model, prompt, temperature=0.7, max_tokens=1000):
                 "temperature": temperature,
                 "num_predict": max_tokens
             },
+            "keep_alive": OLLAMA_KEEP_ALIVE,
             "stream": False
         }
+        if context:
+            payload["context"] = context
+        if num_ctx:
+            payload["options"]["num_ctx"] = num_ctx
         
-        print(f"Sending request to Ollama API with model: {model}")
-        response = requests.post(OLLAMA_GENERATE_ENDPOINT, json=payload, timeout=120)
+        print(f"Sending request to Ollama API at {host.base_url} with model: {model}")
+        response = host.client.post(OLLAMA_GENERATE_ENDPOINT, payload, read_timeout=read_timeout)
+        responded = True
+        host_failure = response.status_code >= 500
         
         if response.status_code == 200:
             result = response.json()
-            return result.get('response', '')
+            success = True
+            generated_text = result.get('response', '')
+            # An output cut off at num_predict is never worth serving again
+            if (cache_key is not None and len(generated_text.split()) >= MIN_SECTION_WORDS
+                    and result.get('done_reason') != "length"):
+                completion_cache.set(cache_key, model, generated_text)
+            details = {field: result.get(field) for field in OLLAMA_STAT_FIELDS}
+            details.update(text=generated_text, cached=False, host=host.base_url)
+            record_ollama_usage(model, details)
+            return details
         else:
             print(f"Ollama API error: {response.status_code}, {response.text}")
-            return f"Error: Ollama API returned status code {response.status_code}"
+            generation_errors.inc(kind="status")
+            return {"text": f"Error: Ollama API returned status code {response.status_code}", "error": "status"}
             
+    except requests.exceptions.ConnectionError as e:
+        print(f"Connection to Ollama API at {host.base_url} failed: {str(e)}")
+        host_failure = True
+        health_monitor.invalidate(reason=str(e))
+        generation_errors.inc(kind="connection")
+        return {"text": f"Error: Failed to communicate with Ollama API - {str(e)}", "error": "connection"}
+    except requests.exceptions.Timeout as e:
+        print(f"Request to Ollama API at {host.base_url} timed out: {str(e)}")
+        host_failure = True
+        generation_errors.inc(kind="timeout")
+        return {"text": f"Error: Ollama API timed out - {str(e)}", "error": "timeout"}
     except requests.exceptions.RequestException as e:
         print(f"Request to Ollama API failed: {str(e)}")
         traceback.print_exc()
-        return f"Error: Failed to communicate with Ollama API - {str(e)}"
+        generation_errors.inc(kind="request")
+        return {"text": f"Error: Failed to communicate with Ollama API - {str(e)}", "error": "request"}
+    finally:
+        release_ollama_host(host, success, time.time() - call_start, model, host_failure, responded)
 
-def generate_section_with_ollama(section_key, user_data):
-    """Generate a section of the SOP using Ollama API"""
-    section_info = SOP_SECTION_PROMPTS[section_key]
-    prompt = prepare_prompt(section_key, section_info, user_data)
+def release_ollama_host(host, success, latency, model, host_failure, responded):
+    ollama_pool.release(host, success, latency, model, count_failure=host_failure, responded=responded)
+    if success:
+        ollama_call_seconds.observe(latency, host=host.base_url)
+
+def generate_with_ollama_api(model, prompt, temperature=0.7, max_tokens=1000):
+    """Generate text using Ollama REST API directly"""
+    return generate_with_ollama_api_detailed(model, prompt, temperature, max_tokens)["text"]
+
+def stream_with_ollama_api(model, prompt, temperature=0.7, max_tokens=1000, read_timeout=None,
+                           context=None, cache_prompt=None, deadline=None):
+    """Generate text using Ollama's streaming mode, yielding each JSON chunk as it arrives.
+    read_timeout bounds a stall between chunks; deadline (a time.time() value) bounds the whole stream."""
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "options": {
+            "temperature": temperature,
+            "num_predict": max_tokens
+        },
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "stream": True
+    }
+    if context:
+        payload["context"] = context
+    
+    cache_key = None
+    if completion_cache is not None:
+        cache_key = CompletionCache.make_key(model, cache_prompt or prompt, temperature, max_tokens)
+        cached = completion_cache.get(cache_key)
+        if cached is not None:
+            yield {"response": cached, "done": True, "cached": True}
+            return
+    
+    host = ollama_pool.acquire(model)
+    if host is None:
+        raise Exception("Ollama circuit breaker is open, backend recently failing")
     
+    call_start = time.time()
+    success = False
+    host_failure = False
+    responded = False
+    try:
+        try:
+            response = host.client.post(OLLAMA_GENERATE_ENDPOINT, payload, read_timeout=read_timeout, stream=True)
+        except requests.exceptions.ConnectionError as e:
+            health_monitor.invalidate(reason=str(e))
+            raise
+        responded = True
+        
+        try:
+            if response.status_code != 200:
+                host_failure = response.status_code >= 500
+                raise Exception(f"Ollama API returned status code {response.status_code}")
+            
+            chunks = []
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise Exception(chunk['error'])
+                if deadline is not None and not chunk.get('done') and time.time() > deadline:
+                    raise requests.exceptions.Timeout("Ollama stream ran past its deadline")
+                chunks.append(chunk.get('response', ''))
+                if chunk.get('done'):
+                    success = True
+                    chunk["host"] = host.base_url
+                    record_ollama_usage(model, chunk)
+                    generated_text = "".join(chunks)
+                    if (cache_key is not None and len(generated_text.split()) >= MIN_SECTION_WORDS
+                            and chunk.get('done_reason') != "length"):
+                        completion_cache.set(cache_key, model, generated_text)
+                yield chunk
+                if success:
+                    break
+        finally:
+            response.close()
+    except requests.exceptions.RequestException:
+        host_failure = True
+        raise
+    finally:
+        release_ollama_host(host, success, time.time() - call_start, model, host_failure, responded)
+
+def prime_prompt_context(prefix):
+    """Prefill the shared prompt prefix once and return Ollama's context for it (None if unavailable)"""
+    host = ollama_pool.acquire(MODEL_NAME)
+    if host is None:
+        return None
+    success = False
+    responded = False
+    try:
+        payload = {
+            "model": MODEL_NAME,
+            "prompt": prefix,
+            "options": {"temperature": TEMPERATURE, "num_predict": 1},  # 0 would mean unlimited
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "stream": False
+        }
+        response = host.client.post(OLLAMA_GENERATE_ENDPOINT, payload)
+        responded = True
+        if response.status_code != 200:
+            print(f"Could not prime prompt context: status {response.status_code}")
+            return None
+        result = response.json()
+        success = True
+        print(f"Primed shared prompt prefix ({result.get('prompt_eval_count')} tokens)")
+        return result.get("context")
+    except requests.exceptions.RequestException as e:
+        print(f"Could not prime prompt context: {str(e)}")
+        return None
+    finally:
+        # A one-token call says nothing about latency, and priming failures never eject a host (nor, when
+        # the host never answered, re-admit it)
+        ollama_pool.release(host, success, model=MODEL_NAME, count_failure=False, responded=responded)
+
+def shared_prompt_context(user_data):
+    """Context to pass with each section when context reuse is enabled for the shared-prefix layout"""
+    if not PROMPT_CONTEXT_REUSE or PROMPT_LAYOUT != "shared_prefix":
+        return None
+    with tracer.span("prime_context"):
+        return prime_prompt_context(build_shared_prefix(user_data))
+
+def default_token_budget(section_key):
+    """Return the uncalibrated num_predict budget for a section"""
     # Calculate tokens based on target word count (approximately 1.5 tokens per word)
     # Ensure we have enough tokens for the response (at least 2x the word limit)
-    section_tokens = max(section_info['word_limit'] * 2, 1000)
+    return max(SOP_SECTION_PROMPTS[section_key]['word_limit'] * 2, 1000)
+
+def section_token_budget(section_key, model=MODEL_NAME):
+    """Return the num_predict budget for a section, learned from past token usage once calibrated"""
+    word_limit = SOP_SECTION_PROMPTS[section_key]['word_limit']
+    return token_calibration.budget(section_key, model, word_limit, default_token_budget(section_key))
+
+def route_section_model(section_key, status):
+    """Return (model, fallback_reason) for a section: its configured model if some host has it, else MODEL_NAME"""
+    model = SOP_SECTION_PROMPTS[section_key].get("model", MODEL_NAME)
+    if not MODEL_ROUTING or model == MODEL_NAME:
+        return MODEL_NAME, None
+    if not any(model in name for name in status.get("models", [])):
+        return MODEL_NAME, "model_missing"
+    return model, None
+
+def record_model_routing(section_key, model, seconds, details, success, fallback_reason=None):
+    """Count one routed section call; cached and coalesced results cost no inference and are only counted"""
+    reused = bool(details.get("cached") or details.get("coalesced"))
+    with model_routing_lock:
+        totals = model_routing_stats.setdefault((section_key, model), {
+            "calls": 0, "failures": 0, "fallbacks": 0, "reused": 0, "seconds": 0.0,
+            "prompt_eval_count": 0, "eval_count": 0, "eval_duration": 0
+        })
+        totals["calls"] += 1
+        totals["failures"] += 0 if success else 1
+        totals["fallbacks"] += 1 if fallback_reason else 0
+        if reused:
+            totals["reused"] += 1
+        else:
+            totals["seconds"] += seconds
+            for field in ("prompt_eval_count", "eval_count", "eval_duration"):
+                totals[field] += details.get(field) or 0
+    if not reused:
+        routed_section_seconds.observe(seconds, section=section_key, model=model)
+
+def model_routing_summary():
+    """Average latency and tokens per routed section call, per section and model, seen by this worker"""
+    with model_routing_lock:
+        items = [(key, dict(totals)) for key, totals in model_routing_stats.items()]
+    sections = {}
+    inference_seconds = {}
+    for (section_key, model), totals in items:
+        computed = totals["calls"] - totals["reused"]
+        sections.setdefault(section_key, {})[model] = {
+            "calls": totals["calls"],
+            "failures": totals["failures"],
+            "fallbacks": totals["fallbacks"],
+            "reused": totals["reused"],
+            "avg_seconds": round(totals["seconds"] / computed, 2) if computed else None,
+            "avg_prompt_eval_count": round(totals["prompt_eval_count"] / computed, 1) if computed else None,
+            "avg_eval_count": round(totals["eval_count"] / computed, 1) if computed else None,
+            "tokens_per_second": round(totals["eval_count"] / (totals["eval_duration"] / 1e9), 1) if totals["eval_duration"] else None
+        }
+        inference_seconds[model] = round(inference_seconds.get(model, 0.0) + totals["seconds"], 2)
+    return {"sections": sections, "inference_seconds": inference_seconds}
+
+def generate_section_ai(section_key, user_data, read_timeout=None, context=None):
+    """Generate a section of the SOP using Ollama API, returning the content with token usage"""
+    section_info = SOP_SECTION_PROMPTS[section_key]
+    prompt = prepare_prompt(section_key, section_info, user_data)
+    stats = {}
     
     try:
-        # Check if model is available first
-        status = check_ollama_status()
+        # Check if model is available first (cached, refreshed in the background)
+        status = ollama_status()
         if not status["ollama_running"]:
-            return f"Error: Ollama service is not running. Please start Ollama and try again."
-        if not status["model_available"]:
-            return f"Error: Model '{MODEL_NAME}' not found. Please install it using: ollama pull {MODEL_NAME}"
+            stats["error"] = "ollama_down"
+            generation_errors.inc(kind="ollama_down")
+            return {"content": f"Error: Ollama service is not running. Please start Ollama and try again.", "success": False, "stats": stats}
+        model, fallback_reason = route_section_model(section_key, status)
+        stats["model"] = model
+        if fallback_reason:
+            stats["routing_fallback"] = fallback_reason
+        if model == MODEL_NAME and not status["model_available"]:
+            stats["error"] = "model_missing"
+            generation_errors.inc(kind="model_missing")
+            return {"content": f"Error: Model '{MODEL_NAME}' not found. Please install it using: ollama pull {MODEL_NAME}", "success": False, "stats": stats}
+        if model != MODEL_NAME or section_prompt_layout(section_key) != "shared_prefix":
+            context = None  # The primed context holds MODEL_NAME's tokens of the shared prefix
         
-        print(f"Generating section '{section_key}' with model: {MODEL_NAME}")
+        section_tokens = section_token_budget(section_key, model)
+        stats["num_predict"] = section_tokens
+        print(f"Generating section '{section_key}' with model: {model}")
         print(f"Target word count: {section_info['word_limit']}, Tokens: {section_tokens}")
         
-        # Call Ollama API directly with section-specific token limit
-        generated_text = generate_with_ollama_api(
-            model=MODEL_NAME,
-            prompt=prompt,
-            temperature=TEMPERATURE,
-            max_tokens=section_tokens
-        )
+        # Call Ollama API directly with section-specific token limit. With a primed context only the
+        # section instruction is sent; the completion cache still keys on the full prompt
+        def generate(max_tokens, timeout=read_timeout):
+            return generate_with_ollama_api_detailed(
+                model=model,
+                prompt=section_instruction(section_info) if context else prompt,
+                temperature=TEMPERATURE,
+                max_tokens=max_tokens,
+                read_timeout=timeout,
+                context=context,
+                cache_prompt=prompt
+            )
+        
+        call_start = time.time()
+        try:
+            details = generate(section_tokens)
+            # The retry shares the section's latency budget rather than getting a fresh one
+            remaining = read_timeout - (time.time() - call_start) if read_timeout else None
+            if (details.get("done_reason") == "length" and section_tokens < MAX_TOKENS
+                    and (remaining is None or remaining > 1)):
+                # Cut off at num_predict: retry once with room to finish instead of keeping half a sentence
+                section_tokens = min(section_tokens * 2, MAX_TOKENS)
+                print(f"Section '{section_key}' hit its token budget, retrying with {section_tokens} tokens")
+                stats.update(num_predict=section_tokens, truncated_retry=True)
+                details = generate(section_tokens, remaining)
+        except Exception:
+            record_model_routing(section_key, model, time.time() - call_start, {}, False, fallback_reason)
+            raise
+        generated_text = details.pop("text")
+        stats.update(details)
+        success = bool(generated_text) and "Error:" not in generated_text
+        truncated = details.get("done_reason") == "length"
+        record_model_routing(section_key, model, time.time() - call_start, details,
+                             success and not truncated and len(generated_text.split()) >= MIN_SECTION_WORDS,
+                             fallback_reason)
         
-        if not generated_text or "Error:" in generated_text:
-            return f"Error generating {section_info['title']}: {generated_text}"
+        if not success:
+            return {"content": f"Error generating {section_info['title']}: {generated_text}", "success": False, "stats": stats}
             
         # Validate the generated content
         word_count = len(generated_text.split())
+        stats["word_count"] = word_count
         print(f"Generated {word_count} words for section: {section_key}")
         
-        if word_count < 10:
+        if word_count < MIN_SECTION_WORDS:
+            stats["error"] = "short_output"
+            generation_errors.inc(kind="short_output")
             raise Exception(f"Generated content for {section_key} is too short")
+        
+        if truncated:
+            stats["error"] = "truncated"
+            generation_errors.inc(kind="truncated")
+            raise Exception(f"Generated content for {section_key} was cut off at {section_tokens} tokens")
+        
+        if not details.get("cached"):
+            token_calibration.record(section_key, model, details.get("eval_count"), word_count)
             
-        return generated_text.strip()
+        return {"content": generated_text.strip(), "success": True, "stats": stats}
     except Exception as e:
         print(f"Error generating {section_key}: {str(e)}")
         traceback.print_exc()
-        return f"Error generating {section_info['title']}: {str(e)}"
+        return {"content": f"Error generating {section_info['title']}: {str(e)}", "success": False, "stats": stats}
+
+# Template writers from sop_generator used when a section cannot be AI-written in time
+TEMPLATE_SECTION_GENERATORS = {
+    "introduction": sop_generator.generate_introduction,
+    "academic_background": sop_generator.generate_academic_background,
+    "language_proficiency": sop_generator.generate_language_proficiency,
+    "financial_background": sop_generator.generate_financial_background,
+    "why_country": sop_generator.generate_country_choice,
+    "career_opportunities": sop_generator.generate_career_opportunities,
+    "family_ties": sop_generator.generate_family_ties,
+    "conclusion": sop_generator.generate_conclusion
+}
+
+# The web form and sop_generator name the school-board fields differently
+TEMPLATE_FIELD_ALIASES = {
+    "tenth_board": "10th_board",
+    "tenth_marks": "10th_marks",
+    "tenth_year": "10th_year",
+    "twelfth_board": "12th_board",
+    "twelfth_marks": "12th_marks",
+    "twelfth_year": "12th_year"
+}
+
+def generate_section_from_template(section_key, user_data):
+    """Write a section with the deterministic sop_generator template"""
+    template_data = dict(user_data)
+    for form_key, template_key in TEMPLATE_FIELD_ALIASES.items():
+        template_data.setdefault(template_key, user_data.get(form_key, ""))
+    if not template_data.get("address") and user_data.get("state"):
+        template_data["address"] = f"{user_data['state']}, India"
+    
+    content = TEMPLATE_SECTION_GENERATORS[section_key](template_data)
+    
+    # The section title already carries the salutation
+    salutation = "Respected Sir/Ma'am,"
+    if content.startswith(salutation):
+        content = content[len(salutation):].strip()
+    return content
+
+def section_latency_budget(section_key):
+    return SOP_SECTION_PROMPTS[section_key].get("latency_budget", SECTION_LATENCY_BUDGET)
+
+def generate_section_detailed(section_key, user_data, hybrid=None, context=None):
+    """Generate a section with Ollama, falling back to the template writer in hybrid mode"""
+    hybrid = HYBRID_GENERATION if hybrid is None else hybrid
+    
+    if hybrid and ollama_pool.state == CircuitBreaker.OPEN:
+        result = {"success": False, "stats": {"error": "circuit_open"}}
+    else:
+        read_timeout = section_latency_budget(section_key) if hybrid else None
+        result = generate_section_ai(section_key, user_data, read_timeout=read_timeout, context=context)
+        result["source"] = "ai"
+    
+    if hybrid and not result["success"]:
+        reason = result["stats"].get("error") or "generation_failed"
+        print(f"Falling back to template for section '{section_key}' ({reason})")
+        result["stats"]["fallback_reason"] = reason
+        result.update(content=generate_section_from_template(section_key, user_data), success=True, source="template")
+    
+    return result
+
+def generate_section_with_ollama(section_key, user_data):
+    """Generate a section of the SOP using Ollama API"""
+    return generate_section_detailed(section_key, user_data)["content"]
+
+# Applicant fields each section's content depends on
+SECTION_FIELD_DEPENDENCIES = {
+    "introduction": ["name", "university_name", "course", "country"],
+    "academic_background": ["name", "state", "tenth_board", "tenth_marks", "tenth_year", 
+                          "twelfth_board", "twelfth_marks", "twelfth_year",
+                          "bachelors_degree", "bachelors_college", "bachelors_cgpa"],
+    "language_proficiency": ["test_type", "listening", "reading", "writing", "speaking", "overall"],
+    "financial_background": ["father_income", "mother_income", "father_funds", "mother_funds", "fixed_deposits"],
+    "why_country": ["country", "university_name", "course"],
+    "career_opportunities": ["course", "country"],
+    "family_ties": ["state", "family_members"],
+    "conclusion": ["name", "university_name", "course", "country"]
+}
+
+# Sections whose text depends only on course/country/university, so their completions are reusable across applicants
+CACHE_SHARED_SECTIONS = [section_key for section_key, fields in SECTION_FIELD_DEPENDENCIES.items()
+                         if set(fields) <= {"course", "country", "university_name"}]
+
+# Stable order of applicant facts in the shared prefix; other form fields follow alphabetically
+PROMPT_FIELD_ORDER = list(dict.fromkeys(
+    field for fields in SECTION_FIELD_DEPENDENCIES.values() for field in fields
+))
+
+SHARED_PREFIX_PERSONA = """You are an expert Statement of Purpose (SOP) writer. You write one section of an applicant's Statement of Purpose at a time, using the applicant information below.
+
+Style: Formal, clear, and professional. Use first-person perspective.
+Format: No headings, titles, or prefixes. Just write the content of the section.
+"""
+
+def format_prompt_field(field, value):
+    return f"- {field.replace('_', ' ').title()}: {value}\n"
+
+def build_shared_prefix(user_data):
+    """Persona plus every applicant fact; identical for all sections of one SOP"""
+    fields = [field for field in PROMPT_FIELD_ORDER if user_data.get(field)]
+    fields += sorted(field for field in user_data if field not in PROMPT_FIELD_ORDER and user_data.get(field))
+    facts = "".join(format_prompt_field(field, user_data[field]) for field in fields)
+    return f"{SHARED_PREFIX_PERSONA}\nApplicant Information:\n{facts}"
+
+def section_instruction(section_info):
+    """The short, section-specific tail that follows the shared prefix"""
+    return f"""
+Section: {section_info['title']}
+Requirements:
+{section_info['content']}
+
+Write the {section_info['title']} section now, in EXACTLY {section_info['word_limit']} words:"""
+
+def section_prompt_layout(section_key):
+    """Prompt layout for a section: PROMPT_LAYOUT, except per_section for cache-shared sections when the cache is on"""
+    if COMPLETION_CACHE_ENABLED and section_key in CACHE_SHARED_SECTIONS:
+        return "per_section"
+    return PROMPT_LAYOUT
 
-def prepare_prompt(section_key, section_info, user_data):
+def prepare_prompt(section_key, section_info, user_data, layout=None):
     """Prepare a prompt for the section with user data"""
+    if (layout or section_prompt_layout(section_key)) == "shared_prefix":
+        return build_shared_prefix(user_data) + section_instruction(section_info)
     
     system_prompt = f"""You are an expert Statement of Purpose (SOP) writer. Write a {section_info['title']} section for a Statement of Purpose with EXACTLY {section_info['word_limit']} words. Not one word more or less.
 
@@ -225,90 +927,610 @@ IMPORTANT: Your response must be EXACTLY {section_info['word_limit']} words. Cou
     # Add user data to make it personalized
     user_prompt = "\nUser Information:\n"
     
-    relevant_fields = {
-        "introduction": ["name", "university_name", "course", "country"],
-        "academic_background": ["name", "state", "tenth_board", "tenth_marks", "tenth_year", 
-                              "twelfth_board", "twelfth_marks", "twelfth_year",
-                              "bachelors_degree", "bachelors_college", "bachelors_cgpa"],
-        "language_proficiency": ["test_type", "listening", "reading", "writing", "speaking", "overall"],
-        "financial_background": ["father_income", "mother_income", "father_funds", "mother_funds", "fixed_deposits"],
-        "why_country": ["country", "university_name", "course"],
-        "career_opportunities": ["course", "country"],
-        "family_ties": ["state", "family_members"],
-        "conclusion": ["name", "university_name", "course", "country"]
-    }
-    
-    for field in relevant_fields.get(section_key, []):
+    for field in SECTION_FIELD_DEPENDENCIES.get(section_key, []):
         if field in user_data and user_data[field]:
-            field_name = field.replace('_', ' ').title()
-            user_prompt += f"- {field_name}: {user_data[field]}\n"
+            user_prompt += format_prompt_field(field, user_data[field])
     
     complete_prompt = f"{system_prompt}\n{user_prompt}\nWrite the {section_info['title']} section with EXACTLY {section_info['word_limit']} words:"
     return complete_prompt
 
-def generate_complete_sop(user_data):
+def generate_section_timed(section_key, user_data, context=None):
+    """Generate a section and measure how long it took"""
+    section_start = time.time()
+    try:
+        with tracer.span("section", section=section_key) as span:
+            result = generate_section_detailed(section_key, user_data, context=context)
+            if span:
+                span.set(source=result.get("source"), success=result["success"],
+                         fallback_reason=result["stats"].get("fallback_reason"))
+    except Exception as e:
+        print(f"Unexpected failure in section {section_key}: {str(e)}")
+        traceback.print_exc()
+        result = {
+            "content": f"Error generating {SOP_SECTION_PROMPTS[section_key]['title']}: {str(e)}",
+            "success": False,
+            "stats": {}
+        }
+    
+    result["time"] = round(time.time() - section_start, 2)
+    section_seconds.observe(time.time() - section_start, section=section_key, source=result.get("source", "error"))
+    return result
+
+def generate_sections_concurrently(user_data, max_workers=None, progress_callback=None, section_keys=None):
+    """Generate SOP sections (all of them by default) in parallel and return results keyed by section"""
+    max_workers = max(1, max_workers or SECTION_CONCURRENCY)
+    section_keys = list(section_keys or SOP_SECTION_PROMPTS.keys())
+    results = {}
+    
+    if progress_callback:
+        for section_key in section_keys:
+            progress_callback(section_key, {"status": "pending"})
+    
+    context = shared_prompt_context(user_data)
+    
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sop-section") as executor:
+        futures = {
+            executor.submit(tracer.wrap(generate_section_timed), section_key, user_data, context): section_key
+            for section_key in section_keys
+        }
+        for future in as_completed(futures):
+            section_key = futures[future]
+            results[section_key] = future.result()
+            print(f"Section '{section_key}' finished in {results[section_key]['time']}s")
+            if progress_callback:
+                progress_callback(section_key, {
+                    "status": "done",
+                    "success": results[section_key]["success"],
+                    "time": results[section_key]["time"]
+                })
+    
+    return results
+
+# Marker lines the single-call prompt asks for; tolerant of markdown decoration and spacing
+SECTION_MARKER = re.compile(r'^[#*\s]*=+\s*SECTION\s*:\s*([A-Za-z_ ]+?)\s*=+[*\s]*$', re.IGNORECASE | re.MULTILINE)
+END_MARKER = re.compile(r'^[#*\s]*=+\s*END\s*=+[*\s]*$', re.IGNORECASE | re.MULTILINE)
+
+def single_call_instruction():
+    """Tail of the single-call prompt: every section's requirements and the marker format to answer in"""
+    requirements = "".join(
+        f"{index}. {section_key} ({section_info['title']}, EXACTLY {section_info['word_limit']} words): {section_info['content']}\n"
+        for index, (section_key, section_info) in enumerate(SOP_SECTION_PROMPTS.items(), 1)
+    )
+    markers = "".join(f"=== SECTION: {section_key} ===\n<section text>\n" for section_key in SOP_SECTION_PROMPTS)
+    return f"""
+Write the complete Statement of Purpose in one response, as these {len(SOP_SECTION_PROMPTS)} sections in this order:
+{requirements}
+Output format: start every section with its marker line exactly as shown, on a line of its own, and finish with the END marker. Write nothing before the first marker and no headings inside sections.
+
+{markers}=== END ==="""
+
+def parse_marked_sections(text):
+    """Split a single-call response into {section_key: content} using its marker lines"""
+    end = END_MARKER.search(text)
+    if end:
+        text = text[:end.start()]
+    
+    markers = list(SECTION_MARKER.finditer(text))
+    sections = {}
+    for index, marker in enumerate(markers):
+        section_key = "_".join(marker.group(1).lower().split())
+        body_end = markers[index + 1].start() if index + 1 < len(markers) else len(text)
+        content = text[marker.end():body_end].strip()
+        if section_key not in SOP_SECTION_PROMPTS or section_key in sections or not content:
+            continue
+        
+        # Drop a repeated section title on the first line
+        first_line, _, rest = content.partition("\n")
+        if first_line.strip(" *#:").lower() == SOP_SECTION_PROMPTS[section_key]["title"].lower():
+            content = rest.strip()
+        sections[section_key] = content
+    return sections
+
+def single_call_context_size(prompt, num_predict):
+    """num_ctx that holds the prompt and the whole answer, so Ollama never shifts the persona and facts out"""
+    prompt_tokens = len(prompt) // 3  # Conservative: English prose runs about 4 characters per token
+    return min(math.ceil((prompt_tokens + num_predict) / 1024) * 1024, SINGLE_CALL_MAX_CONTEXT)
+
+def generate_sections_single_call(user_data, max_workers=None, progress_callback=None):
+    """Generate the whole SOP in one Ollama call, regenerating only sections that come back missing or malformed"""
+    if progress_callback:
+        for section_key in SOP_SECTION_PROMPTS.keys():
+            progress_callback(section_key, {"status": "pending"})
+    
+    call_start = time.time()
+    num_predict = min(sum(section_token_budget(section_key) for section_key in SOP_SECTION_PROMPTS), MAX_TOKENS)
+    read_timeout = sum(section_latency_budget(section_key) for section_key in SOP_SECTION_PROMPTS) if HYBRID_GENERATION else None
+    single_call = {"num_predict": num_predict}
+    parsed = {}
+    
+    status = ollama_status()
+    if status["ollama_running"] and status["model_available"] and ollama_pool.state != CircuitBreaker.OPEN:
+        prompt = build_shared_prefix(user_data) + single_call_instruction()
+        single_call["num_ctx"] = single_call_context_size(prompt, num_predict)
+        details = generate_with_ollama_api_detailed(MODEL_NAME, prompt, TEMPERATURE, num_predict, read_timeout,
+                                                    num_ctx=single_call["num_ctx"])
+        text = details.pop("text")
+        single_call.update(details)
+        if not details.get("error"):
+            parsed = parse_marked_sections(text)
+            if details.get("done_reason") == "length" and parsed:
+                # Cut off at num_predict: the last section written is incomplete, so regenerate it
+                parsed.pop(list(parsed)[-1])
+    else:
+        single_call["error"] = "ollama_unavailable"
+    single_call["time"] = round(time.time() - call_start, 2)
+    
+    results = {}
+    for section_key, content in parsed.items():
+        word_count = len(content.split())
+        if word_count < MIN_SECTION_WORDS:
+            continue
+        results[section_key] = {
+            "content": content,
+            "success": True,
+            "source": "single_call",
+            "time": single_call["time"],
+            "stats": {"word_count": word_count}
+        }
+        if progress_callback:
+            progress_callback(section_key, {"status": "done", "success": True, "time": single_call["time"]})
+    
+    single_call["regenerated_sections"] = [section_key for section_key in SOP_SECTION_PROMPTS if section_key not in results]
+    if single_call["regenerated_sections"]:
+        print(f"Single-call generation missed {single_call['regenerated_sections']}, regenerating them per section")
+        results.update(generate_sections_concurrently(
+            user_data, max_workers, progress_callback, section_keys=single_call["regenerated_sections"]
+        ))
+    
+    return results, single_call
+
+def generation_usage(results, single_call=None):
+    """Ollama calls and tokens spent on one SOP (cache hits and template sections cost nothing)"""
+    calls = [result["stats"] for result in results.values() if result["stats"].get("eval_count") is not None]
+    if single_call and single_call.get("eval_count") is not None:
+        calls.append(single_call)
+    return {
+        "llm_calls": len(calls),
+        "prompt_eval_count": sum(call.get("prompt_eval_count") or 0 for call in calls),
+        "eval_count": sum(call.get("eval_count") or 0 for call in calls)
+    }
+
+def record_generation_mode(mode, generation_time, usage):
+    with generation_mode_lock:
+        totals = generation_mode_stats.setdefault(
+            mode, {"runs": 0, "generation_time": 0.0, "llm_calls": 0, "prompt_eval_count": 0, "eval_count": 0}
+        )
+        totals["runs"] += 1
+        totals["generation_time"] += generation_time
+        for field in ("llm_calls", "prompt_eval_count", "eval_count"):
+            totals[field] += usage[field]
+
+def generation_mode_comparison():
+    """Average latency and tokens per SOP for each generation mode seen by this worker"""
+    with generation_mode_lock:
+        comparison = {
+            mode: {
+                "runs": totals["runs"],
+                "avg_generation_time": round(totals["generation_time"] / totals["runs"], 2),
+                "avg_llm_calls": round(totals["llm_calls"] / totals["runs"], 2),
+                "avg_prompt_eval_count": round(totals["prompt_eval_count"] / totals["runs"], 1),
+                "avg_eval_count": round(totals["eval_count"] / totals["runs"], 1)
+            }
+            for mode, totals in generation_mode_stats.items()
+        }
+    
+    if "per_section" in comparison and "single_call" in comparison:
+        per_section, single = comparison["per_section"], comparison["single_call"]
+        comparison["single_call_vs_per_section"] = {
+            field: round(single[field] / per_section[field], 3) if per_section[field] else None
+            for field in ("avg_generation_time", "avg_prompt_eval_count", "avg_eval_count")
+        }
+    return comparison
+
+def generate_complete_sop(user_data, max_workers=None, progress_callback=None, mode=None):
     """Generate complete SOP with all sections"""
+    mode = mode or GENERATION_MODE
     
     start_time = time.time()
+    # Part of the request's trace, or a trace of its own when run as a background job
+    sop_span = tracer.start_span("generate_sop", new_trace=True, mode=mode)
     
     # Save user data for future reference
-    save_user_data(user_data)
+    applicant_id = save_user_data(user_data)
     
     complete_sop = ""
     sections_content = {}
+    section_timings = {}
+    section_tokens = {}
+    section_sources = {}
+    failed_sections = []
     
     try:
-        # Generate each section sequentially
+        # Generate sections (concurrently, or in one call), then reassemble them in canonical order
+        single_call = None
+        if mode == "single_call":
+            results, single_call = generate_sections_single_call(user_data, max_workers, progress_callback)
+        else:
+            results = generate_sections_concurrently(user_data, max_workers, progress_callback)
+        
         for section_key in SOP_SECTION_PROMPTS.keys():
-            section_content = generate_section_with_ollama(section_key, user_data)
+            section_content = results[section_key]["content"]
             sections_content[section_key] = section_content
+            section_timings[section_key] = results[section_key]["time"]
+            section_tokens[section_key] = {
+                field: results[section_key]["stats"].get(field)
+                for field in ("num_predict", "eval_count", "prompt_eval_count", "cached", "model")
+            }
+            section_sources[section_key] = results[section_key].get("source", "ai")
+            if not results[section_key]["success"]:
+                failed_sections.append(section_key)
             
             section_title = SOP_SECTION_PROMPTS[section_key]["title"]
             complete_sop += f"{section_title}\n\n{section_content}\n\n"
     
-        # Save the generated SOP
-        save_generated_sop(user_data.get('name', 'unnamed'), complete_sop, sections_content)
-        
         end_time = time.time()
         generation_time = round(end_time - start_time, 2)
         
-        return {"success": True, "sop_content": complete_sop, "generation_time": generation_time}
+        # Save the generated SOP
+        section_stats = {
+            key: dict(section_tokens[key], time=section_timings[key], source=section_sources[key])
+            for key in sections_content
+        }
+        generation_id = save_generated_sop(user_data.get('name', 'unnamed'), complete_sop, sections_content,
+                                           applicant_id, section_stats, generation_time)
+        
+        generation_seconds.observe(end_time - start_time, mode=mode)
+        usage = generation_usage(results, single_call)
+        if usage["llm_calls"]:
+            record_generation_mode(mode, generation_time, usage)
+        
+        result = {
+            "success": True,
+            "generation_id": generation_id,
+            "sop_content": complete_sop,
+            "generation_time": generation_time,
+            "section_timings": section_timings,
+            "section_tokens": section_tokens,
+            "section_sources": section_sources,
+            "prompt_layout": PROMPT_LAYOUT,
+            "prompt_eval_total": usage["prompt_eval_count"],
+            "generation_mode": mode,
+            "usage": usage,
+            "mode_comparison": generation_mode_comparison(),
+            "failed_sections": failed_sections
+        }
+        if single_call is not None:
+            result["single_call"] = single_call
+        return result
     
     except Exception as e:
         print(f"Error generating SOP: {str(e)}")
         traceback.print_exc()
+        sop_span.set(error=str(e))
         return {"success": False, "error": str(e)}
+    finally:
+        tracer.end_span(sop_span)
 
-def save_user_data(user_data):
-    """Save user data to a JSON file"""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    user_name = user_data.get('name', 'unnamed').replace(' ', '_')
-    filename = f"data/user_data_{user_name}_{timestamp}.json"
-    
-    with open(filename, 'w') as f:
-        json.dump(user_data, f, indent=4)
-    
-    return filename
-
-def save_generated_sop(name, complete_sop, sections_content):
-    """Save the generated SOP to a JSON file"""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    user_name = name.replace(' ', '_')
-    filename = f"data/sop_{user_name}_{timestamp}.json"
-    
-    data = {
-        "complete_sop": complete_sop,
-        "sections": sections_content,
-        "timestamp": timestamp
+def admit_generation(timeout=None, bounded=True):
+    """Wait for an admission slot (see AdmissionController.acquire), recording the wait"""
+    wait_start = time.time()
+    with tracer.span("admission_wait") as span:
+        try:
+            slot = admission.acquire(timeout=timeout, bounded=bounded)
+        except AdmissionRejected as e:
+            admission_rejections.inc(reason=e.reason)
+            if span:
+                span.set(rejected=e.reason)
+            raise
+    admission_wait_seconds.observe(time.time() - wait_start)
+    return slot
+
+def busy_response(error):
+    response = jsonify({"success": False, "error": str(error), "retry_after": error.retry_after})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def generate_complete_sop_admitted(user_data, progress_callback=None, mode=None, timeout=0, bounded=False):
+    """Generate once admitted; the defaults (no deadline, no queue bound) suit jobs, whose queue is already bounded"""
+    slot = admit_generation(timeout=timeout, bounded=bounded)
+    try:
+        return generate_complete_sop(user_data, progress_callback=progress_callback, mode=mode)
+    finally:
+        admission.release(slot)
+
+def normalize_field(value):
+    """Form value with surrounding and repeated whitespace removed"""
+    return " ".join(str(value or "").split())
+
+def form_coalesce_key(user_data, mode):
+    """Hash of the submitted form that ignores blank fields and whitespace differences"""
+    normalized = {key: normalize_field(value) for key, value in user_data.items() if normalize_field(value)}
+    raw = json.dumps([normalized, mode], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def generate_complete_sop_coalesced(user_data, progress_callback=None, mode=None, timeout=0, bounded=False):
+    """generate_complete_sop_admitted, shared by identical submissions in flight at the same time"""
+    mode = mode or GENERATION_MODE
+    if sop_flights is None:
+        return generate_complete_sop_admitted(user_data, progress_callback, mode, timeout, bounded)
+    
+    with tracer.span("coalesce") as span:
+        result, coalesced = sop_flights.do(
+            form_coalesce_key(user_data, mode),
+            generate_complete_sop_admitted, user_data, progress_callback, mode, timeout, bounded
+        )
+        if span:
+            span.set(coalesced=coalesced)
+    if not coalesced:
+        return result
+    coalesced_requests.inc(level="form")
+    print(f"Coalesced duplicate submission for {user_data.get('name', 'unnamed')} into generation {result.get('generation_id')}")
+    return dict(result, coalesced=True)
+
+def sections_affected_by(fields):
+    """Sections whose prompt uses any of the given applicant fields, in SOP order"""
+    fields = set(fields)
+    return [section_key for section_key in SOP_SECTION_PROMPTS
+            if fields & set(SECTION_FIELD_DEPENDENCIES.get(section_key, []))]
+
+def load_generation(generation_id, wait=2.0):
+    """A stored generation, waiting for queued store writes if it was saved moments ago"""
+    generation = sop_store.get_generation(generation_id)
+    if generation is None:
+        sop_store.flush(timeout=5)
+        generation = sop_store.get_generation(generation_id)
+    # Another worker's writer queue cannot be flushed from here, so give it a moment to commit
+    deadline = time.time() + wait
+    while generation is None and time.time() < deadline:
+        time.sleep(0.1)
+        generation = sop_store.get_generation(generation_id)
+    return generation
+
+def stored_section_failed(section):
+    """Whether a stored section holds an error message instead of SOP text"""
+    return section["content"].startswith(("Error generating ", "Error: "))
+
+def regenerate_sop(previous, edits, max_workers=None, progress_callback=None):
+    """Apply edited fields to a stored generation and rerun only the sections that depend on them"""
+    start_time = time.time()
+    old_data = previous["user_data"]
+    user_data = dict(old_data)
+    user_data.update(edits)
+    
+    changed_fields = sorted(field for field, value in edits.items()
+                            if normalize_field(value) != normalize_field(old_data.get(field)))
+    previous_sections = {section["section_key"]: section for section in previous["sections"]}
+    # Generations imported from old text files may have no sections stored; those are rerun in full,
+    # as are sections that failed last time
+    rerun = [section_key for section_key in SOP_SECTION_PROMPTS
+             if section_key in sections_affected_by(changed_fields) or section_key not in previous_sections
+             or stored_section_failed(previous_sections[section_key])]
+    unmapped_fields = [field for field in changed_fields if field not in PROMPT_FIELD_ORDER]
+    
+    if not rerun:
+        return {
+            "success": True,
+            "generation_id": previous["id"],
+            "previous_generation_id": previous["id"],
+            "sop_content": previous["complete_sop"],
+            "changed_fields": [],
+            "changed_sections": [],
+            "kept_sections": list(previous_sections),
+            "unmapped_fields": []
+        }
+    
+    with tracer.span("regenerate_sop", changed_fields=",".join(changed_fields), sections=",".join(rerun)):
+        applicant_id = save_user_data(user_data)
+        results = generate_sections_concurrently(user_data, max_workers, progress_callback, section_keys=rerun) if rerun else {}
+        
+        complete_sop = ""
+        sections_content = {}
+        section_stats = {}
+        failed_sections = []
+        for section_key, section_info in SOP_SECTION_PROMPTS.items():
+            if section_key in results:
+                result = results[section_key]
+                sections_content[section_key] = result["content"]
+                section_stats[section_key] = dict(
+                    {field: result["stats"].get(field) for field in ("num_predict", "eval_count", "prompt_eval_count", "cached", "model")},
+                    time=result["time"], source=result.get("source", "ai")
+                )
+                if not result["success"]:
+                    failed_sections.append(section_key)
+            else:
+                # Unaffected: kept verbatim from the previous generation
+                sections_content[section_key] = previous_sections[section_key]["content"]
+                section_stats[section_key] = {"time": 0, "source": "reused"}
+            complete_sop += f"{section_info['title']}\n\n{sections_content[section_key]}\n\n"
+        
+        generation_time = round(time.time() - start_time, 2)
+        generation_seconds.observe(time.time() - start_time, mode="regenerate")
+        generation_id = save_generated_sop(user_data.get('name', 'unnamed'), complete_sop, sections_content,
+                                           applicant_id, section_stats, generation_time, origin="app_regenerate")
+    
+    return {
+        "success": True,
+        "generation_id": generation_id,
+        "previous_generation_id": previous["id"],
+        "sop_content": complete_sop,
+        "generation_time": generation_time,
+        "changed_fields": changed_fields,
+        "changed_sections": rerun,
+        "kept_sections": [section_key for section_key in SOP_SECTION_PROMPTS if section_key not in rerun],
+        "unmapped_fields": unmapped_fields,
+        "section_timings": {key: stats["time"] for key, stats in section_stats.items()},
+        "section_sources": {key: stats["source"] for key, stats in section_stats.items()},
+        "failed_sections": failed_sections
     }
+
+def sse_event(event, data):
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_complete_sop(user_data):
+    """Generate the SOP section by section, yielding SSE events as Ollama produces tokens"""
+    start_time = time.time()
+    applicant_id = save_user_data(user_data)
+    
+    status = ollama_status()
+    ollama_ready = status["ollama_running"] and status["model_available"]
+    if not ollama_ready and not HYBRID_GENERATION:
+        yield sse_event("error", {"success": False, "error": status.get("error", f"Model '{MODEL_NAME}' is not available")})
+        return
+    
+    complete_sop = ""
+    sections_content = {}
+    section_timings = {}
+    section_sources = {}
+    section_tokens = {}
+    failed_sections = []
+    context = shared_prompt_context(user_data) if ollama_ready else None
+    
+    for index, (section_key, section_info) in enumerate(SOP_SECTION_PROMPTS.items()):
+        section_start = time.time()
+        section_span = tracer.start_span("section", section=section_key)
+        yield sse_event("section_start", {"section": section_key, "title": section_info["title"], "index": index})
+        
+        chunks = []
+        final_chunk = {}
+        error_kind = None
+        section_sources[section_key] = "ai"
+        model, fallback_reason = route_section_model(section_key, status)
+        # The primed context holds MODEL_NAME's tokens of the shared prefix
+        section_context = context if model == MODEL_NAME and section_prompt_layout(section_key) == "shared_prefix" else None
+        call_start = time.time()
+        try:
+            if not ollama_ready:
+                error_kind = "ollama_down"
+                raise Exception("Ollama is not available")
+            
+            # In hybrid mode the latency budget bounds both a stall and the section's whole stream
+            read_timeout = section_latency_budget(section_key) if HYBRID_GENERATION else None
+            prompt = prepare_prompt(section_key, section_info, user_data)
+            stream = stream_with_ollama_api(
+                model,
+                section_instruction(section_info) if section_context else prompt,
+                TEMPERATURE,
+                section_token_budget(section_key, model),
+                read_timeout,
+                context=section_context,
+                cache_prompt=prompt,
+                deadline=section_start + read_timeout if read_timeout else None
+            )
+            with tracer.span("ollama.stream", model=model) as ollama_span:
+                for chunk in stream:
+                    text = chunk.get('response', '')
+                    if text:
+                        chunks.append(text)
+                        yield sse_event("token", {"section": section_key, "text": text})
+                    if chunk.get('done'):
+                        final_chunk = chunk
+                if ollama_span:
+                    ollama_span.set(**{field: final_chunk.get(field) for field in ("host", "cached", "prompt_eval_count", "eval_count")})
+            
+            section_content = "".join(chunks).strip()
+            word_count = len(section_content.split())
+            if word_count < MIN_SECTION_WORDS:
+                error_kind = "short_output"
+                raise Exception(f"Generated content for {section_key} is too short")
+            if final_chunk.get('done_reason') == "length":
+                error_kind = "truncated"
+                raise Exception(f"Generated content for {section_key} was cut off at its token budget")
+            record_model_routing(section_key, model, time.time() - call_start, final_chunk, True, fallback_reason)
+            if not final_chunk.get('cached'):
+                token_calibration.record(section_key, model, final_chunk.get('eval_count'), word_count)
+        except Exception as e:
+            if ollama_ready:
+                record_model_routing(section_key, model, time.time() - call_start, final_chunk, False, fallback_reason)
+            print(f"Error streaming {section_key}: {str(e)}")
+            generation_errors.inc(kind=error_kind or stream_error_kind(e))
+            if HYBRID_GENERATION:
+                section_content = generate_section_from_template(section_key, user_data)
+                section_sources[section_key] = "template"
+            else:
+                section_content = f"Error generating {section_info['title']}: {str(e)}"
+                failed_sections.append(section_key)
+        
+        sections_content[section_key] = section_content
+        section_timings[section_key] = round(time.time() - section_start, 2)
+        section_seconds.observe(time.time() - section_start, section=section_key, source=section_sources[section_key])
+        section_tokens[section_key] = {
+            field: final_chunk.get(field) for field in ("eval_count", "prompt_eval_count", "cached")
+        }
+        section_tokens[section_key]["model"] = model if ollama_ready else None
+        if section_span:
+            section_span.set(source=section_sources[section_key], success=section_key not in failed_sections)
+        tracer.end_span(section_span)
+        complete_sop += f"{section_info['title']}\n\n{section_content}\n\n"
+        
+        # "content" is authoritative: it replaces any partial tokens if the section fell back to the template
+        yield sse_event("section_done", {
+            "section": section_key,
+            "content": section_content,
+            "source": section_sources[section_key],
+            "success": section_key not in failed_sections,
+            "time": section_timings[section_key],
+            "prompt_eval_count": section_tokens[section_key]["prompt_eval_count"],
+            "eval_count": section_tokens[section_key]["eval_count"]
+        })
     
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=4)
+    generation_time = round(time.time() - start_time, 2)
+    generation_seconds.observe(time.time() - start_time, mode="stream")
+    section_stats = {
+        key: dict(section_tokens[key], time=section_timings[key], source=section_sources[key])
+        for key in sections_content
+    }
+    generation_id = save_generated_sop(user_data.get('name', 'unnamed'), complete_sop, sections_content,
+                                       applicant_id, section_stats, generation_time)
     
-    return filename
+    yield sse_event("done", {
+        "success": True,
+        "generation_id": generation_id,
+        "sop_content": complete_sop,
+        "generation_time": generation_time,
+        "section_timings": section_timings,
+        "section_tokens": section_tokens,
+        "section_sources": section_sources,
+        "prompt_layout": PROMPT_LAYOUT,
+        "prompt_eval_total": sum(tokens["prompt_eval_count"] or 0 for tokens in section_tokens.values()),
+        "failed_sections": failed_sections
+    })
+
+def save_user_data(user_data):
+    """Queue the user data for the SOP store and return the applicant id"""
+    with tracer.span("save_applicant"):
+        return sop_store.save_applicant(user_data)
+
+def save_generated_sop(name, complete_sop, sections_content, applicant_id=None, section_stats=None, generation_time=None,
+                       origin="app"):
+    """Queue the generated SOP and its sections for the SOP store and return the generation id"""
+    with tracer.span("save_generation"):
+        return sop_store.save_generation(
+            name, complete_sop, sections_content,
+            applicant_id=applicant_id,
+            section_stats=section_stats,
+            generation_time=generation_time,
+            origin=origin
+        )
+
+def parse_date_arg(value, end_of_day=False):
+    """Turn a YYYY-MM-DD query argument into epoch seconds (the start of the next day for end_of_day)"""
+    if not value:
+        return None
+    day = datetime.datetime.strptime(value, "%Y-%m-%d")
+    if end_of_day:
+        day += datetime.timedelta(days=1)
+    return day.timestamp()
 
 def generate_docx(sop_content, user_name):
     """Generate a Word document from the SOP content with improved formatting"""
+    if DOCX_RENDERER == "python-docx":
+        return generate_docx_with_python_docx(sop_content, user_name)
+    return render_sop_docx(sop_content, user_name)
+
+def generate_docx_with_python_docx(sop_content, user_name):
+    """Reference implementation of the DOCX layout using python-docx"""
     doc = Document()
     
     # Set document properties
@@ -360,104 +1582,141 @@ def generate_docx(sop_content, user_name):
     return docx_io
 
 def generate_pdf_from_docx(docx_io, user_name):
-    """Alternative method to generate PDF"""
+    """Convert the DOCX to PDF on a warm LibreOffice converter, falling back to the DOCX itself"""
     try:
-        # Create a temporary directory to work in
-        temp_dir = tempfile.mkdtemp()
-        temp_docx_path = os.path.join(temp_dir, f"SOP_{user_name}.docx")
-        
-        # Save the DOCX to the temporary file
-        with open(temp_docx_path, 'wb') as f:
-            f.write(docx_io.getvalue())
-        
-        # Fallback to just returning the DOCX if we can't convert
-        pdf_data = None
-        pdf_io = io.BytesIO()
-        
-        # Try different conversion methods
-        conversion_successful = False
-        
-        # Method 1: Try direct LibreOffice conversion if available
-        try:
-            if os.name == 'nt':  # Windows
-                # Check if LibreOffice exists in common locations
-                libreoffice_paths = [
-                    r"C:\Program Files\LibreOffice\program\soffice.exe",
-                    r"C:\Program Files (x86)\LibreOffice\program\soffice.exe"
-                ]
-                
-                soffice_path = None
-                for path in libreoffice_paths:
-                    if os.path.exists(path):
-                        soffice_path = path
-                        break
-                
-                if soffice_path:
-                    temp_pdf_path = temp_docx_path.replace('.docx', '.pdf')
-                    subprocess.run([
-                        soffice_path,
-                        '--headless',
-                        '--convert-to', 'pdf',
-                        '--outdir', temp_dir,
-                        temp_docx_path
-                    ], check=True, timeout=30)
-                    
-                    if os.path.exists(temp_pdf_path):
-                        with open(temp_pdf_path, 'rb') as f:
-                            pdf_data = f.read()
-                        conversion_successful = True
-            else:  # Linux/Mac
-                temp_pdf_path = temp_docx_path.replace('.docx', '.pdf')
-                subprocess.run([
-                    'libreoffice', '--headless', '--convert-to', 'pdf',
-                    '--outdir', temp_dir,
-                    temp_docx_path
-                ], check=True, timeout=30)
-                
-                if os.path.exists(temp_pdf_path):
-                    with open(temp_pdf_path, 'rb') as f:
-                        pdf_data = f.read()
-                    conversion_successful = True
-        except Exception as e:
-            print(f"LibreOffice conversion failed: {str(e)}")
-        
-        # If all conversion methods failed, return the original DOCX
-        if not conversion_successful or not pdf_data:
-            print("PDF conversion failed, returning original DOCX")
-            docx_io.seek(0)
-            return docx_io, 'docx'
-        
-        # Create PDF BytesIO from the data
-        pdf_io.write(pdf_data)
-        pdf_io.seek(0)
-        
-        # Clean up temporary files
-        try:
-            for file in os.listdir(temp_dir):
-                os.remove(os.path.join(temp_dir, file))
-            os.rmdir(temp_dir)
-        except Exception as e:
-            print(f"Error cleaning up temp files: {str(e)}")
-        
-        return pdf_io, 'pdf'
-    
+        with tracer.span("export.pdf_convert", converter=pdf_converter.mode):
+            pdf_data = pdf_converter.convert(docx_io.getvalue())
+        return io.BytesIO(pdf_data), 'pdf'
     except Exception as e:
-        print(f"Error in PDF conversion: {str(e)}")
-        traceback.print_exc()
-        
-        # Return original DOCX as fallback
+        print(f"PDF conversion failed for {user_name}, returning original DOCX: {str(e)}")
         docx_io.seek(0)
         return docx_io, 'docx'
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.time()
+    if WARMUP_ENABLED:
+        model_warmer.start()  # No-op unless this is a freshly forked worker
+    if not request.path.startswith(TRACE_EXCLUDED_PREFIXES):
+        g.request_span = tracer.start_span("http", root=True, method=request.method, path=request.path)
+
+@app.after_request
+def record_request_metrics(response):
+    # Label by URL rule, not path, so ids in URLs don't explode the label set
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    http_requests.inc(route=route, method=request.method, status=str(response.status_code))
+    if "request_start" in g:
+        http_request_seconds.observe(time.time() - g.request_start, route=route)
+    if g.get("request_span"):
+        g.request_span.set(route=route, status=response.status_code)
+        response.headers['X-Trace-Id'] = g.request_span.trace.trace_id
+    return response
+
+@app.teardown_request
+def end_request_span(error=None):
+    # Runs after a streamed body finishes, so the span covers the whole SSE stream
+    tracer.end_span(g.pop("request_span", None), error=error)
+
+@app.route('/debug/traces', methods=['GET'])
+def list_traces():
+    try:
+        limit = min(int(request.args.get('limit', 50)), TRACE_BUFFER_SIZE)
+        min_ms = float(request.args.get('min_ms', 0))
+    except ValueError:
+        return jsonify({"success": False, "error": "limit and min_ms must be numbers"}), 400
+    return jsonify({"traces": tracer.recent(limit, min_ms, request.args.get('name'))})
+
+@app.route('/debug/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    trace = tracer.get(trace_id)
+    if trace is None:
+        return jsonify({"success": False, "error": "Trace not found or evicted"}), 404
+    return jsonify(trace)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/check_ollama', methods=['GET'])
 def get_ollama_status():
-    status = check_ollama_status()
+    status = ollama_status()
+    status["circuit_breaker"] = {"state": ollama_pool.state}
+    status["hosts"] = ollama_pool.stats()["hosts"]
     return jsonify(status)
 
+@app.route('/model_routing', methods=['GET'])
+def get_model_routing():
+    return jsonify(dict(
+        model_routing_summary(),
+        enabled=MODEL_ROUTING,
+        default_model=MODEL_NAME,
+        routes={key: info.get("model", MODEL_NAME) for key, info in SOP_SECTION_PROMPTS.items()}
+    ))
+
+@app.route('/model_status', methods=['GET'])
+def get_model_status():
+    return jsonify(dict(model_warmer.status(), enabled=WARMUP_ENABLED))
+
+@app.route('/ollama_hosts', methods=['GET'])
+def get_ollama_hosts():
+    return jsonify(ollama_pool.stats())
+
+@app.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    if completion_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(completion_cache.stats(), enabled=True))
+
+@app.route('/export_cache_stats', methods=['GET'])
+def get_export_cache_stats():
+    if export_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(export_cache.stats(), enabled=True))
+
+@app.route('/generations', methods=['GET'])
+def list_generations():
+    try:
+        since = parse_date_arg(request.args.get('from'))
+        until = parse_date_arg(request.args.get('to'), end_of_day=True)
+        limit = min(int(request.args.get('limit', 50)), 500)
+    except ValueError:
+        return jsonify({"success": False, "error": "Use YYYY-MM-DD dates and an integer limit"}), 400
+    
+    generations = sop_store.find_generations(request.args.get('name'), since, until, limit)
+    return jsonify({"success": True, "generations": generations})
+
+@app.route('/generations/<generation_id>', methods=['GET'])
+def get_generation(generation_id):
+    generation = sop_store.get_generation(generation_id)
+    if generation is None:
+        return jsonify({"success": False, "error": "Unknown generation"}), 404
+    return jsonify(dict(generation, success=True))
+
+@app.route('/coalescing_stats', methods=['GET'])
+def get_coalescing_stats():
+    if sop_flights is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, "form": sop_flights.stats(), "section": prompt_flights.stats()})
+
+@app.route('/admission_stats', methods=['GET'])
+def get_admission_stats():
+    return jsonify(admission.stats())
+
+@app.route('/pdf_stats', methods=['GET'])
+def get_pdf_stats():
+    return jsonify(pdf_converter.stats())
+
+@app.route('/calibration', methods=['GET'])
+def get_token_calibration():
+    model = request.args.get('model', MODEL_NAME)
+    word_limits = {key: info['word_limit'] for key, info in SOP_SECTION_PROMPTS.items()}
+    defaults = {key: default_token_budget(key) for key in SOP_SECTION_PROMPTS}
+    return jsonify({"model": model, "sections": token_calibration.snapshot(word_limits, model, defaults)})
+
 @app.route('/generate_sop', methods=['POST'])
 def generate_sop():
     try:
@@ -466,8 +1725,15 @@ def generate_sop():
         for key in request.form:
             user_data[key] = request.form.get(key)
         
-        # Generate the SOP
-        result = generate_complete_sop(user_data)
+        mode = request.args.get('mode') or GENERATION_MODE
+        if mode not in GENERATION_MODES:
+            return jsonify({"success": False, "error": f"Unknown mode '{mode}', use one of {', '.join(GENERATION_MODES)}"}), 400
+        
+        # Generate the SOP (or share the one already being generated for the same form)
+        try:
+            result = generate_complete_sop_coalesced(user_data, mode=mode, timeout=None, bounded=True)
+        except AdmissionRejected as e:
+            return busy_response(e)
         return jsonify(result)
     
     except Exception as e:
@@ -475,19 +1741,137 @@ def generate_sop():
         traceback.print_exc()
         return jsonify({"success": False, "error": str(e)})
 
+@app.route('/regenerate_sop', methods=['POST'])
+def regenerate_sop_route():
+    try:
+        # generation_id names the SOP to update; every other form field is an edited applicant field
+        edits = request.form.to_dict()
+        generation_id = edits.pop('generation_id', None)
+        if not generation_id:
+            return jsonify({"success": False, "error": "generation_id is required"}), 400
+        
+        previous = load_generation(generation_id)
+        if previous is None:
+            return jsonify({"success": False, "error": "Unknown generation"}), 404
+        if previous["user_data"] is None:
+            return jsonify({"success": False, "error": "The applicant data for this generation was not stored"}), 409
+        
+        try:
+            slot = admit_generation()
+        except AdmissionRejected as e:
+            return busy_response(e)
+        try:
+            result = regenerate_sop(previous, edits)
+        finally:
+            admission.release(slot)
+        return jsonify(result)
+    
+    except Exception as e:
+        print(f"Error regenerating SOP: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)})
+
+@app.route('/generate_sop/stream', methods=['GET', 'POST'])
+def generate_sop_stream():
+    # Form data for fetch() clients, query parameters for EventSource
+    user_data = request.values.to_dict()
+    
+    try:
+        slot = admit_generation()
+    except AdmissionRejected as e:
+        return busy_response(e)
+    
+    response = Response(
+        stream_with_context(stream_complete_sop(user_data)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Held until the stream ends or the client goes away
+    response.call_on_close(lambda: admission.release(slot))
+    return response
+
+@app.route('/jobs', methods=['POST'])
+def submit_generation_job():
+    try:
+        user_data = request.form.to_dict()
+        mode = request.args.get('mode') or GENERATION_MODE
+        if mode not in GENERATION_MODES:
+            return jsonify({"success": False, "error": f"Unknown mode '{mode}', use one of {', '.join(GENERATION_MODES)}"}), 400
+        job_id = job_manager.submit(partial(generate_complete_sop_coalesced, mode=mode), user_data)
+        return jsonify({"success": True, "job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+    
+    except JobQueueFull as e:
+        return jsonify({"success": False, "error": f"Too many SOPs in progress, please retry shortly ({str(e)})"}), 503
+    except Exception as e:
+        print(f"Error submitting job: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_generation_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found or expired"}), 404
+    return jsonify(dict(job, success=True))
+
+def export_renderer_version(fmt):
+    """Version tag of the code producing an export format, so cached files change with the renderer"""
+    docx_version = "python-docx" if DOCX_RENDERER == "python-docx" else DOCX_RENDERER_VERSION
+    return {"docx": docx_version, "pdf": f"{docx_version}+soffice", "txt": "utf-8"}[fmt]
+
+def export_key(sop_content, user_name, fmt):
+    return ExportCache.make_key(sop_content, user_name, fmt, export_renderer_version(fmt))
+
+def cached_export(key, render, fmt):
+    """Return the export bytes for key, calling render() only on a cache miss"""
+    data = export_cache.get(key) if export_cache is not None else None
+    if data is None:
+        render_start = time.time()
+        with tracer.span("export.render", format=fmt):
+            data = render()
+        export_render_seconds.observe(time.time() - render_start, format=fmt)
+        if export_cache is not None:
+            export_cache.set(key, data)
+    return data
+
+def client_has_export(key):
+    """True when the request's If-None-Match already names this export"""
+    return request.if_none_match.contains_weak(key)
+
+def export_not_modified(key):
+    response = Response(status=304)
+    response.set_etag(key)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def send_export(data, key, mimetype, download_name):
+    response = send_file(
+        io.BytesIO(data),
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+        etag=key
+    )
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/download_docx', methods=['POST'])
 def download_docx():
     try:
         sop_content = request.form.get('sop_content')
         user_name = request.form.get('name', 'Unnamed')
         
-        docx_io = generate_docx(sop_content, user_name)
+        key = export_key(sop_content, user_name, 'docx')
+        if client_has_export(key):
+            return export_not_modified(key)
         
-        return send_file(
-            docx_io,
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            as_attachment=True,
-            download_name=f"SOP_{user_name.replace(' ', '_')}.docx"
+        docx_data = cached_export(key, lambda: generate_docx(sop_content, user_name).getvalue(), 'docx')
+        
+        return send_export(
+            docx_data,
+            key,
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+            f"SOP_{user_name.replace(' ', '_')}.docx"
         )
     
     except Exception as e:
@@ -501,16 +1885,17 @@ def download_txt():
         sop_content = request.form.get('sop_content')
         user_name = request.form.get('name', 'Unnamed')
         
-        # Create a BytesIO object for the text content
-        text_io = io.BytesIO()
-        text_io.write(sop_content.encode('utf-8'))
-        text_io.seek(0)
+        key = export_key(sop_content, user_name, 'txt')
+        if client_has_export(key):
+            return export_not_modified(key)
+        
+        text_data = cached_export(key, lambda: sop_content.encode('utf-8'), 'txt')
         
-        return send_file(
-            text_io,
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name=f"SOP_{user_name.replace(' ', '_')}.txt"
+        return send_export(
+            text_data,
+            key,
+            'text/plain',
+            f"SOP_{user_name.replace(' ', '_')}.txt"
         )
     
     except Exception as e:
@@ -524,38 +1909,42 @@ def download_pdf():
         sop_content = request.form.get('sop_content')
         user_name = request.form.get('name', 'Unnamed')
         
-        # First generate DOCX
-        docx_io = generate_docx(sop_content, user_name)
+        key = export_key(sop_content, user_name, 'pdf')
+        if client_has_export(key):
+            return export_not_modified(key)
         
-        try:
-            # Try to convert to PDF
-            result_io, result_type = generate_pdf_from_docx(docx_io, user_name)
+        pdf_data = export_cache.get(key) if export_cache is not None else None
+        if pdf_data is None:
+            # Convert from the (possibly cached) DOCX
+            docx_data = cached_export(
+                export_key(sop_content, user_name, 'docx'),
+                lambda: generate_docx(sop_content, user_name).getvalue(),
+                'docx'
+            )
+            convert_start = time.time()
+            result_io, result_type = generate_pdf_from_docx(io.BytesIO(docx_data), user_name)
+            export_render_seconds.observe(time.time() - convert_start,
+                                          format='pdf' if result_type == 'pdf' else 'pdf_failed')
             
-            if result_type == 'pdf':
-                return send_file(
-                    result_io,
-                    mimetype='application/pdf',
-                    as_attachment=True,
-                    download_name=f"SOP_{user_name.replace(' ', '_')}.pdf"
-                )
-            else:
-                # If PDF conversion failed, return DOCX instead
+            if result_type != 'pdf':
+                # If PDF conversion failed, return DOCX instead (never cached as the PDF)
                 return send_file(
                     result_io,
                     mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
                     as_attachment=True,
                     download_name=f"SOP_{user_name.replace(' ', '_')}.docx"
                 ), 200, {'X-PDF-Error': 'PDF conversion failed, providing DOCX instead'}
-        except Exception as pdf_error:
-            print(f"PDF processing failed: {str(pdf_error)}")
-            # If PDF conversion fails, return DOCX as fallback
-            docx_io.seek(0)
-            return send_file(
-                docx_io,
-                mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                as_attachment=True,
-                download_name=f"SOP_{user_name.replace(' ', '_')}.docx"
-            ), 200, {'X-PDF-Error': 'PDF conversion failed, providing DOCX instead'}
+            
+            pdf_data = result_io.getvalue()
+            if export_cache is not None:
+                export_cache.set(key, pdf_data)
+        
+        return send_export(
+            pdf_data,
+            key,
+            'application/pdf',
+            f"SOP_{user_name.replace(' ', '_')}.pdf"
+        )
     
     except Exception as e:
         print(f"Error in download_pdf: {str(e)}")
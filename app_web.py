@@ -1,21 +1,22 @@
 from flask import Flask, render_template, request, jsonify, send_file
-import json
 import os
 import time
 from datetime import datetime
 import traceback
-import ollama
+from ollama_client import get_ollama_client
 import docx
+from docx_fast import render_web_docx
+from sop_store import SopStore
 import io
 
 app = Flask(__name__)
 
 # Configuration
 MODEL_NAME = "llama3.1:8b"  # Llama 3.1 8B model
+DOCX_RENDERER = os.environ.get("SOP_DOCX_RENDERER", "fast")  # "fast" or "python-docx"
 
-# Ensure directories exist
-os.makedirs("generated_sops", exist_ok=True)
-os.makedirs("saved_data", exist_ok=True)
+# Applicants and generated SOPs (shared SQLite store, see sop_store.py)
+sop_store = SopStore(os.environ.get("SOP_STORE_PATH", "data/sop_store.db"))
 
 # SOP section prompts
 sop_sections = {
@@ -44,13 +45,12 @@ def generate_section_with_ollama(prompt_template, user_data):
     formatted_prompt = prepare_prompt(prompt_template, user_data)
     
     try:
-        # Call Ollama API
-        response = ollama.generate(
+        # Call Ollama API through the shared connection pool
+        response = get_ollama_client().generate(
             model=MODEL_NAME,
-            prompt=formatted_prompt,
-            stream=False
+            prompt=formatted_prompt
         )
-        return response['response'].strip()
+        return response.get('response', '').strip()
     except Exception as e:
         print(f"Error generating with Ollama: {str(e)}")
         traceback.print_exc()
@@ -98,26 +98,25 @@ def generate_complete_sop(user_data):
     return "\n\n".join(sop).strip()
 
 def save_user_data(user_data):
-    """Save user data to a JSON file"""
+    """Queue user data for the SOP store and return the applicant id"""
     try:
-        # Create directory if it doesn't exist
-        if not os.path.exists("saved_data"):
-            os.makedirs("saved_data")
-        
-        # Save user data with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"saved_data/user_data_{timestamp}.json"
-        
-        with open(filename, 'w') as f:
-            json.dump(user_data, f, indent=4)
-        
-        return True
+        return sop_store.save_applicant(user_data)
     except Exception as e:
         print(f"Error saving user data: {str(e)}")
-        return False
+        return None
 
 def generate_word_doc(sop_content, name="unnamed"):
     """Generate a Word document from SOP content"""
+    try:
+        if DOCX_RENDERER == "python-docx":
+            return generate_word_doc_with_python_docx(sop_content)
+        return render_web_docx(sop_content)
+    except Exception as e:
+        print(f"Error generating Word document: {str(e)}")
+        return None
+
+def generate_word_doc_with_python_docx(sop_content):
+    """Reference implementation of the DOCX layout using python-docx"""
     try:
         # Create document
         doc = docx.Document()
@@ -155,21 +154,16 @@ def generate_sop_endpoint():
         # Generate SOP
         sop_content = generate_complete_sop(user_data)
         
-        # Save user data
-        save_user_data(user_data)
-        
-        # Save generated SOP to file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        name = user_data.get("name", "unnamed").replace(" ", "_")
-        txt_filename = f"generated_sops/SOP_{name}_{timestamp}.txt"
-        
-        with open(txt_filename, 'w') as f:
-            f.write(sop_content)
+        # Save user data and the generated SOP
+        applicant_id = save_user_data(user_data)
+        generation_id = sop_store.save_generation(
+            user_data.get("name", "unnamed"), sop_content, applicant_id=applicant_id, origin="app_web"
+        )
         
         return jsonify({
             "success": True,
             "sop_content": sop_content,
-            "filename": txt_filename
+            "generation_id": generation_id
         })
     except Exception as e:
         traceback.print_exc()
@@ -246,10 +240,10 @@ def download_txt():
 def check_ollama():
     try:
         # Try to list models to check if Ollama is running
-        models = ollama.list()
+        model_names = get_ollama_client().list_models()
         
         # Check if the required model is available
-        model_available = any(model['name'].startswith(MODEL_NAME.split(':')[0]) for model in models.get('models', []))
+        model_available = any(name.startswith(MODEL_NAME.split(':')[0]) for name in model_names)
         
         return jsonify({
             "ollama_running": True,
@@ -0,0 +1,231 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+def read_records(path):
+    """Stream applicant records from a JSONL or CSV file"""
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if key}
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Skipping invalid JSON on line {line_number}: {str(e)}")
+
+
+def record_id(record, id_field):
+    """Use the record's own id when present, otherwise a stable hash of its contents"""
+    value = record.get(id_field)
+    if value not in (None, ""):
+        return str(value)
+    raw = json.dumps(record, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def safe_filename(value):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', value)
+
+
+def output_is_jsonl(output):
+    return output.lower().endswith('.jsonl')
+
+
+def load_completed_ids(output):
+    """Return the ids already written successfully to the output"""
+    completed = set()
+    if output_is_jsonl(output):
+        if os.path.exists(output):
+            with open(output, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partially written line from an interrupted run
+                    if entry.get('success'):
+                        completed.add(entry['id'])
+    elif os.path.isdir(output):
+        for filename in os.listdir(output):
+            if filename.endswith('.txt'):
+                completed.add(filename[:-4])
+    return completed
+
+
+def render_with_template(chunk):
+    """Process-pool worker: deterministic SOPs for a chunk of applicants via the compiled renderer"""
+    from sop_generator import render_sop_batch
+
+    start_time = time.time()
+    try:
+        sops = render_sop_batch([record for _, record in chunk])
+    except Exception:
+        # Fall back to one at a time so a single bad record doesn't fail the whole chunk
+        return [render_one_with_template(item) for item in chunk]
+
+    elapsed = round((time.time() - start_time) / max(len(chunk), 1), 6)
+    return [{"id": applicant_id, "success": True, "sop_content": sop, "generation_time": elapsed}
+            for (applicant_id, _), sop in zip(chunk, sops)]
+
+
+def render_one_with_template(item):
+    from sop_generator import render_sop
+
+    applicant_id, record = item
+    start_time = time.time()
+    try:
+        return {"id": applicant_id, "success": True, "sop_content": render_sop(record),
+                "generation_time": round(time.time() - start_time, 6)}
+    except Exception as e:
+        return {"id": applicant_id, "success": False, "error": str(e)}
+
+
+def render_with_ollama(chunk):
+    """Thread-pool worker: full AI generation through app's admission control, so a batch never runs more
+    SOPs at once than the Ollama hosts are sized for (and shares those slots with a server on this machine)"""
+    import app
+
+    results = []
+    for applicant_id, record in chunk:
+        try:
+            result = app.generate_complete_sop_admitted(record, timeout=0, bounded=False)
+            result["id"] = applicant_id
+        except Exception as e:
+            traceback.print_exc()
+            result = {"id": applicant_id, "success": False, "error": str(e)}
+        results.append(result)
+    return results
+
+
+def chunked(items, size):
+    """Group an iterable into lists of at most size items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_bounded(executor, fn, items, max_outstanding):
+    """Submit items lazily so that at most max_outstanding are in flight, yielding results as they finish"""
+    pending = set()
+    for item in items:
+        pending.add(executor.submit(fn, item))
+        if len(pending) >= max_outstanding:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+class ResultWriter:
+    """Write each result as soon as it arrives so a crash loses at most the in-flight applicants"""
+
+    def __init__(self, output):
+        self.output = output
+        self.jsonl = output_is_jsonl(output)
+        if self.jsonl:
+            parent = os.path.dirname(os.path.abspath(output))
+            os.makedirs(parent, exist_ok=True)
+            self.file = open(output, 'a', encoding='utf-8')
+        else:
+            os.makedirs(output, exist_ok=True)
+            self.file = open(os.path.join(output, '_failures.jsonl'), 'a', encoding='utf-8')
+
+    def write(self, result):
+        if self.jsonl:
+            self.file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self.file.flush()
+        elif result.get('success'):
+            # Write then rename so a half-written file never counts as finished
+            path = os.path.join(self.output, f"{safe_filename(result['id'])}.txt")
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(result['sop_content'])
+            os.replace(path + '.tmp', path)
+        else:
+            self.file.write(json.dumps({"id": result['id'], "error": result.get('error')}) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate SOPs for a file of applicants. Re-running the same command resumes where it stopped."
+    )
+    parser.add_argument('input', help="Applicant records (.jsonl or .csv)")
+    parser.add_argument('--output', required=True, help="Output directory, or a .jsonl file")
+    parser.add_argument('--mode', choices=['template', 'ollama'], default='template',
+                        help="template: sop_generator on a process pool; ollama: AI generation with bounded concurrency")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Default: CPU count in template mode, 2 in ollama mode (each SOP already runs its "
+                             "sections in parallel, and admission control caps concurrent SOPs)")
+    parser.add_argument('--id-field', default='id', help="Record field used to identify applicants for resuming")
+    parser.add_argument('--chunk-size', type=int, default=200,
+                        help="Applicants rendered per task in template mode (ollama mode always uses 1)")
+    args = parser.parse_args()
+    if args.workers is None:
+        args.workers = (os.cpu_count() or 4) if args.mode == 'template' else 2
+
+    completed = load_completed_ids(args.output)
+    if completed:
+        print(f"Resuming: {len(completed)} applicants already done")
+
+    def pending_items():
+        for record in read_records(args.input):
+            applicant_id = safe_filename(record_id(record, args.id_field))
+            if applicant_id not in completed:
+                completed.add(applicant_id)  # Also drops duplicates within the input
+                yield applicant_id, record
+
+    if args.mode == 'template':
+        executor = ProcessPoolExecutor(max_workers=args.workers)
+        worker = render_with_template
+        chunk_size = max(1, args.chunk_size)
+    else:
+        executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch-sop")
+        worker = render_with_ollama
+        chunk_size = 1
+
+    writer = ResultWriter(args.output)
+    start_time = time.time()
+    succeeded = failed = 0
+    try:
+        with executor:
+            for results in run_bounded(executor, worker, chunked(pending_items(), chunk_size), args.workers * 4):
+                for result in results:
+                    writer.write(result)
+                    if result.get('success'):
+                        succeeded += 1
+                    else:
+                        failed += 1
+                        print(f"Failed {result['id']}: {result.get('error')}")
+                    if (succeeded + failed) % 1000 == 0:
+                        print(f"Processed {succeeded + failed} applicants ({time.time() - start_time:.1f}s)")
+    finally:
+        writer.close()
+
+    print(f"Done: {succeeded} generated, {failed} failed in {time.time() - start_time:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
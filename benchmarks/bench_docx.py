@@ -0,0 +1,79 @@
+import argparse
+import time
+
+from bench_env import isolate
+
+isolate()
+
+from docx import Document  # noqa: E402
+
+import app  # noqa: E402
+import app_web  # noqa: E402
+from docx_fast import render_sop_docx, render_web_docx  # noqa: E402
+from sop_generator import render_sop  # noqa: E402
+
+SAMPLE_APPLICANT = {
+    "name": "Aarav Sharma", "state": "Punjab", "course": "Master of Data Science",
+    "university": "University of Melbourne", "country": "Australia", "intake": "February 2026",
+    "10th_board": "CBSE", "10th_year": "2016", "10th_marks": "88",
+    "12th_board": "CBSE", "12th_year": "2018", "12th_marks": "84",
+    "bachelors_degree": "B.Tech Computer Science", "bachelors_university": "Punjabi University",
+    "bachelors_year": "2022", "bachelors_marks": "7.8 CGPA", "test_type": "IELTS", "overall": "7.5",
+    "listening": "8", "speaking": "7", "writing": "7", "reading": "7.5",
+    "father_income": "12,00,000", "mother_income": "6,00,000",
+    "father_funds": "25,00,000", "mother_funds": "10,00,000", "fixed_deposits": "15,00,000"
+}
+
+
+def paragraph_signature(doc):
+    """Text, style, alignment and run formatting of every paragraph"""
+    return [(p.text, p.style.name, p.alignment,
+             [(r.bold, r.underline, r.font.size) for r in p.runs])
+            for p in doc.paragraphs]
+
+
+def check_parity(sop_content, user_name):
+    pairs = [
+        (app.generate_docx_with_python_docx(sop_content, user_name), render_sop_docx(sop_content, user_name)),
+        (app_web.generate_word_doc_with_python_docx(sop_content), render_web_docx(sop_content)),
+    ]
+    for reference, fast in pairs:
+        expected, actual = Document(reference), Document(fast)
+        assert paragraph_signature(expected) == paragraph_signature(actual), "paragraph mismatch"
+        expected_section, actual_section = expected.sections[0], actual.sections[0]
+        for margin in ("top_margin", "bottom_margin", "left_margin", "right_margin", "page_width", "page_height"):
+            assert getattr(expected_section, margin) == getattr(actual_section, margin), margin
+    print("Parity check passed (text, styles, alignment, run formatting, page setup)")
+
+
+def time_renderer(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the direct-XML DOCX renderer with python-docx")
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    sop_content = render_sop(SAMPLE_APPLICANT)
+    user_name = SAMPLE_APPLICANT["name"]
+    check_parity(sop_content, user_name)
+
+    cases = [
+        ("app layout", lambda: app.generate_docx_with_python_docx(sop_content, user_name),
+         lambda: render_sop_docx(sop_content, user_name)),
+        ("app_web layout", lambda: app_web.generate_word_doc_with_python_docx(sop_content),
+         lambda: render_web_docx(sop_content)),
+    ]
+    for label, reference, fast in cases:
+        reference_time = time_renderer(reference, args.iterations)
+        fast_time = time_renderer(fast, args.iterations)
+        print(f"{label}: python-docx {reference_time * 1000:.2f} ms, direct XML {fast_time * 1000:.2f} ms "
+              f"({reference_time / fast_time:.1f}x faster, {len(fast().getvalue())} bytes)")
+
+
+if __name__ == '__main__':
+    main()
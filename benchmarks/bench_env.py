@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def isolate():
+    """Keep the apps' caches out of the measurements and their files and warm-up thread out of the way.
+    Call before importing app or app_web; returns the directory the benchmark was started from."""
+    sys.path.insert(0, REPO_ROOT)
+    os.environ.setdefault("SOP_EXPORT_CACHE", "0")
+    os.environ.setdefault("SOP_COMPLETION_CACHE", "0")
+    os.environ.setdefault("SOP_WARMUP", "0")
+    invocation_dir = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="sop_bench_"))
+    return invocation_dir
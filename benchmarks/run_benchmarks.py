@@ -0,0 +1,247 @@
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+from bench_env import REPO_ROOT, isolate
+
+INVOCATION_DIR = isolate()
+
+import app  # noqa: E402
+import app_web  # noqa: E402
+import sop_generator  # noqa: E402
+from token_calibration import percentile  # noqa: E402
+
+DEFAULT_SIZES = "1,10,100,1000,10000,100000"
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+STATES = ["Punjab", "Haryana", "Gujarat", "Kerala", "Maharashtra", "Delhi", "Karnataka", "Tamil Nadu"]
+COUNTRIES = ["Australia", "Canada", "United Kingdom", "New Zealand", "Ireland", "Germany"]
+COURSES = ["Master of Data Science", "MBA", "Master of Information Technology", "Diploma in Business",
+           "Master of Engineering Management", "Bachelor of Nursing"]
+UNIVERSITIES = ["University of Melbourne", "University of Toronto", "University of Leeds", "Massey University",
+                "Trinity College Dublin", "TU Munich"]
+BOARDS = ["CBSE", "ICSE", "PSEB", "HBSE", "GSEB"]
+DEGREES = ["B.Tech Computer Science", "B.Com", "BBA", "B.Sc Physics", "BA English"]
+
+
+def synthetic_applicant(index, rng):
+    """A realistic applicant record covering every optional-paragraph combination"""
+    state = rng.choice(STATES)
+    test_type = rng.choice(["IELTS", "PTE"])
+    overall = rng.choice(["6", "6.5", "7", "7.5", "8"]) if test_type == "IELTS" else rng.choice(["58", "65", "72", "79"])
+    has_bachelors = rng.random() < 0.7
+    record = {
+        "id": str(index),
+        "name": f"Applicant {index}",
+        "state": state,
+        "address": f"{rng.randint(1, 999)} Model Town, {state}",
+        "course": rng.choice(COURSES),
+        "university": rng.choice(UNIVERSITIES),
+        "country": rng.choice(COUNTRIES),
+        "intake": rng.choice(["February 2026", "July 2026", "September 2026"]),
+        "test_type": test_type,
+        "overall": overall,
+        "listening": overall,
+        "reading": overall,
+        "writing": overall,
+        "speaking": overall,
+        "father_income": f"{rng.randint(4, 30)},00,000",
+        "mother_income": f"{rng.randint(0, 12)},00,000",
+        "father_funds": f"{rng.randint(5, 40)},00,000",
+        "mother_funds": f"{rng.randint(1, 15)},00,000",
+        "fixed_deposits": f"{rng.randint(5, 25)},00,000" if rng.random() < 0.5 else "",
+        "work_experience": f"{rng.randint(1, 5)} years as a software developer" if rng.random() < 0.4 else "",
+        "family_members": "Father, mother and younger sister",
+        "bachelors_degree": rng.choice(DEGREES) if has_bachelors else "",
+        "bachelors_college": f"{state} University" if has_bachelors else "",
+        "bachelors_cgpa": f"{rng.uniform(6, 9.5):.1f}" if has_bachelors else ""
+    }
+    record["university_name"] = record["university"]
+    for level, year in (("tenth", 2016), ("twelfth", 2018)):
+        board, marks = rng.choice(BOARDS), str(rng.randint(60, 98))
+        record.update({f"{level}_board": board, f"{level}_marks": marks, f"{level}_year": str(year)})
+    for form_key, template_key in app.TEMPLATE_FIELD_ALIASES.items():
+        record[template_key] = record[form_key]
+    return record
+
+
+def synthetic_applicants(count, seed=1234):
+    rng = random.Random(seed)
+    return [synthetic_applicant(index, rng) for index in range(count)]
+
+
+def bench_prepare_prompt(layout):
+    def run(record):
+        for section_key, section_info in app.SOP_SECTION_PROMPTS.items():
+            app.prepare_prompt(section_key, section_info, record, layout=layout)
+    return run
+
+
+def bench_txt_export(client):
+    def run(item):
+        record, sop_content = item
+        response = client.post('/download_txt', data={"sop_content": sop_content, "name": record["name"]})
+        assert response.status_code == 200
+    return run
+
+
+def benchmark_suite(only=None):
+    """name -> (per-record function, input kind, record cap); caps keep the slowest paths to a few minutes"""
+    client = app.app.test_client()
+    suite = {
+        "sop_generator.generate_sop": (sop_generator.generate_sop, "record", None),
+        "sop_generator.render_sop": (sop_generator.render_sop, "record", None),
+        "app.prepare_prompt[shared_prefix]": (bench_prepare_prompt("shared_prefix"), "record", None),
+        "app.prepare_prompt[per_section]": (bench_prepare_prompt("per_section"), "record", None),
+        "app.generate_docx": (lambda item: app.generate_docx(item[1], item[0]["name"]), "sop", None),
+        "app.generate_docx[python-docx]": (
+            lambda item: app.generate_docx_with_python_docx(item[1], item[0]["name"]), "sop", 2000),
+        "app_web.generate_word_doc": (lambda item: app_web.generate_word_doc(item[1], item[0]["name"]), "sop", None),
+        "app_web.generate_word_doc[python-docx]": (
+            lambda item: app_web.generate_word_doc_with_python_docx(item[1]), "sop", 2000),
+        "txt_export[/download_txt]": (bench_txt_export(client), "sop", None)
+    }
+    if only:
+        suite = {name: entry for name, entry in suite.items() if any(pattern in name for pattern in only)}
+    return suite
+
+
+def time_calls(fn, inputs):
+    """Run fn over inputs, returning per-call latencies in seconds and the total wall time"""
+    latencies = []
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    for item in inputs:
+        call_start = perf_counter()
+        fn(item)
+        latencies.append(perf_counter() - call_start)
+    return latencies, perf_counter() - start
+
+
+def peak_memory(fn, inputs):
+    """Peak traced Python allocation while running fn over inputs (separate pass: tracing slows calls down)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            fn(item)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(name, fn, inputs, memory_records):
+    fn(inputs[0])  # Warm up imports and lazily built state
+    latencies, total = time_calls(fn, inputs)
+    memory_inputs = inputs[:memory_records] if memory_records else []
+    latency_ms = {
+        "mean": round(sum(latencies) / len(latencies) * 1000, 4),
+        "p50": round(percentile(latencies, 50) * 1000, 4),
+        "p90": round(percentile(latencies, 90) * 1000, 4),
+        "p99": round(percentile(latencies, 99) * 1000, 4),
+        "max": round(max(latencies) * 1000, 4)
+    }
+    return {
+        "benchmark": name,
+        "records": len(inputs),
+        "total_seconds": round(total, 4),
+        "throughput_per_sec": round(len(inputs) / total, 2) if total else None,
+        "latency_ms": latency_ms,
+        "peak_memory_bytes": peak_memory(fn, memory_inputs) if memory_inputs else None,
+        "memory_records": len(memory_inputs)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path):
+    """Print throughput and p50 ratios against an earlier results file"""
+    with open(baseline_path) as f:
+        baseline = {(entry["benchmark"], entry["records"]): entry for entry in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path} (ratios > 1 mean this run is faster):")
+    for entry in results:
+        previous = baseline.get((entry["benchmark"], entry["records"]))
+        if not previous or not previous["throughput_per_sec"]:
+            continue
+        throughput_ratio = entry["throughput_per_sec"] / previous["throughput_per_sec"]
+        p50_ratio = previous["latency_ms"]["p50"] / entry["latency_ms"]["p50"] if entry["latency_ms"]["p50"] else float('inf')
+        print(f"  {entry['benchmark']:<42} n={entry['records']:<7} throughput x{throughput_ratio:.2f}  p50 x{p50_ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks for SOP generation, prompts and exports")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f"Comma-separated applicant counts (default {DEFAULT_SIZES})")
+    parser.add_argument('--only', action='append', help="Run only benchmarks whose name contains this text (repeatable)")
+    parser.add_argument('--memory-records', type=int, default=1000,
+                        help="Records replayed under tracemalloc for peak memory (0 disables)")
+    parser.add_argument('--no-caps', action='store_true', help="Run the slow reference paths at every size too")
+    parser.add_argument('--output', help="Results JSON path (default benchmarks/results/<timestamp>_<commit>.json)")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    # Paths given on the command line are relative to where the script was started, not the scratch dir
+    output = os.path.join(INVOCATION_DIR, args.output) if args.output else None
+    baseline = os.path.join(INVOCATION_DIR, args.compare) if args.compare else None
+
+    sizes = sorted({int(size) for size in args.sizes.split(',') if size.strip()})
+    suite = benchmark_suite(args.only)
+
+    print(f"Building {max(sizes)} synthetic applicants...")
+    records = synthetic_applicants(max(sizes), args.seed)
+    sop_items = None
+
+    results = []
+    for name, (fn, kind, cap) in suite.items():
+        if kind == "sop" and sop_items is None:
+            sop_items = [(record, sop_generator.render_sop(record)) for record in records]
+        source = records if kind == "record" else sop_items
+        for size in sizes:
+            if cap and size > cap and not args.no_caps:
+                print(f"Skipping {name} at {size} records (capped at {cap}, use --no-caps)")
+                continue
+            entry = run_benchmark(name, fn, source[:size], min(size, args.memory_records))
+            results.append(entry)
+            memory = f"{entry['peak_memory_bytes'] / 1024:.0f} KiB" if entry["peak_memory_bytes"] is not None else "n/a"
+            print(f"{name:<42} n={size:<7} {entry['throughput_per_sec']:>10.1f}/s  "
+                  f"p50 {entry['latency_ms']['p50']:.3f} ms  p99 {entry['latency_ms']['p99']:.3f} ms  peak {memory}")
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": sizes,
+            "seed": args.seed
+        },
+        "results": results
+    }
+
+    output = output or os.path.join(
+        RESULTS_DIR, f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit or 'nocommit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import threading
+import time
+
+
+class CircuitBreaker:
+    """Stop calling a failing backend for a while, then let a single trial call through"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=30, trial_timeout=300):
+        self.failure_threshold = failure_threshold  # Consecutive failures that open the circuit
+        self.reset_timeout = reset_timeout  # Seconds to stay open before a trial call
+        self.trial_timeout = trial_timeout  # A trial never resolved by then is presumed lost and another is allowed
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started_at = 0.0
+        self._times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a call may go to the backend now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and (
+                    not self._trial_in_flight or time.time() - self._trial_started_at >= self.trial_timeout):
+                self._trial_in_flight = True
+                self._trial_started_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """End a call that told nothing about the backend (it never answered) without closing or opening the circuit"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._times_opened += 1
+                    print(f"Circuit breaker opened after {self._failures} consecutive failures")
+                self._state = self.OPEN
+                self._opened_at = time.time()
+                self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def snapshot(self):
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "times_opened": self._times_opened,
+                "retry_in": round(max(0.0, self._opened_at + self.reset_timeout - time.time()), 2) if state == self.OPEN else 0
+            }
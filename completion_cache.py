@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+
+class CompletionCache:
+    """Disk-backed prompt -> completion cache shared by every worker process on the host"""
+
+    def __init__(self, path, max_entries=5000, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._init_schema()
+
+    def _connect(self):
+        """Return this thread's connection (sqlite connections must not cross threads or forks)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_accessed ON completions(accessed_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0)")
+
+    @staticmethod
+    def make_key(model, prompt, temperature, num_predict):
+        """Hash everything that changes the completion into a fixed-size key"""
+        raw = json.dumps([model, prompt, temperature, num_predict], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached completion, or None on a miss or an expired entry"""
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT response, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    row = None
+                if row is None:
+                    conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+                else:
+                    conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+                    conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return row[0] if row is not None else None
+        except sqlite3.Error as e:
+            print(f"Completion cache read failed: {str(e)}")
+            return None
+
+    def set(self, key, model, response):
+        """Store a completion and evict the least recently used entries beyond max_entries"""
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO completions (key, model, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, model, response, now, now)
+                )
+                evicted = conn.execute(
+                    "DELETE FROM completions WHERE key IN "
+                    "(SELECT key FROM completions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                ).rowcount
+                if evicted:
+                    conn.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            print(f"Completion cache write failed: {str(e)}")
+            traceback.print_exc()
+
+    def purge_expired(self):
+        """Delete every entry older than the TTL and return how many were removed"""
+        conn = self._connect()
+        return conn.execute("DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+
+    def stats(self):
+        """Return entry count and hit/miss counters aggregated across all processes"""
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        lookups = counters.get('hits', 0) + counters.get('misses', 0)
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": counters.get('hits', 0),
+            "misses": counters.get('misses', 0),
+            "evictions": counters.get('evictions', 0),
+            "hit_rate": round(counters.get('hits', 0) / lookups, 4) if lookups else 0.0
+        }
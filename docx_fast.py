@@ -0,0 +1,217 @@
+import datetime
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# Bump when the generated XML changes so cached exports are invalidated
+DOCX_RENDERER_VERSION = "fast-1"
+
+# Pre-serialized package parts. Styles mirror python-docx's default template (Calibri body,
+# Cambria headings) with explicit fonts and colours, so no theme part is needed.
+CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '<Override PartName="/word/settings.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.settings+xml"/>'
+    '<Override PartName="/docProps/core.xml" ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>'
+    '<Override PartName="/docProps/app.xml" ContentType="application/vnd.openxmlformats-officedocument.extended-properties+xml"/>'
+    '</Types>'
+).encode('utf-8')
+
+PACKAGE_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" Target="docProps/core.xml"/>'
+    '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/extended-properties" Target="docProps/app.xml"/>'
+    '</Relationships>'
+).encode('utf-8')
+
+DOCUMENT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/settings" Target="settings.xml"/>'
+    '</Relationships>'
+).encode('utf-8')
+
+STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:docDefaults>'
+    '<w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="Calibri" w:eastAsia="Calibri" w:hAnsi="Calibri" w:cs="Times New Roman"/>'
+    '<w:sz w:val="22"/><w:szCs w:val="22"/>'
+    '<w:lang w:val="en-US" w:eastAsia="en-US" w:bidi="ar-SA"/>'
+    '</w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="200" w:line="276" w:lineRule="auto"/></w:pPr></w:pPrDefault>'
+    '</w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    '<w:style w:type="character" w:default="1" w:styleId="DefaultParagraphFont">'
+    '<w:name w:val="Default Paragraph Font"/><w:uiPriority w:val="1"/><w:semiHidden/><w:unhideWhenUsed/></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Title">'
+    '<w:name w:val="Title"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:uiPriority w:val="10"/><w:qFormat/>'
+    '<w:pPr><w:pBdr><w:bottom w:val="single" w:sz="8" w:space="4" w:color="4F81BD"/></w:pBdr>'
+    '<w:spacing w:after="300" w:line="240" w:lineRule="auto"/><w:contextualSpacing/></w:pPr>'
+    '<w:rPr><w:rFonts w:ascii="Cambria" w:eastAsia="Cambria" w:hAnsi="Cambria" w:cs="Times New Roman"/>'
+    '<w:color w:val="17365D"/><w:spacing w:val="5"/><w:kern w:val="28"/><w:sz w:val="52"/><w:szCs w:val="52"/></w:rPr>'
+    '</w:style>'
+    '<w:style w:type="paragraph" w:styleId="Heading1">'
+    '<w:name w:val="heading 1"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:uiPriority w:val="9"/><w:qFormat/>'
+    '<w:pPr><w:keepNext/><w:keepLines/><w:spacing w:before="480" w:after="0"/><w:outlineLvl w:val="0"/></w:pPr>'
+    '<w:rPr><w:rFonts w:ascii="Cambria" w:eastAsia="Cambria" w:hAnsi="Cambria" w:cs="Times New Roman"/>'
+    '<w:b/><w:bCs/><w:color w:val="365F91"/><w:sz w:val="28"/><w:szCs w:val="28"/></w:rPr>'
+    '</w:style>'
+    '</w:styles>'
+).encode('utf-8')
+
+SETTINGS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:settings xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:zoom w:percent="100"/>'
+    '<w:defaultTabStop w:val="720"/>'
+    '<w:characterSpacingControl w:val="doNotCompress"/>'
+    '<w:compat><w:compatSetting w:name="compatibilityMode" w:uri="http://schemas.microsoft.com/office/word" w:val="14"/></w:compat>'
+    '<w:decimalSymbol w:val="."/><w:listSeparator w:val=","/>'
+    '</w:settings>'
+).encode('utf-8')
+
+APP_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+    '<Application>SOP Generator</Application>'
+    '</Properties>'
+).encode('utf-8')
+
+CORE_XML_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+    'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    '<dc:title>{title}</dc:title>'
+    '<dc:creator>{author}</dc:creator>'
+    '<cp:revision>1</cp:revision>'
+    '<dcterms:created xsi:type="dcterms:W3CDTF">{timestamp}</dcterms:created>'
+    '<dcterms:modified xsi:type="dcterms:W3CDTF">{timestamp}</dcterms:modified>'
+    '</cp:coreProperties>'
+)
+
+DOCUMENT_XML_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+)
+
+# Letter page; the SOP layout uses 1 inch margins, app_web keeps python-docx's template margins
+SOP_SECTION_XML = (
+    '<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" w:header="720" w:footer="720" w:gutter="0"/>'
+    '<w:cols w:space="720"/><w:docGrid w:linePitch="360"/></w:sectPr>'
+)
+WEB_SECTION_XML = (
+    '<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1800" w:bottom="1440" w:left="1800" w:header="720" w:footer="720" w:gutter="0"/>'
+    '<w:cols w:space="720"/><w:docGrid w:linePitch="360"/></w:sectPr>'
+)
+DOCUMENT_XML_END = '</w:body></w:document>'
+
+# Paragraph shells for the app.generate_docx layout (13pt body and headings, 15pt underlined title)
+SOP_TITLE_XML = (
+    '<w:p><w:pPr><w:jc w:val="center"/></w:pPr>'
+    '<w:r><w:rPr><w:b/><w:sz w:val="30"/><w:u w:val="single"/></w:rPr><w:t>STATEMENT OF PURPOSE</w:t></w:r></w:p>'
+    '<w:p/>'
+)
+SOP_HEADING_START = '<w:p><w:pPr><w:jc w:val="left"/></w:pPr><w:r><w:rPr><w:b/><w:sz w:val="26"/></w:rPr>'
+SOP_CONTENT_START = '<w:p><w:pPr><w:jc w:val="both"/></w:pPr><w:r><w:rPr><w:sz w:val="26"/></w:rPr>'
+RUN_END = '</w:r></w:p>'
+
+# Paragraph shells for the app_web.generate_word_doc layout (built-in Title / Heading 1 styles)
+WEB_TITLE_XML = '<w:p><w:pPr><w:pStyle w:val="Title"/></w:pPr><w:r><w:t>STATEMENT OF PURPOSE</w:t></w:r></w:p>'
+WEB_HEADING_START = '<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr><w:r>'
+WEB_PARAGRAPH_START = '<w:p><w:r>'
+
+# Characters XML 1.0 cannot carry; python-docx rejects them, we drop them
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+RUN_BREAKS = re.compile(r'([\r\n\t])')
+
+
+def run_text_xml(text):
+    """Escape text for a run; like python-docx, every tab becomes <w:tab/> and every CR or LF a <w:br/>"""
+    text = INVALID_XML_CHARS.sub('', text)
+    parts = []
+    for piece in RUN_BREAKS.split(text):
+        if piece == '\t':
+            parts.append('<w:tab/>')
+        elif piece in ('\n', '\r'):
+            parts.append('<w:br/>')
+        elif piece:
+            parts.append(f'<w:t xml:space="preserve">{escape(piece)}</w:t>')
+    return ''.join(parts)
+
+
+def core_properties_xml(title, author):
+    timestamp = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    return CORE_XML_TEMPLATE.format(
+        title=escape(INVALID_XML_CHARS.sub('', title)),
+        author=escape(INVALID_XML_CHARS.sub('', author)),
+        timestamp=timestamp
+    ).encode('utf-8')
+
+
+def write_package(document_xml, core_xml):
+    """Zip the pre-serialized parts and the document body into a .docx stream"""
+    docx_io = io.BytesIO()
+    with zipfile.ZipFile(docx_io, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as package:
+        package.writestr('[Content_Types].xml', CONTENT_TYPES_XML)
+        package.writestr('_rels/.rels', PACKAGE_RELS_XML)
+        package.writestr('word/document.xml', document_xml)
+        package.writestr('word/_rels/document.xml.rels', DOCUMENT_RELS_XML)
+        package.writestr('word/styles.xml', STYLES_XML)
+        package.writestr('word/settings.xml', SETTINGS_XML)
+        package.writestr('docProps/core.xml', core_xml)
+        package.writestr('docProps/app.xml', APP_XML)
+    docx_io.seek(0)
+    return docx_io
+
+
+def render_sop_docx(sop_content, user_name):
+    """Same layout as app.generate_docx, written straight to WordprocessingML"""
+    body = [DOCUMENT_XML_START, SOP_TITLE_XML]
+
+    # Alternate header / content pairs, exactly as generate_docx splits them
+    parts = sop_content.split('\n\n')
+    for i in range(0, len(parts) - 1, 2):
+        body.append(SOP_HEADING_START)
+        body.append(run_text_xml(parts[i]))
+        body.append(RUN_END)
+        body.append(SOP_CONTENT_START)
+        body.append(run_text_xml(parts[i + 1]))
+        body.append(RUN_END)
+
+    body.append(SOP_SECTION_XML)
+    body.append(DOCUMENT_XML_END)
+
+    core_xml = core_properties_xml(f"Statement of Purpose - {user_name}", user_name)
+    return write_package(''.join(body).encode('utf-8'), core_xml)
+
+
+def render_web_docx(sop_content):
+    """Same layout as app_web.generate_word_doc, written straight to WordprocessingML"""
+    body = [DOCUMENT_XML_START, WEB_TITLE_XML]
+
+    for para in sop_content.split('\n\n'):
+        para = para.strip()
+        if not para:
+            continue
+        # All-caps paragraphs are section headings
+        body.append(WEB_HEADING_START if para.upper() == para else WEB_PARAGRAPH_START)
+        body.append(run_text_xml(para))
+        body.append(RUN_END)
+
+    body.append(WEB_SECTION_XML)
+    body.append(DOCUMENT_XML_END)
+
+    return write_package(''.join(body).encode('utf-8'), core_properties_xml("", ""))
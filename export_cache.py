@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class ExportCache:
+    """Content-addressed cache of rendered downloads: a byte-bounded in-memory LRU plus an optional directory tier"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_path=None, disk_max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_bytes // 4  # Larger artifacts skip the memory tier
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = {"memory": 0, "disk": 0}
+        self._misses = 0
+        if disk_path:
+            os.makedirs(disk_path, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    @staticmethod
+    def make_key(sop_content, user_name, fmt, renderer_version):
+        raw = json.dumps([sop_content, user_name, fmt, renderer_version], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached bytes for key, or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._hits["memory"] += 1
+                return data
+
+        data = self._disk_get(key)
+        with self._lock:
+            if data is None:
+                self._misses += 1
+                return None
+            self._hits["disk"] += 1
+        self._memory_set(key, data)
+        return data
+
+    def set(self, key, data):
+        self._memory_set(key, data)
+        self._disk_set(key, data)
+
+    def _memory_set(self, key, data):
+        if len(data) > self.max_item_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= len(self._memory.pop(key))
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _disk_file(self, key):
+        return os.path.join(self.disk_path, f"{key}.bin")
+
+    def _disk_get(self, key):
+        if not self.disk_path:
+            return None
+        path = self._disk_file(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # mtime doubles as the LRU clock
+            return data
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Export cache read failed for {key}: {str(e)}")
+            return None
+
+    def _disk_set(self, key, data):
+        if not self.disk_path:
+            return
+        path = self._disk_file(key)
+        try:
+            # Write then rename so other workers never read a partial file
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"Export cache write failed for {key}: {str(e)}")
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data)
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._prune_disk()
+
+    def _disk_entries(self):
+        entries = []
+        for filename in os.listdir(self.disk_path):
+            if not filename.endswith('.bin'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.disk_path, filename))
+            except FileNotFoundError:
+                continue  # Removed by another worker
+            entries.append((stat.st_mtime, filename, stat.st_size))
+        return entries
+
+    def _prune_disk(self):
+        """Delete least recently used files until the directory is back under 90% of its budget"""
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, _, size in entries)
+        target = self.disk_max_bytes * 0.9
+        for _, filename, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(os.path.join(self.disk_path, filename))
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits["memory"] + self._hits["disk"] + self._misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_enabled": bool(self.disk_path),
+                "disk_bytes": self._disk_bytes if self.disk_path else 0,
+                "hits": dict(self._hits),
+                "misses": self._misses,
+                "hit_rate": round((lookups - self._misses) / lookups, 4) if lookups else 0.0
+            }
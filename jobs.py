@@ -0,0 +1,100 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already queued or running"""
+
+
+class JobManager:
+    """Run long SOP generations on a bounded worker pool and track their progress"""
+
+    def __init__(self, max_workers=2, max_pending=20, retention=3600):
+        self.max_workers = max_workers
+        self.max_pending = max_pending  # Queued + running jobs accepted at once
+        self.retention = retention  # Seconds a finished job stays queryable
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sop-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Queue fn(*args, progress_callback=...) and return the new job id"""
+        with self._lock:
+            self._purge_expired()
+            active = sum(1 for job in self._jobs.values() if job["status"] in ("queued", "running"))
+            if active >= self.max_pending:
+                raise JobQueueFull(f"{active} jobs already in progress")
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "id": job_id,
+                "status": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "progress": {},
+                "result": None,
+                "error": None
+            }
+
+        self._executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id, fn, args):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = "running"
+            job["started_at"] = time.time()
+
+        def progress_callback(key, info):
+            with self._lock:
+                job["progress"][key] = info
+
+        try:
+            result = fn(*args, progress_callback=progress_callback)
+            with self._lock:
+                job["result"] = result
+                job["status"] = "completed" if result.get("success", True) else "failed"
+                job["error"] = result.get("error")
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                job["status"] = "failed"
+                job["error"] = str(e)
+        finally:
+            with self._lock:
+                job["finished_at"] = time.time()
+
+    def get(self, job_id):
+        """Return a snapshot of the job, or None if it is unknown or has expired"""
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = dict(job)
+            snapshot["progress"] = dict(job["progress"])
+
+        end = snapshot["finished_at"] or time.time()
+        snapshot["elapsed"] = round(end - (snapshot["started_at"] or end), 2)
+        if snapshot["finished_at"]:
+            snapshot["expires_in"] = round(snapshot["finished_at"] + self.retention - time.time(), 2)
+        return snapshot
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"max_workers": self.max_workers, "max_pending": self.max_pending, "jobs": counts}
+
+    def _purge_expired(self):
+        # Caller must hold self._lock
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished_at"] is not None and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,220 @@
+import glob
+import json
+import math
+import os
+import re
+import threading
+import time
+import traceback
+
+# Default histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SECTION_LATENCY_BUCKETS = (0.05, 0.1, 0.5, 1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200, 400)
+TOKEN_COUNT_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+SNAPSHOT_FILE = re.compile(r'^metrics_(\d+)(?:_(\w+))?\.json$')
+
+
+def process_start(pid):
+    """Start time of a process from /proc, telling a reused pid apart from the process that had it; None if unknown"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def process_alive(pid, start):
+    """Whether the process that wrote a snapshot is still running"""
+    if start is not None and start != "unknown":
+        return process_start(pid) == start
+    if os.name == 'nt':
+        return True  # os.kill would terminate it; such files are only dropped with the directory
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, registry, name, help_text):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+
+    def inc(self, amount=1, **labels):
+        self.registry.update(self.name, tuple(sorted(labels.items())), lambda value: (value or 0) + amount)
+
+
+class Histogram:
+    def __init__(self, registry, name, help_text, buckets):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if value is None:
+            return
+
+        def add(sample):
+            # [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+            counts, total, count = sample or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts = list(counts)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            return [counts, total + value, count + 1]
+
+        self.registry.update(self.name, tuple(sorted(labels.items())), add)
+
+
+class MetricsRegistry:
+    """Counters and histograms shared across worker processes through one JSON snapshot file per pid
+
+    Snapshots of processes that have exited are deleted when collecting, so a dead worker's counts drop
+    out of the totals (Prometheus treats the drop as a counter reset) instead of being summed forever.
+    """
+
+    def __init__(self, directory=None, flush_interval=5):
+        self.directory = directory  # None keeps metrics in this process only
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._values = {}
+        self._pid = None
+        self._start = None
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def counter(self, name, help_text):
+        metric = Counter(self, name, help_text)
+        self._metrics[name] = metric
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        metric = Histogram(self, name, help_text, buckets)
+        self._metrics[name] = metric
+        return metric
+
+    def _ensure_process(self):
+        # Caller must hold self._lock. A forked worker starts from zero and flushes under its own pid
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._start = process_start(self._pid) or "unknown"
+        self._values = {}
+        if self.directory:
+            threading.Thread(target=self._flush_loop, daemon=True, name="metrics-flush").start()
+
+    def update(self, name, labels, fn):
+        with self._lock:
+            self._ensure_process()
+            samples = self._values.setdefault(name, {})
+            samples[labels] = fn(samples.get(labels))
+
+    def _snapshot(self):
+        with self._lock:
+            self._ensure_process()
+            return {name: [[list(map(list, labels)), value] for labels, value in samples.items()]
+                    for name, samples in self._values.items()}
+
+    def flush(self):
+        """Write this process's values to its snapshot file"""
+        if not self.directory:
+            return
+        snapshot = self._snapshot()
+        path = os.path.join(self.directory, f"metrics_{self._pid}_{self._start}.json")
+        try:
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(f"{path}.tmp", path)
+        except Exception as e:
+            print(f"Could not write metrics snapshot: {str(e)}")
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _collect(self):
+        """Merge every worker's snapshot: counters and histogram buckets are summed"""
+        if not self.directory:
+            return {name: {tuple(map(tuple, labels)): value for labels, value in samples}
+                    for name, samples in self._snapshot().items()}
+
+        self.flush()
+        merged = {}
+        for path in glob.glob(os.path.join(self.directory, "metrics_*.json")):
+            match = SNAPSHOT_FILE.match(os.path.basename(path))
+            if match and not process_alive(int(match.group(1)), match.group(2)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except Exception:
+                traceback.print_exc()
+                continue
+            for name, samples in snapshot.items():
+                target = merged.setdefault(name, {})
+                for labels, value in samples:
+                    labels = tuple(map(tuple, labels))
+                    previous = target.get(labels)
+                    if previous is None:
+                        target[labels] = value
+                    elif isinstance(value, list):
+                        target[labels] = [[a + b for a, b in zip(previous[0], value[0])],
+                                          previous[1] + value[1], previous[2] + value[2]]
+                    else:
+                        target[labels] = previous + value
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        values = self._collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            kind = "histogram" if isinstance(metric, Histogram) else "counter"
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(values.get(name, {}).items()):
+                if kind == "counter":
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (math.inf,), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{format_labels(labels, ('le', format_value(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(round(total, 6))}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,206 @@
+import datetime
+import os
+import re
+import threading
+import time
+import traceback
+
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process warms the models itself
+    fcntl = None
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_keep_alive(value):
+    """Seconds for an Ollama keep_alive value ("30m", "1h", "300", ...); None means forever (negative values)"""
+    value = str(value).strip()
+    if re.fullmatch(r'-?\d+(\.\d+)?', value):
+        seconds = float(value)
+    else:
+        parts = re.findall(r'(-?\d+(?:\.\d+)?)(ms|s|m|h)', value)
+        if not parts:
+            raise ValueError(f"Unrecognised keep_alive value: {value!r}")
+        seconds = sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+    return None if seconds < 0 else seconds
+
+
+def parse_warm_hours(value):
+    """(start_hour, end_hour) from "8-22"; None (always warm) when empty or the whole day ("0-24", "6-6").
+    The range may wrap past midnight ("22-6")"""
+    if not value:
+        return None
+    try:
+        start, end = (int(part) for part in value.split("-"))
+    except ValueError:
+        raise ValueError(f"Warm hours must look like '8-22', got {value!r}")
+    if not 0 <= start <= 23 or not 0 <= end <= 24:
+        raise ValueError(f"Warm hours out of range (start 0-23, end 0-24): {value!r}")
+    if start == end % 24:
+        return None
+    return start, end
+
+
+class ModelWarmer:
+    """Load the configured models on every Ollama host at startup and keep them resident while traffic is expected
+
+    With lock_path only one process per machine warms (whichever holds the flock); the others just
+    count cold starts from the responses they see.
+    """
+
+    def __init__(self, pool, models, keep_alive="30m", interval=600, warm_hours=None, lock_path=None,
+                 load_timeout=300, cold_start_threshold=2.0):
+        self.pool = pool
+        self.models = list(dict.fromkeys(models))
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.warm_hours = parse_warm_hours(warm_hours)
+        self.lock_path = lock_path if fcntl is not None else None
+        self.load_timeout = load_timeout
+        self.cold_start_threshold = cold_start_threshold  # load_duration (seconds) that means the model was not resident
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._lock_file = None
+        self._warm_state = {}  # (host, model) -> result of the last warm-up call
+        self._warm_runs = 0
+        self._cold_starts = {}
+        self._last_cold_start = None
+
+        keep_alive_seconds = parse_keep_alive(keep_alive)
+        if keep_alive_seconds is not None and interval >= keep_alive_seconds:
+            print(f"Warm-up interval {interval}s is not shorter than keep_alive {keep_alive}; models may unload between refreshes")
+
+    def start(self):
+        """Start the background warmer (once per process, so it survives gunicorn forks)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._lock_file = None  # An inherited flock belongs to the parent
+            self._thread = threading.Thread(target=self._run, name="model-warmup", daemon=True)
+            self._thread.start()
+
+    def traffic_expected(self, now=None):
+        if self.warm_hours is None:
+            return True
+        hour = (now or datetime.datetime.now()).hour
+        start, end = self.warm_hours
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def _is_leader(self):
+        if not self.lock_path:
+            return True
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file  # Held for the life of the process
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                if self.traffic_expected() and self._is_leader():
+                    self.warm_once()
+            except Exception:
+                traceback.print_exc()
+            time.sleep(self.interval)
+
+    def warm_once(self):
+        """Load (or refresh keep_alive for) every model on every reachable host; returns the results"""
+        results = []
+        for host in self.pool.hosts:
+            if host.healthy is False:
+                continue
+            for model in self.models:
+                if not host.has_model(model):
+                    continue
+                results.append(self._warm(host, model))
+        with self._lock:
+            self._warm_runs += 1
+        return results
+
+    def _warm(self, host, model):
+        # An empty prompt makes Ollama load the model and return without generating anything
+        payload = {"model": model, "prompt": "", "keep_alive": self.keep_alive, "stream": False}
+        start = time.time()
+        state = {"host": host.base_url, "model": model, "at": start}
+        try:
+            response = host.client.post("/api/generate", payload, read_timeout=self.load_timeout)
+            if response.status_code == 200:
+                load_seconds = (response.json().get("load_duration") or 0) / 1e9
+                state.update(ok=True, load_seconds=round(load_seconds, 3),
+                             was_cold=load_seconds >= self.cold_start_threshold)
+                if state["was_cold"]:
+                    print(f"Warm-up loaded {model} on {host.base_url} in {load_seconds:.1f}s")
+            else:
+                state.update(ok=False, error=f"status {response.status_code}")
+        except requests.exceptions.RequestException as e:
+            state.update(ok=False, error=str(e))
+            print(f"Warm-up of {model} on {host.base_url} failed: {str(e)}")
+        state["seconds"] = round(time.time() - start, 3)
+        with self._lock:
+            self._warm_state[(host.base_url, model)] = state
+        return state
+
+    def record_load(self, model, host_url, load_seconds):
+        """Note the load_duration of a user-facing call; returns True if it was a cold start"""
+        if load_seconds is None or load_seconds < self.cold_start_threshold:
+            return False
+        with self._lock:
+            self._cold_starts[model] = self._cold_starts.get(model, 0) + 1
+            self._last_cold_start = {"model": model, "host": host_url, "load_seconds": round(load_seconds, 3),
+                                     "at": time.time()}
+        print(f"Cold start: {model} on {host_url} took {load_seconds:.1f}s to load")
+        return True
+
+    def loaded_models(self, host):
+        """What a host has in memory right now, from /api/ps"""
+        try:
+            response = host.client.get("/api/ps", read_timeout=5)
+            if response.status_code != 200:
+                return {"error": f"status {response.status_code}"}
+            return {"models": [
+                {field: model.get(field) for field in ("name", "size", "size_vram", "expires_at")}
+                for model in response.json().get("models", [])
+            ]}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return {"error": str(e)}
+
+    def status(self):
+        hosts = []
+        for host in self.pool.hosts:
+            loaded = self.loaded_models(host)
+            names = [model["name"] for model in loaded.get("models", [])]
+            with self._lock:
+                warm = {model: self._warm_state.get((host.base_url, model)) for model in self.models}
+            hosts.append({
+                "url": host.base_url,
+                "loaded": {model: any(model in name for name in names) for model in self.models},
+                "resident": loaded.get("models"),
+                "error": loaded.get("error"),
+                "last_warm": warm
+            })
+        with self._lock:
+            return {
+                "models": self.models,
+                "keep_alive": self.keep_alive,
+                "interval": self.interval,
+                "warm_hours": "-".join(map(str, self.warm_hours)) if self.warm_hours else None,
+                "traffic_expected": self.traffic_expected(),
+                "warming_here": self._lock_file is not None or (not self.lock_path and self._thread is not None),
+                "warm_runs": self._warm_runs,
+                "cold_starts": dict(self._cold_starts),
+                "last_cold_start": self._last_cold_start,
+                "hosts": hosts
+            }
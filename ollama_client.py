@@ -0,0 +1,89 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connection pool configuration for the Ollama backend
+OLLAMA_API_BASE = os.environ.get("OLLAMA_API_BASE", "http://localhost:11434")
+OLLAMA_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", 16))  # Keep-alive connections kept per host
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", 5))
+OLLAMA_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", 120))
+OLLAMA_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", 2))  # Connect failures and 502/503/504 only
+OLLAMA_RETRY_BACKOFF = float(os.environ.get("OLLAMA_RETRY_BACKOFF", 0.5))
+
+
+class OllamaClient:
+    """Keep-alive HTTP client for the Ollama REST API, safe to share between threads"""
+
+    def __init__(self, base_url=OLLAMA_API_BASE, pool_size=OLLAMA_POOL_SIZE,
+                 connect_timeout=OLLAMA_CONNECT_TIMEOUT, read_timeout=OLLAMA_READ_TIMEOUT,
+                 max_retries=OLLAMA_MAX_RETRIES, backoff_factor=OLLAMA_RETRY_BACKOFF):
+        self.base_url = base_url.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        # Never retry reads: a generate call that reached the model must not be sent twice
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=False,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False, max_retries=retry)
+
+        # The session only holds the connection pool; Ollama sets no cookies, so sharing it is thread-safe
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def timeout(self, read_timeout=None):
+        return (self.connect_timeout, read_timeout or self.read_timeout)
+
+    def get(self, path, read_timeout=None):
+        return self.session.get(self.url(path), timeout=self.timeout(read_timeout))
+
+    def post(self, path, payload, read_timeout=None, stream=False):
+        return self.session.post(self.url(path), json=payload, timeout=self.timeout(read_timeout), stream=stream)
+
+    def list_models(self):
+        """Return the names of the models installed on the Ollama host"""
+        response = self.get("/api/tags", read_timeout=self.connect_timeout)
+        response.raise_for_status()
+        return [str(model.get('name', '')) for model in response.json().get('models', [])]
+
+    def generate(self, model, prompt, options=None, read_timeout=None):
+        """Run a non-streaming generate call and return the decoded JSON response"""
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        if options:
+            payload["options"] = options
+        response = self.post("/api/generate", payload, read_timeout=read_timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_ollama_client():
+    """Return the process-wide Ollama client, recreating it after a fork so workers never share sockets"""
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = OllamaClient()
+            _client_pid = os.getpid()
+        return _client
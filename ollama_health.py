@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+import traceback
+
+
+class OllamaHealthMonitor:
+    """Keep the last known Ollama status and refresh it in the background"""
+
+    def __init__(self, probe, ttl=30, refresh_interval=None):
+        self.probe = probe  # Callable returning a status dict like check_ollama_status()
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval or max(ttl / 2, 1)
+        self._status = None
+        self._checked_at = 0.0
+        self._state_lock = threading.Lock()
+        self._probe_lock = threading.RLock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """Start the background refresher (once per process, so it survives gunicorn forks)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._state_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def refresh(self):
+        """Probe Ollama now and store the result"""
+        with self._probe_lock:
+            try:
+                status = self.probe()
+            except Exception as e:
+                traceback.print_exc()
+                status = {
+                    "ollama_running": False,
+                    "model_available": False,
+                    "error": f"Health probe failed: {str(e)}"
+                }
+            with self._state_lock:
+                self._status = status
+                self._checked_at = time.time()
+            return status
+
+    def get_status(self):
+        """Return the last known status, probing synchronously only when it has expired"""
+        self.start()
+        with self._state_lock:
+            status = self._status
+            age = time.time() - self._checked_at
+
+        if status is None or age > self.ttl:
+            # Only one thread probes; the others wait and reuse its result
+            with self._probe_lock:
+                with self._state_lock:
+                    fresh = self._status is not None and time.time() - self._checked_at <= self.ttl
+                if not fresh:
+                    self.refresh()
+            with self._state_lock:
+                status = self._status
+                age = time.time() - self._checked_at
+
+        result = dict(status)
+        result["checked_seconds_ago"] = round(age, 2)
+        return result
+
+    def invalidate(self, reason=None):
+        """Expire the cached status immediately and ask the refresher to re-probe"""
+        with self._state_lock:
+            self._checked_at = 0.0
+        if reason:
+            print(f"Ollama health cache invalidated: {reason}")
+        self._wake.set()
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from circuit_breaker import CircuitBreaker
+from ollama_client import OLLAMA_API_BASE, OllamaClient
+from token_calibration import percentile
+
+# Comma-separated Ollama endpoints; a single OLLAMA_API_BASE host when unset
+OLLAMA_HOSTS = [host.strip() for host in os.environ.get("OLLAMA_HOSTS", OLLAMA_API_BASE).split(",") if host.strip()]
+HOST_LATENCY_WINDOW = 200  # Recent call latencies kept per host for percentiles
+
+
+class OllamaHost:
+    """One Ollama endpoint with its own circuit breaker, last probe result and latency stats"""
+
+    def __init__(self, base_url, failure_threshold, reset_timeout):
+        self.base_url = base_url.rstrip('/')
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        self.in_flight = 0
+        self.healthy = None  # Unknown until the first probe
+        self.models = None
+        self.loaded_models = set()
+        self.checked_at = None
+        self.requests = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=HOST_LATENCY_WINDOW)
+        self._client = None
+        self._client_pid = None
+
+    @property
+    def client(self):
+        # Recreated after a fork so workers never share sockets
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = OllamaClient(base_url=self.base_url)
+            self._client_pid = os.getpid()
+        return self._client
+
+    def has_model(self, model):
+        return self.models is None or any(model in name for name in self.models)
+
+    def has_loaded(self, model):
+        return any(model in name for name in self.loaded_models)
+
+    def routable(self, model):
+        return self.healthy is not False and self.has_model(model) and self.breaker.state != CircuitBreaker.OPEN
+
+    def snapshot(self):
+        latencies = list(self.latencies)
+        return {
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "ejected": self.breaker.state == CircuitBreaker.OPEN or self.healthy is False,
+            "breaker": self.breaker.snapshot(),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "loaded_models": sorted(self.loaded_models),
+            "checked_seconds_ago": round(time.time() - self.checked_at, 2) if self.checked_at else None,
+            "latency": {
+                "mean": round(sum(latencies) / len(latencies), 3),
+                "p50": round(percentile(latencies, 50), 3),
+                "p95": round(percentile(latencies, 95), 3)
+            } if latencies else None
+        }
+
+
+class OllamaHostPool:
+    """Route Ollama calls to the least busy healthy host, preferring hosts that already have the model loaded
+
+    A host is ejected when its breaker opens (consecutive call failures) or a health probe fails, and
+    re-admitted by the breaker's trial call or the next successful probe.
+    """
+
+    def __init__(self, hosts=None, failure_threshold=3, reset_timeout=30):
+        self.hosts = [OllamaHost(url, failure_threshold, reset_timeout) for url in (hosts or OLLAMA_HOSTS)]
+        self._lock = threading.Lock()
+
+    def acquire(self, model):
+        """Pick a host for one call and count it in flight; None when every host is ejected"""
+        with self._lock:
+            candidates = sorted(
+                (host for host in self.hosts if host.routable(model)),
+                key=lambda host: (not host.has_loaded(model), host.in_flight,
+                                  percentile(list(host.latencies), 50) if host.latencies else 0)
+            )
+            # Probe-failed hosts still get their breaker's trial call once nothing else is left
+            candidates += [host for host in self.hosts if host not in candidates and host.has_model(model)]
+            for host in candidates:
+                if host.breaker.allow_request():
+                    host.in_flight += 1
+                    return host
+        return None
+
+    def release(self, host, success, latency=None, model=None, count_failure=True, responded=False):
+        """Finish a call started with acquire(); count_failure=False for errors that are not the host's fault,
+        responded=True when such an error still came back as an HTTP response from the host"""
+        with self._lock:
+            host.in_flight -= 1
+            host.requests += 1
+            if latency is not None and success:
+                host.latencies.append(latency)
+            if success:
+                if model:
+                    host.loaded_models.add(model)  # It is now, whatever the last probe said
+                host.healthy = True
+            elif count_failure:
+                host.failures += 1
+        if success:
+            host.breaker.record_success()
+        elif count_failure:
+            host.breaker.record_failure()
+        elif responded:
+            host.breaker.record_success()  # Reachable, so close a half-open trial
+        else:
+            host.breaker.release_trial()  # Says nothing about the host: neither close nor open its breaker
+
+    def record_probe(self, host, status):
+        with self._lock:
+            host.checked_at = time.time()
+            host.healthy = status.get("ollama_running", False)
+            if host.healthy:
+                host.models = status.get("models", [])
+                host.loaded_models = set(status.get("loaded_models", []))
+
+    def probe(self, probe_host):
+        """Run probe_host(host) on every host in parallel and return {url: status}"""
+        def run(host):
+            status = probe_host(host)
+            self.record_probe(host, status)
+            return host.base_url, status
+
+        if len(self.hosts) == 1:
+            return dict([run(self.hosts[0])])
+        with ThreadPoolExecutor(max_workers=len(self.hosts), thread_name_prefix="ollama-probe") as executor:
+            return dict(executor.map(run, self.hosts))
+
+    @property
+    def state(self):
+        """Breaker state of the pool as a whole: open only when every host is ejected"""
+        states = [host.breaker.state for host in self.hosts if host.healthy is not False]
+        if CircuitBreaker.CLOSED in states:
+            return CircuitBreaker.CLOSED
+        if CircuitBreaker.HALF_OPEN in states:
+            return CircuitBreaker.HALF_OPEN
+        return CircuitBreaker.OPEN
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "hosts": [host.snapshot() for host in self.hosts]}
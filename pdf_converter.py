@@ -0,0 +1,389 @@
+import atexit
+import json
+import os
+import queue
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from pathlib import Path
+
+try:
+    import uno  # Only available with LibreOffice's Python bindings (python3-uno)
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+WINDOWS_SOFFICE_PATHS = [
+    r"C:\Program Files\LibreOffice\program\soffice.exe",
+    r"C:\Program Files (x86)\LibreOffice\program\soffice.exe"
+]
+
+# Interpreters that may be able to import uno when this one (typically a venv) cannot
+SYSTEM_UNO_PYTHONS = ["/usr/bin/python3", "/usr/local/bin/python3"]
+
+
+class PdfConversionError(Exception):
+    """Raised when a document could not be converted to PDF"""
+
+
+def find_soffice():
+    """Return the LibreOffice executable, or None if it is not installed"""
+    if os.name == 'nt':
+        for path in WINDOWS_SOFFICE_PATHS:
+            if os.path.exists(path):
+                return path
+        return None
+    return shutil.which('soffice') or shutil.which('libreoffice')
+
+
+def find_uno_python(soffice):
+    """Return a Python that can import uno (SOP_UNO_PYTHON, LibreOffice's bundled one, or the system one), or None"""
+    program_dir = os.path.dirname(os.path.realpath(soffice))
+    candidates = [os.environ.get("SOP_UNO_PYTHON"),
+                  os.path.join(program_dir, "python.exe" if os.name == 'nt' else "python"),
+                  os.path.join(program_dir, "..", "Resources", "python")]  # macOS app bundle
+    candidates += SYSTEM_UNO_PYTHONS if os.name != 'nt' else []
+    for candidate in candidates:
+        if not candidate or not os.path.exists(candidate):
+            continue
+        try:
+            subprocess.run([candidate, "-c", "import uno"], check=True, timeout=15,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return candidate
+        except (OSError, subprocess.SubprocessError):
+            continue
+    return None
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def uno_property(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class Converter:
+    """One converter slot: a long-lived headless soffice on a local socket, with its own profile
+
+    mode "uno" drives soffice from this process; "bridge" runs this module under uno_python (see
+    run_bridge) and sends it one conversion per line, so a venv without uno keeps warm converters;
+    "spawn" starts a fresh soffice --convert-to per document.
+    """
+
+    def __init__(self, slot, soffice, profile_dir, startup_timeout, mode=None, uno_python=None):
+        self.slot = slot
+        self.soffice = soffice
+        self.profile_dir = profile_dir
+        self.startup_timeout = startup_timeout
+        self.mode = mode or ("uno" if uno is not None else "spawn")
+        self.uno_python = uno_python
+        self.process = None
+        self.port = None
+        self.desktop = None
+        self.conversions = 0
+        self.restarts = 0
+        self.started = False
+
+    def base_args(self):
+        # A private profile per slot lets several instances run side by side and stays warm between uses
+        return [self.soffice, '--headless', '--invisible', '--nologo', '--norestore', '--nodefault',
+                f"-env:UserInstallation={Path(self.profile_dir).as_uri()}"]
+
+    def healthy(self):
+        if self.mode == "spawn":
+            return True  # No resident process to check
+        if self.mode == "bridge":
+            return self.process is not None and self.process.poll() is None
+        if self.process is None or self.process.poll() is not None or self.desktop is None:
+            return False
+        try:
+            self.desktop.getCurrentComponent()
+            return True
+        except Exception:
+            return False
+
+    def start(self):
+        if self.mode == "spawn":
+            return
+        if self.started:
+            self.restarts += 1
+        self.started = True
+        self.conversions = 0
+        if self.mode == "bridge":
+            self._start_bridge()
+            return
+        self.port = free_port()
+        self.process = subprocess.Popen(
+            self.base_args() + [f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context)
+        deadline = time.time() + self.startup_timeout
+        while True:
+            try:
+                context = resolver.resolve(
+                    f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext")
+                self.desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+                print(f"PDF converter {self.slot} started (pid {self.process.pid}, port {self.port})")
+                return
+            except Exception:
+                if self.process.poll() is not None or time.time() > deadline:
+                    self.stop()
+                    raise PdfConversionError(f"LibreOffice converter {self.slot} did not start")
+                time.sleep(0.25)
+
+    def _start_bridge(self):
+        # Its own session, so stop() can kill the bridge together with the soffice it started
+        self.process = subprocess.Popen(
+            [self.uno_python, os.path.abspath(__file__), "--bridge", self.soffice, self.profile_dir,
+             str(self.startup_timeout)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, start_new_session=os.name != 'nt'
+        )
+        reply = self._bridge_reply(self.startup_timeout + 5)
+        if not reply.get("ready"):
+            self.stop()
+            raise PdfConversionError(f"LibreOffice converter {self.slot} did not start: {reply.get('error')}")
+        print(f"PDF converter {self.slot} started through {self.uno_python} (pid {self.process.pid})")
+
+    def _bridge_reply(self, timeout):
+        """Read one reply line from the bridge, killing it if none arrives within timeout"""
+        watchdog = threading.Timer(timeout, self.stop)
+        watchdog.start()
+        try:
+            line = self.process.stdout.readline()
+        except (OSError, ValueError, AttributeError):
+            line = ""
+        finally:
+            watchdog.cancel()
+        if not line:
+            return {"error": "the converter exited or timed out"}
+        return json.loads(line)
+
+    def stop(self):
+        process = self.process
+        if process is not None and self.mode == "bridge" and os.name != 'nt':
+            try:
+                os.killpg(process.pid, signal.SIGKILL)  # Even if the bridge died, its soffice may not have
+            except OSError:
+                pass
+        if process is not None and process.poll() is None:
+            try:
+                process.kill()
+                process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        if self.process is process:  # A watchdog may finish after the converter was already restarted
+            self.process = None
+            self.desktop = None
+
+    def convert(self, docx_path, pdf_path, timeout):
+        """Convert docx_path to pdf_path, killing the converter if it takes longer than timeout"""
+        if self.mode == "bridge":
+            try:
+                self.process.stdin.write(json.dumps({"docx": docx_path, "pdf": pdf_path, "timeout": timeout}) + "\n")
+                self.process.stdin.flush()
+            except (OSError, AttributeError) as e:
+                raise PdfConversionError(f"PDF converter {self.slot} is not running: {str(e)}")
+            reply = self._bridge_reply(timeout + 5)
+            if not reply.get("ok"):
+                raise PdfConversionError(reply.get("error") or "Conversion failed")
+        elif self.mode == "spawn":
+            subprocess.run(self.base_args() + ['--convert-to', 'pdf', '--outdir', os.path.dirname(pdf_path), docx_path],
+                           check=True, timeout=timeout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            # A hung document would block the UNO call forever; killing soffice makes it raise instead
+            watchdog = threading.Timer(timeout, self.stop)
+            watchdog.start()
+            try:
+                document = self.desktop.loadComponentFromURL(
+                    uno.systemPathToFileUrl(docx_path), "_blank", 0, (uno_property("Hidden", True),))
+                try:
+                    document.storeToURL(uno.systemPathToFileUrl(pdf_path),
+                                        (uno_property("FilterName", "writer_pdf_Export"),))
+                finally:
+                    document.close(True)
+            finally:
+                watchdog.cancel()
+        self.conversions += 1
+
+
+class PdfConverterPool:
+    """Share a fixed number of warm LibreOffice converters between concurrent PDF requests"""
+
+    def __init__(self, size=2, convert_timeout=60, queue_timeout=30, startup_timeout=30, recycle_after=200):
+        self.size = size
+        self.convert_timeout = convert_timeout  # Seconds one conversion may take before its converter is killed
+        self.queue_timeout = queue_timeout  # Seconds a request waits for a free converter
+        self.startup_timeout = startup_timeout
+        self.recycle_after = recycle_after  # Restart a converter after this many conversions to bound its memory
+        self.soffice = find_soffice()
+        self.uno_python = None
+        if uno is None and self.soffice is not None:
+            self.uno_python = find_uno_python(self.soffice)
+            if self.uno_python is None:
+                print("No Python with LibreOffice's uno module found (set SOP_UNO_PYTHON); PDFs start a new soffice each")
+        self._idle = None
+        self._converters = []
+        self._profile_root = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._conversions = 0
+        self._failures = 0
+        self._convert_time = 0.0
+        atexit.register(self.shutdown)
+
+    @property
+    def mode(self):
+        if uno is not None:
+            return "uno"
+        return "bridge" if self.uno_python else "spawn"
+
+    def _ensure_pool(self):
+        # Converters belong to the process that started them; a forked worker builds its own
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._profile_root = tempfile.mkdtemp(prefix="sop_soffice_")
+            self._converters = [
+                Converter(slot, self.soffice, os.path.join(self._profile_root, f"slot{slot}"), self.startup_timeout,
+                          mode=self.mode, uno_python=self.uno_python)
+                for slot in range(self.size)
+            ]
+            self._idle = queue.Queue()
+            for converter in self._converters:
+                self._idle.put(converter)
+
+    def convert(self, docx_bytes):
+        """Return the PDF bytes for a DOCX document, or raise PdfConversionError"""
+        if self.soffice is None:
+            raise PdfConversionError("LibreOffice is not installed")
+        self._ensure_pool()
+
+        with self._lock:
+            self._waiting += 1
+        try:
+            converter = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            raise PdfConversionError(f"No PDF converter free after {self.queue_timeout}s")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        start_time = time.time()
+        try:
+            if self.recycle_after and converter.conversions >= self.recycle_after:
+                converter.stop()
+            if not converter.healthy():
+                converter.stop()
+                converter.start()
+
+            # The temp dir is removed whatever happens to the conversion
+            with tempfile.TemporaryDirectory(prefix="sop_pdf_") as temp_dir:
+                docx_path = os.path.join(temp_dir, "SOP.docx")
+                pdf_path = os.path.join(temp_dir, "SOP.pdf")
+                with open(docx_path, 'wb') as f:
+                    f.write(docx_bytes)
+
+                converter.convert(docx_path, pdf_path, self.convert_timeout)
+
+                if not os.path.exists(pdf_path):
+                    raise PdfConversionError("LibreOffice produced no PDF")
+                with open(pdf_path, 'rb') as f:
+                    pdf_data = f.read()
+
+            with self._lock:
+                self._conversions += 1
+                self._convert_time += time.time() - start_time
+            return pdf_data
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+            if not isinstance(e, PdfConversionError):
+                traceback.print_exc()
+            # Assume the converter is broken; it is restarted on its next checkout
+            converter.stop()
+            raise e if isinstance(e, PdfConversionError) else PdfConversionError(str(e))
+        finally:
+            self._idle.put(converter)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "available": self.soffice is not None,
+                "mode": self.mode,
+                "size": self.size,
+                "idle": self._idle.qsize() if self._idle is not None and self._pid == os.getpid() else self.size,
+                "waiting": self._waiting,
+                "conversions": self._conversions,
+                "failures": self._failures,
+                "restarts": sum(converter.restarts for converter in self._converters),
+                "avg_convert_time": round(self._convert_time / self._conversions, 3) if self._conversions else None
+            }
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+        for converter in self._converters:
+            converter.stop()
+        if self._profile_root:
+            shutil.rmtree(self._profile_root, ignore_errors=True)
+
+
+def run_bridge(soffice, profile_dir, startup_timeout):
+    """Serve conversions for a Converter in bridge mode: one JSON request per stdin line, one reply per stdout line.
+    Runs under a Python that can import uno, started by the app's own interpreter."""
+    channel = sys.stdout
+    sys.stdout = sys.stderr  # Keep the converter's own prints out of the reply stream
+
+    def reply(**message):
+        channel.write(json.dumps(message) + "\n")
+        channel.flush()
+
+    converter = Converter("bridge", soffice, profile_dir, startup_timeout)
+    try:
+        converter.start()
+    except Exception as e:
+        reply(ready=False, error=str(e))
+        return
+    reply(ready=True)
+    try:
+        for line in sys.stdin:
+            request = json.loads(line)
+            try:
+                if not converter.healthy():
+                    converter.stop()
+                    converter.start()
+                converter.convert(request["docx"], request["pdf"], request["timeout"])
+                reply(ok=True)
+            except Exception as e:
+                converter.stop()  # Restarted on the next request
+                reply(ok=False, error=str(e))
+    finally:
+        converter.stop()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 5 and sys.argv[1] == "--bridge":
+        if uno is None:
+            print(json.dumps({"ready": False, "error": f"{sys.executable} cannot import uno"}), flush=True)
+            sys.exit(1)
+        run_bridge(sys.argv[2], sys.argv[3], float(sys.argv[4]))
+    else:
+        sys.exit("Usage: python pdf_converter.py --bridge SOFFICE PROFILE_DIR STARTUP_TIMEOUT")
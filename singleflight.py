@@ -0,0 +1,210 @@
+import glob
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescing stays within one process
+    fcntl = None
+
+SHARED_FILE_MAX_AGE = 3600  # Seconds before leftover lock/wait/result files are pruned
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one; callers arriving while it runs share its result
+
+    grace keeps a finished result shareable for a few more seconds (a retry landing just after the
+    original finished). With shared_dir, leaders in different processes also take turns on an flock per
+    key and hand the result over through a JSON file, so results must be JSON-serializable there. That
+    file is only written while another process is waiting or within the grace window, and is deleted
+    once nobody can use it. Results failing shareable(result) reach callers already waiting on them, but
+    are never kept for the grace window or written to disk.
+    """
+
+    def __init__(self, shared_dir=None, grace=0, shareable=None):
+        self.shared_dir = shared_dir if fcntl is not None else None
+        self.grace = grace
+        self.shareable = shareable or (lambda result: True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._leaders = 0
+        self._shared = 0
+        self._last_prune = 0.0
+        if self.shared_dir:
+            os.makedirs(self.shared_dir, exist_ok=True)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The parent's in-flight calls have no thread in the child to finish them
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """Return (result, shared): shared is True when another caller's computation was reused"""
+        with self._lock:
+            self._expire()
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        shared = False
+        try:
+            call.result, shared = self._run(key, fn, args, kwargs)
+            return call.result, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.finished_at = time.time()
+            call.done.set()
+            with self._lock:
+                if shared:
+                    self._shared += 1
+                else:
+                    self._leaders += 1
+                if call.error is not None or self.grace <= 0 or not self.shareable(call.result):
+                    self._calls.pop(key, None)
+
+    def _expire(self):
+        # Caller must hold self._lock
+        if self.grace <= 0:
+            return
+        now = time.time()
+        for key in [key for key, call in self._calls.items()
+                    if call.finished_at is not None and now - call.finished_at > self.grace]:
+            del self._calls[key]
+
+    def _run(self, key, fn, args, kwargs):
+        if not self.shared_dir:
+            return fn(*args, **kwargs), False
+
+        path = os.path.join(self.shared_dir, key)
+        # Announces this caller to a leader computing the key in another process
+        wait_path = f"{path}.{os.getpid()}.{threading.get_ident()}.wait"
+        wait_start = time.time()
+        open(wait_path, 'a').close()
+        try:
+            with open(f"{path}.lock", 'a') as lock_file:
+                os.utime(f"{path}.lock")  # Keeps files in use away from the pruner
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # Waits while another process computes this key
+                try:
+                    result = self._read_shared(f"{path}.json", since=wait_start - self.grace)
+                    if result is not None:
+                        return result, True
+                    result = fn(*args, **kwargs)
+                    if self.shareable(result) and (self.grace > 0 or self._waiters(path, wait_path)):
+                        self._write_shared(f"{path}.json", result)
+                    return result, False
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            self._remove(wait_path)
+            self._discard_shared(path)
+            self._prune()
+
+    @staticmethod
+    def _waiters(path, own_wait_path):
+        return [wait_path for wait_path in glob.glob(f"{glob.escape(path)}.*.wait") if wait_path != own_wait_path]
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _discard_shared(self, path):
+        """Delete a shared result nobody can use any more: no process is waiting and the grace window is over"""
+        result_path = f"{path}.json"
+        try:
+            written_at = os.path.getmtime(result_path)
+        except FileNotFoundError:
+            return
+        if self._waiters(path, None):
+            return  # The last waiter deletes it
+        remaining = written_at + self.grace - time.time()
+        if remaining <= 0:
+            self._remove(result_path)
+            return
+
+        def discard_if_unchanged():
+            try:
+                if os.path.getmtime(result_path) == written_at and not self._waiters(path, None):
+                    os.remove(result_path)
+            except FileNotFoundError:
+                pass
+        timer = threading.Timer(remaining + 0.1, discard_if_unchanged)
+        timer.daemon = True
+        timer.start()
+
+    @staticmethod
+    def _read_shared(path, since):
+        """The result another process wrote after `since`, or None"""
+        try:
+            if os.path.getmtime(path) < since:
+                return None
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Could not read shared result {path}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _write_shared(path, result):
+        try:
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f)
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"Could not share result {path}: {str(e)}")
+
+    def _prune(self):
+        """Delete files nobody has touched for an hour, and results left behind by a process that exited
+        before discarding them (at most once a minute)"""
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for filename in os.listdir(self.shared_dir):
+            path = os.path.join(self.shared_dir, filename)
+            try:
+                age = now - os.path.getmtime(path)
+                if age > SHARED_FILE_MAX_AGE:
+                    os.remove(path)
+                elif filename.endswith(".json") and age > self.grace and not self._waiters(path[:-len(".json")], None):
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": sum(1 for call in self._calls.values() if call.finished_at is None),
+                "computed": self._leaders,
+                "shared": self._shared,
+                "shared_across_processes": bool(self.shared_dir),
+                "grace": self.grace
+            }
@@ -1,4 +1,6 @@
+import itertools
 import re
+import string
 
 # SOP section instructions/templates - simplified for clarity
 sop_instructions = {
@@ -13,170 +15,197 @@ sop_instructions = {
     "Conclusion": "Summary of purpose and commitment to returning home."
 }
 
-def generate_introduction(user_data):
-    name = user_data.get("name", "")
-    address = user_data.get("address", "")
-    university = user_data.get("university_name", "")
-    course = user_data.get("course", "")
-    intake = user_data.get("intake", "")
-    country = user_data.get("country", "")
-    
-    # Extract state from address if possible
+# Section templates shared by the generate_* functions and the compiled batch renderer
+INTRODUCTION_TEMPLATE = "Respected Sir/Ma'am,\n\nI, {name}, am a resident of {state}, India. I am writing this Statement of Purpose to outline my academic and professional goals for the {course} program at {university}, {country} for the {intake} intake."
+
+ACADEMIC_TEMPLATE = "My academic journey began with my 10th-grade education from {tenth_board} in {tenth_year}, where I achieved {tenth_marks}%, reflecting my commitment to academic excellence. I continued my education with 12th grade from {twelfth_board} in {twelfth_year}, securing {twelfth_marks}%, which provided me with a strong foundation for higher studies."
+ACADEMIC_BACHELORS_TEMPLATE = " I further pursued a {bachelors_degree} from {bachelors_college} {bachelors_result}, which equipped me with the necessary knowledge and skills in my field. This academic background has prepared me well for the advanced studies I now wish to pursue."
+
+LANGUAGE_IELTS_TEMPLATE = "To demonstrate my English language proficiency, I took the IELTS examination and achieved an overall score of {overall}, with individual scores of {listening} in Listening, {speaking} in Speaking, {writing} in Writing, and {reading} in Reading."
+LANGUAGE_PTE_TEMPLATE = "To demonstrate my English language proficiency, I took the PTE examination and achieved an overall score of {overall}, with individual scores of {speaking} in Speaking, {reading} in Reading, {writing} in Writing, and {listening} in Listening."
+LANGUAGE_HIGH_PROFICIENCY = " These scores reflect my strong command of the English language, which will enable me to excel in academic discussions, research work, and professional communication during my studies abroad. My proficiency will allow me to fully engage with the curriculum, contribute meaningfully to class discussions, and produce high-quality academic work."
+LANGUAGE_STANDARD_PROFICIENCY = " These scores demonstrate my ability to communicate effectively in English, which is sufficient for academic coursework, assignments, and interactions in an international learning environment. I am confident that my language skills will allow me to understand lectures, participate in discussions, and complete written assignments successfully throughout my program."
+
+PROGRAM_BACKGROUND_TEMPLATE = "My academic background in {bachelors_background} has naturally led me to pursue {course}. Throughout my education, I developed a strong interest in this field through coursework and projects that challenged me to apply theoretical knowledge to practical problems."
+PROGRAM_WORK_EXPERIENCE_TEMPLATE = " Additionally, my professional experience in {work_experience} has provided me with valuable insights into the industry. Through this experience, I gained essential skills and realized the need for specialized knowledge that this program offers to advance in my career."
+PROGRAM_SKILLS_TEMPLATE = "The {course} program will equip me with several crucial skill sets essential for success in this field. I expect to develop advanced critical thinking and analytical abilities that will help me assess complex problems logically and systematically. The program will enhance my problem-solving capabilities, preparing me to develop innovative solutions to challenges in my field. Furthermore, I will gain practical competencies that ensure I can apply theoretical knowledge in real-world scenarios. The development of communication and leadership skills will also enable me to collaborate effectively in professional settings, present ideas persuasively, and lead teams toward achieving organizational goals."
+PROGRAM_CAREER_PARAGRAPH = "Upon completing this program, my career prospects and earning potential will significantly improve. The industry related to this field is experiencing substantial growth, with a projected 15% increase in job opportunities over the next five years. According to recent industry reports, professionals with specialized education in this field earn 25-30% higher salaries compared to those with only undergraduate degrees. The employment landscape shows a growing demand for skilled professionals who can navigate the evolving technological landscape and complex market challenges. The average starting salary for graduates from this program ranges from $60,000 to $75,000 annually, with potential for significant growth as experience increases. Completing this program will position me competitively in the job market and provide me with the credentials necessary for advancement in this dynamic and rewarding field."
+
+FINANCIAL_TEMPLATE = "I have made comprehensive financial arrangements to support my education abroad. My funding will primarily come from my parents, with my father earning {father_income} annually and my mother earning {mother_income} annually. They have accumulated liquid funds of {father_funds} in my father's account and {mother_funds} in my mother's account specifically to support my education."
+FINANCIAL_DEPOSITS_TEMPLATE = " Additionally, we have fixed deposits worth {fixed_deposits}, which further strengthen our financial position."
+FINANCIAL_CLOSING = " These resources will comfortably cover my tuition fees, living expenses, and other costs associated with my education abroad. My family's stable financial background, including various movable and immovable assets, ensures that I have a strong financial backup throughout my program. This financial security will allow me to focus entirely on my studies without any financial concerns."
+
+COUNTRY_CHOICE_TEMPLATE = (
+    "{country} is renowned for its commitment to multiculturalism and inclusivity, creating an ideal environment for international students like me. The educational institutions in {country} offer excellent support to international students through dedicated international student offices that assist with visa processes, orientation, and integration into campus life. Academic support centers provide essential tutoring and counseling to help students transition smoothly into the {country}'s educational system. Additionally, language support programs are designed to enhance students' proficiency and confidence in English, ensuring effective communication throughout their academic journey."
+    "\n\n"
+    "When comparing {country} with other popular study destinations, several factors make it particularly attractive. Financially, {country} offers more competitive tuition fees and a lower cost of living compared to countries like the United States or the United Kingdom, making quality education more accessible. {country} is home to several world-class universities consistently ranked among the top 100 globally, offering cutting-edge research opportunities and faculty comprising leading experts in various fields. The country's reputation for safety is exemplary, with crime rates significantly lower than many other developed nations. The standard of living is exceptional, with excellent healthcare, transportation, and public services. Furthermore, {country}'s rich cultural heritage and diverse population provide unique opportunities for personal growth through exposure to various traditions and perspectives. These compelling factors have collectively influenced my decision to choose {country} as the ideal destination for my academic and professional aspirations."
+)
+
+CAREER_OPPORTUNITIES_TEMPLATE = (
+    "The {course} program will significantly enhance my long-term career prospects in India, which has a rapidly growing industry in this field. According to recent industry reports, this sector is projected to grow at a compound annual growth rate (CAGR) of 12-15% over the next decade in India. This growth is driven by increasing digitalization, government initiatives, and foreign investments. Professionals with specialized education in this field are expected to see their earning potential increase by 25-30% within five years of experience. The program will equip me with the advanced skills needed to pursue senior-level positions, leadership roles, or entrepreneurial ventures. India's market is expected to create over 200,000 new jobs in this sector by 2025, with salaries for experienced professionals ranging from ₹15-25 lakhs annually. The knowledge and credentials gained from this program will significantly enhance my career stability and opportunities for advancement in India's competitive job market."
+    "\n\n"
+    "Upon returning to India after completing the {course} program, I will have numerous immediate career opportunities. I can pursue roles such as Project Manager, Solutions Architect, Business Analyst, or Technical Consultant, depending on my specialization within the program. Major multinational corporations operating in India, including TCS, Infosys, Wipro, and HCL Technologies, actively recruit professionals with international qualifications in this field. Additionally, Indian companies like Reliance Industries, Bharti Airtel, and Tech Mahindra offer excellent opportunities. The average starting salary for graduates with international qualifications in this field ranges from ₹8-12 lakhs per annum in major Indian cities, which is approximately 30% higher than those with only domestic qualifications. According to a 2023 industry survey, 85% of graduates with international degrees in this field secure employment within three months of returning to India. The skills and global perspective gained from studying abroad make candidates particularly attractive to employers looking to expand their international operations or implement global best practices."
+)
+
+FAMILY_TIES_PARAGRAPHS = (
+    "My strong family ties in India serve as a primary motivation for my return after completing my education abroad. I come from a close-knit family where I have significant responsibilities toward my parents and other family members. My family has supported me throughout my educational journey, and I feel a deep sense of responsibility to return and be present for them. Additionally, my family has established assets and investments that require my attention and management in the future, further necessitating my return to India."
+    "\n\n"
+    "Beyond family responsibilities, I have profound emotional and cultural ties to India that strengthen my resolve to return. Having been raised in India, I share a deep connection with its cultural values, traditions, and social fabric. The sense of belonging I feel in my community and the established social networks I have developed over the years form an integral part of my identity. These cultural bonds are irreplaceable and reinforce my intention to return home after completing my studies abroad. The familiarity with the local customs, languages, and way of life makes India the place where I can truly thrive both personally and professionally."
+    "\n\n"
+    "From a professional standpoint, India offers me exceptional career opportunities that align perfectly with my educational goals. The knowledge and skills I will gain through my international education will be particularly valuable in the Indian market, where there is a growing demand for professionals with global exposure and specialized expertise. The rapidly developing economy and expanding industry sectors in India provide fertile ground for applying my international education to contribute meaningfully to local organizations and the broader economy. I am enthusiastic about the prospect of bringing back cutting-edge knowledge and best practices to contribute to India's growth story. My international education will enable me to act as a bridge between global innovations and local implementation, creating value for employers and the economy in my home country."
+)
+
+CONCLUSION_TEMPLATE = "My sole purpose for studying in {country} is to gain quality education in {course}. I am firmly committed to returning to India after completing my studies due to my strong family ties, promising career prospects in India, and responsibilities toward managing family assets. This program will significantly enhance my professional profile and help me achieve both my career and personal goals. I am grateful for the opportunity to pursue my education in {country} and look forward to contributing positively to my industry upon my return to India."
+
+# Section titles in document order, as used by generate_sop
+SOP_TITLES = [
+    "RESPECTED SIR/MA'AM",
+    "ACADEMIC BACKGROUND",
+    "LANGUAGE PROFICIENCY",
+    "PROGRAM RELEVANCE",
+    "FINANCIAL BACKGROUND",
+    "WHY I CHOOSE THIS COUNTRY FOR MY STUDIES",
+    "CAREER OPPORTUNITIES IN MY COUNTRY AFTER COMPLETING THE PROGRAM",
+    "MY FAMILY TIES AND RETURN TO HOME COUNTRY",
+    "CONCLUSION"
+]
+
+def extract_state(address):
+    """Extract the state from an address of the form '..., state, country'"""
     state = ""
     if address:
         address_parts = address.split(",")
         if len(address_parts) >= 2:
             state = address_parts[-2].strip()
-    
-    intro = f"Respected Sir/Ma'am,\n\nI, {name}, am a resident of {state}, India. I am writing this Statement of Purpose to outline my academic and professional goals for the {course} program at {university}, {country} for the {intake} intake."
+    return state
+
+def has_high_proficiency(test_type, overall):
+    """IELTS 7.0+ or PTE 65+ counts as high proficiency"""
+    threshold = 7.0 if test_type == "IELTS" else 65
+    try:
+        overall_float = float(overall) if overall else 0
+        return overall_float >= threshold
+    except ValueError:
+        return False
+
+def generate_introduction(user_data):
+    intro = INTRODUCTION_TEMPLATE.format(
+        name=user_data.get("name", ""),
+        state=extract_state(user_data.get("address", "")),
+        course=user_data.get("course", ""),
+        university=user_data.get("university_name", ""),
+        country=user_data.get("country", ""),
+        intake=user_data.get("intake", "")
+    )
     
     return intro.strip()
 
 def generate_academic_background(user_data):
-    name = user_data.get("name", "")
-    tenth_board = user_data.get("10th_board", "")
-    tenth_marks = user_data.get("10th_marks", "")
-    tenth_year = user_data.get("10th_year", "")
-    twelfth_board = user_data.get("12th_board", "")
-    twelfth_marks = user_data.get("12th_marks", "")
-    twelfth_year = user_data.get("12th_year", "")
     bachelors_degree = user_data.get("bachelors_degree", "")
     bachelors_college = user_data.get("bachelors_college", "")
     bachelors_cgpa = user_data.get("bachelors_cgpa", "")
     
     # Build academic background paragraph
-    para = f"My academic journey began with my 10th-grade education from {tenth_board} in {tenth_year}, where I achieved {tenth_marks}%, reflecting my commitment to academic excellence. I continued my education with 12th grade from {twelfth_board} in {twelfth_year}, securing {twelfth_marks}%, which provided me with a strong foundation for higher studies."
+    para = ACADEMIC_TEMPLATE.format(
+        tenth_board=user_data.get("10th_board", ""),
+        tenth_marks=user_data.get("10th_marks", ""),
+        tenth_year=user_data.get("10th_year", ""),
+        twelfth_board=user_data.get("12th_board", ""),
+        twelfth_marks=user_data.get("12th_marks", ""),
+        twelfth_year=user_data.get("12th_year", "")
+    )
     
     # Add bachelor's degree if applicable
     if bachelors_degree and bachelors_college:
         bachelors_result = f"with a CGPA of {bachelors_cgpa}" if bachelors_cgpa else ""
-        para += f" I further pursued a {bachelors_degree} from {bachelors_college} {bachelors_result}, which equipped me with the necessary knowledge and skills in my field. This academic background has prepared me well for the advanced studies I now wish to pursue."
+        para += ACADEMIC_BACHELORS_TEMPLATE.format(
+            bachelors_degree=bachelors_degree,
+            bachelors_college=bachelors_college,
+            bachelors_result=bachelors_result
+        )
     
     return para.strip()
 
 def generate_language_proficiency(user_data):
-    name = user_data.get("name", "")
     test_type = user_data.get("test_type", "IELTS")
-    listening = user_data.get("listening", "")
-    speaking = user_data.get("speaking", "")
-    writing = user_data.get("writing", "")
-    reading = user_data.get("reading", "")
     overall = user_data.get("overall", "")
     
-    # Determine proficiency level
-    if test_type == "IELTS":
-        try:
-            overall_float = float(overall) if overall else 0
-            high_proficiency = overall_float >= 7.0
-        except ValueError:
-            high_proficiency = False
-    else:  # PTE
-        try:
-            overall_float = float(overall) if overall else 0
-            high_proficiency = overall_float >= 65
-        except ValueError:
-            high_proficiency = False
-    
     # Build language proficiency paragraph
-    if test_type == "IELTS":
-        para = f"To demonstrate my English language proficiency, I took the IELTS examination and achieved an overall score of {overall}, with individual scores of {listening} in Listening, {speaking} in Speaking, {writing} in Writing, and {reading} in Reading."
-    else:
-        para = f"To demonstrate my English language proficiency, I took the PTE examination and achieved an overall score of {overall}, with individual scores of {speaking} in Speaking, {reading} in Reading, {writing} in Writing, and {listening} in Listening."
+    template = LANGUAGE_IELTS_TEMPLATE if test_type == "IELTS" else LANGUAGE_PTE_TEMPLATE
+    para = template.format(
+        overall=overall,
+        listening=user_data.get("listening", ""),
+        speaking=user_data.get("speaking", ""),
+        writing=user_data.get("writing", ""),
+        reading=user_data.get("reading", "")
+    )
     
     # Add proficiency description based on score
-    if high_proficiency:
-        para += " These scores reflect my strong command of the English language, which will enable me to excel in academic discussions, research work, and professional communication during my studies abroad. My proficiency will allow me to fully engage with the curriculum, contribute meaningfully to class discussions, and produce high-quality academic work."
+    if has_high_proficiency(test_type, overall):
+        para += LANGUAGE_HIGH_PROFICIENCY
     else:
-        para += " These scores demonstrate my ability to communicate effectively in English, which is sufficient for academic coursework, assignments, and interactions in an international learning environment. I am confident that my language skills will allow me to understand lectures, participate in discussions, and complete written assignments successfully throughout my program."
+        para += LANGUAGE_STANDARD_PROFICIENCY
     
     return para.strip()
 
 def generate_program_relevance(user_data):
-    name = user_data.get("name", "")
     course = user_data.get("course", "")
     bachelors_degree = user_data.get("bachelors_degree", "")
     work_experience = user_data.get("work_experience", "")
     
     # First paragraph: Academic and Professional Relevance
-    para1 = f"My academic background in {bachelors_degree if bachelors_degree else 'my previous studies'} has naturally led me to pursue {course}. Throughout my education, I developed a strong interest in this field through coursework and projects that challenged me to apply theoretical knowledge to practical problems."
+    para1 = PROGRAM_BACKGROUND_TEMPLATE.format(
+        bachelors_background=bachelors_degree if bachelors_degree else 'my previous studies',
+        course=course
+    )
     
     # Add work experience if applicable
     if work_experience:
-        para1 += f" Additionally, my professional experience in {work_experience} has provided me with valuable insights into the industry. Through this experience, I gained essential skills and realized the need for specialized knowledge that this program offers to advance in my career."
+        para1 += PROGRAM_WORK_EXPERIENCE_TEMPLATE.format(work_experience=work_experience)
     
     # Second paragraph: Skill Development
-    para2 = f"The {course} program will equip me with several crucial skill sets essential for success in this field. I expect to develop advanced critical thinking and analytical abilities that will help me assess complex problems logically and systematically. The program will enhance my problem-solving capabilities, preparing me to develop innovative solutions to challenges in my field. Furthermore, I will gain practical competencies that ensure I can apply theoretical knowledge in real-world scenarios. The development of communication and leadership skills will also enable me to collaborate effectively in professional settings, present ideas persuasively, and lead teams toward achieving organizational goals."
+    para2 = PROGRAM_SKILLS_TEMPLATE.format(course=course)
     
     # Third paragraph: Career Opportunities
-    para3 = "Upon completing this program, my career prospects and earning potential will significantly improve. The industry related to this field is experiencing substantial growth, with a projected 15% increase in job opportunities over the next five years. According to recent industry reports, professionals with specialized education in this field earn 25-30% higher salaries compared to those with only undergraduate degrees. The employment landscape shows a growing demand for skilled professionals who can navigate the evolving technological landscape and complex market challenges. The average starting salary for graduates from this program ranges from $60,000 to $75,000 annually, with potential for significant growth as experience increases. Completing this program will position me competitively in the job market and provide me with the credentials necessary for advancement in this dynamic and rewarding field."
-    
-    return f"{para1}\n\n{para2}\n\n{para3}"
+    return f"{para1}\n\n{para2}\n\n{PROGRAM_CAREER_PARAGRAPH}"
 
 def generate_financial_background(user_data):
-    name = user_data.get("name", "")
-    father_income = user_data.get("father_income", "")
-    mother_income = user_data.get("mother_income", "")
-    father_funds = user_data.get("father_funds", "")
-    mother_funds = user_data.get("mother_funds", "")
     fixed_deposits = user_data.get("fixed_deposits", "")
     
     # Build financial background paragraph
-    para = f"I have made comprehensive financial arrangements to support my education abroad. My funding will primarily come from my parents, with my father earning {father_income} annually and my mother earning {mother_income} annually. They have accumulated liquid funds of {father_funds} in my father's account and {mother_funds} in my mother's account specifically to support my education."
+    para = FINANCIAL_TEMPLATE.format(
+        father_income=user_data.get("father_income", ""),
+        mother_income=user_data.get("mother_income", ""),
+        father_funds=user_data.get("father_funds", ""),
+        mother_funds=user_data.get("mother_funds", "")
+    )
     
     # Add fixed deposits if applicable
     if fixed_deposits:
-        para += f" Additionally, we have fixed deposits worth {fixed_deposits}, which further strengthen our financial position."
+        para += FINANCIAL_DEPOSITS_TEMPLATE.format(fixed_deposits=fixed_deposits)
     
-    para += " These resources will comfortably cover my tuition fees, living expenses, and other costs associated with my education abroad. My family's stable financial background, including various movable and immovable assets, ensures that I have a strong financial backup throughout my program. This financial security will allow me to focus entirely on my studies without any financial concerns."
+    para += FINANCIAL_CLOSING
     
     return para.strip()
 
 def generate_country_choice(user_data):
-    country = user_data.get("country", "")
-    
-    # First paragraph about multicultural environment and student support
-    para1 = f"{country} is renowned for its commitment to multiculturalism and inclusivity, creating an ideal environment for international students like me. The educational institutions in {country} offer excellent support to international students through dedicated international student offices that assist with visa processes, orientation, and integration into campus life. Academic support centers provide essential tutoring and counseling to help students transition smoothly into the {country}'s educational system. Additionally, language support programs are designed to enhance students' proficiency and confidence in English, ensuring effective communication throughout their academic journey."
-    
-    # Second paragraph comparing with other countries and highlighting advantages
-    para2 = f"When comparing {country} with other popular study destinations, several factors make it particularly attractive. Financially, {country} offers more competitive tuition fees and a lower cost of living compared to countries like the United States or the United Kingdom, making quality education more accessible. {country} is home to several world-class universities consistently ranked among the top 100 globally, offering cutting-edge research opportunities and faculty comprising leading experts in various fields. The country's reputation for safety is exemplary, with crime rates significantly lower than many other developed nations. The standard of living is exceptional, with excellent healthcare, transportation, and public services. Furthermore, {country}'s rich cultural heritage and diverse population provide unique opportunities for personal growth through exposure to various traditions and perspectives. These compelling factors have collectively influenced my decision to choose {country} as the ideal destination for my academic and professional aspirations."
-    
-    return f"{para1}\n\n{para2}"
+    return COUNTRY_CHOICE_TEMPLATE.format(country=user_data.get("country", ""))
 
 def generate_career_opportunities(user_data):
-    course = user_data.get("course", "")
-    
-    # First paragraph: Long-term career aspirations
-    para1 = f"The {course} program will significantly enhance my long-term career prospects in India, which has a rapidly growing industry in this field. According to recent industry reports, this sector is projected to grow at a compound annual growth rate (CAGR) of 12-15% over the next decade in India. This growth is driven by increasing digitalization, government initiatives, and foreign investments. Professionals with specialized education in this field are expected to see their earning potential increase by 25-30% within five years of experience. The program will equip me with the advanced skills needed to pursue senior-level positions, leadership roles, or entrepreneurial ventures. India's market is expected to create over 200,000 new jobs in this sector by 2025, with salaries for experienced professionals ranging from ₹15-25 lakhs annually. The knowledge and credentials gained from this program will significantly enhance my career stability and opportunities for advancement in India's competitive job market."
-    
-    # Second paragraph: Immediate career opportunities
-    para2 = f"Upon returning to India after completing the {course} program, I will have numerous immediate career opportunities. I can pursue roles such as Project Manager, Solutions Architect, Business Analyst, or Technical Consultant, depending on my specialization within the program. Major multinational corporations operating in India, including TCS, Infosys, Wipro, and HCL Technologies, actively recruit professionals with international qualifications in this field. Additionally, Indian companies like Reliance Industries, Bharti Airtel, and Tech Mahindra offer excellent opportunities. The average starting salary for graduates with international qualifications in this field ranges from ₹8-12 lakhs per annum in major Indian cities, which is approximately 30% higher than those with only domestic qualifications. According to a 2023 industry survey, 85% of graduates with international degrees in this field secure employment within three months of returning to India. The skills and global perspective gained from studying abroad make candidates particularly attractive to employers looking to expand their international operations or implement global best practices."
-    
-    return f"{para1}\n\n{para2}"
+    return CAREER_OPPORTUNITIES_TEMPLATE.format(course=user_data.get("course", ""))
 
 def generate_family_ties(user_data):
-    name = user_data.get("name", "")
-    family_members = user_data.get("family_members", "")
-    
-    # First paragraph: Family connections
-    para1 = "My strong family ties in India serve as a primary motivation for my return after completing my education abroad. I come from a close-knit family where I have significant responsibilities toward my parents and other family members. My family has supported me throughout my educational journey, and I feel a deep sense of responsibility to return and be present for them. Additionally, my family has established assets and investments that require my attention and management in the future, further necessitating my return to India."
-    
-    # Second paragraph: Cultural ties
-    para2 = "Beyond family responsibilities, I have profound emotional and cultural ties to India that strengthen my resolve to return. Having been raised in India, I share a deep connection with its cultural values, traditions, and social fabric. The sense of belonging I feel in my community and the established social networks I have developed over the years form an integral part of my identity. These cultural bonds are irreplaceable and reinforce my intention to return home after completing my studies abroad. The familiarity with the local customs, languages, and way of life makes India the place where I can truly thrive both personally and professionally."
-    
-    # Third paragraph: Professional opportunities
-    para3 = "From a professional standpoint, India offers me exceptional career opportunities that align perfectly with my educational goals. The knowledge and skills I will gain through my international education will be particularly valuable in the Indian market, where there is a growing demand for professionals with global exposure and specialized expertise. The rapidly developing economy and expanding industry sectors in India provide fertile ground for applying my international education to contribute meaningfully to local organizations and the broader economy. I am enthusiastic about the prospect of bringing back cutting-edge knowledge and best practices to contribute to India's growth story. My international education will enable me to act as a bridge between global innovations and local implementation, creating value for employers and the economy in my home country."
-    
-    return f"{para1}\n\n{para2}\n\n{para3}"
+    return FAMILY_TIES_PARAGRAPHS
 
 def generate_conclusion(user_data):
-    name = user_data.get("name", "")
-    course = user_data.get("course", "")
-    country = user_data.get("country", "")
-    
-    conclusion = f"My sole purpose for studying in {country} is to gain quality education in {course}. I am firmly committed to returning to India after completing my studies due to my strong family ties, promising career prospects in India, and responsibilities toward managing family assets. This program will significantly enhance my professional profile and help me achieve both my career and personal goals. I am grateful for the opportunity to pursue my education in {country} and look forward to contributing positively to my industry upon my return to India."
+    conclusion = CONCLUSION_TEMPLATE.format(
+        country=user_data.get("country", ""),
+        course=user_data.get("course", "")
+    )
     
     return conclusion.strip()
 
+
 def generate_sop(user_data):
     """Generate a complete Statement of Purpose based on user data"""
     sections = {
@@ -198,4 +227,129 @@ def generate_sop(user_data):
         sop.append(content)
         sop.append("")  # Add empty line between sections
     
-    return "\n\n".join(sop).strip() 
\ No newline at end of file
+    return "\n\n".join(sop).strip() 
+
+# Compiled renderer for large batches. Every combination of optional paragraphs is joined into one
+# document template and split into literal pieces and field slots at import time, so rendering an
+# applicant only fills the slots and joins, with the constant paragraphs shared across all SOPs.
+
+# Template field -> user_data key, read once per applicant
+TEMPLATE_FIELD_SOURCES = {
+    "name": "name",
+    "university": "university_name",
+    "course": "course",
+    "intake": "intake",
+    "country": "country",
+    "tenth_board": "10th_board",
+    "tenth_marks": "10th_marks",
+    "tenth_year": "10th_year",
+    "twelfth_board": "12th_board",
+    "twelfth_marks": "12th_marks",
+    "twelfth_year": "12th_year",
+    "bachelors_degree": "bachelors_degree",
+    "bachelors_college": "bachelors_college",
+    "listening": "listening",
+    "speaking": "speaking",
+    "writing": "writing",
+    "reading": "reading",
+    "overall": "overall",
+    "work_experience": "work_experience",
+    "father_income": "father_income",
+    "mother_income": "mother_income",
+    "father_funds": "father_funds",
+    "mother_funds": "mother_funds",
+    "fixed_deposits": "fixed_deposits"
+}
+
+TEMPLATE_FIELD_ITEMS = tuple(TEMPLATE_FIELD_SOURCES.items())
+
+# Fields computed from other inputs rather than read directly
+DERIVED_TEMPLATE_FIELDS = {"state", "bachelors_result", "bachelors_background"}
+
+def compile_sop_template(has_bachelors, is_ielts, high_proficiency, has_work_experience, has_fixed_deposits):
+    """Join the section templates for one combination of optional paragraphs into a document template"""
+    academic = ACADEMIC_TEMPLATE + (ACADEMIC_BACHELORS_TEMPLATE if has_bachelors else "")
+    language = (LANGUAGE_IELTS_TEMPLATE if is_ielts else LANGUAGE_PTE_TEMPLATE) + \
+        (LANGUAGE_HIGH_PROFICIENCY if high_proficiency else LANGUAGE_STANDARD_PROFICIENCY)
+    program = PROGRAM_BACKGROUND_TEMPLATE + (PROGRAM_WORK_EXPERIENCE_TEMPLATE if has_work_experience else "") + \
+        "\n\n" + PROGRAM_SKILLS_TEMPLATE + "\n\n" + PROGRAM_CAREER_PARAGRAPH
+    financial = FINANCIAL_TEMPLATE + (FINANCIAL_DEPOSITS_TEMPLATE if has_fixed_deposits else "") + FINANCIAL_CLOSING
+    
+    contents = [
+        INTRODUCTION_TEMPLATE, academic, language, program, financial,
+        COUNTRY_CHOICE_TEMPLATE, CAREER_OPPORTUNITIES_TEMPLATE, FAMILY_TIES_PARAGRAPHS, CONCLUSION_TEMPLATE
+    ]
+    
+    sop = []
+    for title, content in zip(SOP_TITLES, contents):
+        sop.append(title)
+        sop.append(content)
+        sop.append("")
+    
+    return "\n\n".join(sop).strip()
+
+class CompiledTemplate:
+    """A document template split once into literal pieces and the field slots between them"""
+    
+    def __init__(self, template):
+        self.pieces = []
+        self.slots = []
+        for literal, field, _, _ in string.Formatter().parse(template):
+            if literal:
+                self.pieces.append(literal)
+            if field:
+                self.slots.append((len(self.pieces), field))
+                self.pieces.append("")
+        self.fields = {field for _, field in self.slots}
+    
+    def render(self, context):
+        out = self.pieces.copy()
+        for index, field in self.slots:
+            out[index] = context[field]
+        try:
+            return "".join(out)
+        except TypeError:
+            # Non-string values (e.g. numbers from JSON input) are formatted the way an f-string would
+            return "".join(value if type(value) is str else format(value, "") for value in out)
+
+COMPILED_SOP_TEMPLATES = {
+    variant: CompiledTemplate(compile_sop_template(*variant))
+    for variant in itertools.product((False, True), repeat=5)
+}
+
+# Every template must be renderable from the resolved field list
+for _template in COMPILED_SOP_TEMPLATES.values():
+    assert _template.fields <= set(TEMPLATE_FIELD_SOURCES) | DERIVED_TEMPLATE_FIELDS
+
+def build_render_context(user_data):
+    """Resolve an applicant's fields once and pick the matching compiled template"""
+    get = user_data.get
+    context = {field: get(source, "") for field, source in TEMPLATE_FIELD_ITEMS}
+    
+    context["state"] = extract_state(get("address", ""))
+    bachelors_cgpa = get("bachelors_cgpa", "")
+    context["bachelors_result"] = f"with a CGPA of {bachelors_cgpa}" if bachelors_cgpa else ""
+    context["bachelors_background"] = context["bachelors_degree"] if context["bachelors_degree"] else 'my previous studies'
+    
+    test_type = get("test_type", "IELTS")
+    variant = (
+        bool(context["bachelors_degree"] and context["bachelors_college"]),
+        test_type == "IELTS",
+        has_high_proficiency(test_type, context["overall"]),
+        bool(context["work_experience"]),
+        bool(context["fixed_deposits"])
+    )
+    return COMPILED_SOP_TEMPLATES[variant], context
+
+def render_sop(user_data):
+    """Compiled equivalent of generate_sop for a single applicant"""
+    template, context = build_render_context(user_data)
+    return template.render(context)
+
+def render_sop_batch(records):
+    """Render SOPs for a batch of applicants; each result matches generate_sop for that record"""
+    results = []
+    for user_data in records:
+        template, context = build_render_context(user_data)
+        results.append(template.render(context))
+    return results
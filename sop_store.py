@@ -0,0 +1,397 @@
+import argparse
+import atexit
+import datetime
+import glob
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS applicants (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        name_key TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_applicants_name ON applicants(name_key, created_at);
+    CREATE INDEX IF NOT EXISTS idx_applicants_created ON applicants(created_at);
+
+    CREATE TABLE IF NOT EXISTS generations (
+        id TEXT PRIMARY KEY,
+        applicant_id TEXT,
+        name TEXT NOT NULL,
+        name_key TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        generation_time REAL,
+        origin TEXT NOT NULL,
+        complete_sop TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_generations_name ON generations(name_key, created_at);
+    CREATE INDEX IF NOT EXISTS idx_generations_created ON generations(created_at);
+    CREATE INDEX IF NOT EXISTS idx_generations_applicant ON generations(applicant_id);
+
+    CREATE TABLE IF NOT EXISTS sections (
+        generation_id TEXT NOT NULL,
+        section_key TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        source TEXT,
+        time REAL,
+        eval_count INTEGER,
+        prompt_eval_count INTEGER,
+        cached INTEGER,
+        PRIMARY KEY (generation_id, section_key)
+    );
+
+    CREATE TABLE IF NOT EXISTS imported_files (
+        path TEXT PRIMARY KEY,
+        imported_at REAL NOT NULL
+    );
+"""
+
+FILENAME_TIMESTAMP = re.compile(r'(\d{8}_\d{6})')
+
+
+def name_key(name):
+    """Case- and whitespace-insensitive form of an applicant name used for lookups"""
+    return " ".join(str(name or "unnamed").replace('_', ' ').split()).lower()
+
+
+class SopStore:
+    """SQLite (WAL) store for applicants, generated SOPs and their sections, written in batches off the request path"""
+
+    def __init__(self, path, batch_size=100, max_queue=10000):
+        self.path = path
+        self.batch_size = batch_size  # Queued writes committed per transaction
+        self.max_queue = max_queue  # Beyond this, writes happen inline instead of being queued
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self._writer_pid = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().executescript(SCHEMA)
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """Return this thread's connection (sqlite connections must not cross threads or forks)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error:
+            conn.close()  # Not cached, so the next call tries again
+            raise
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    # Writes
+
+    def _writer_running(self):
+        return self._writer_pid == os.getpid() and self._writer.is_alive()
+
+    def _ensure_writer(self):
+        # The writer thread belongs to the process that started it; a forked worker starts its own
+        if self._writer_running():
+            return
+        with self._lock:
+            if self._writer_running():
+                return
+            if self._writer_pid == os.getpid():
+                print("SOP store writer thread died, restarting it")  # Keeps the queue and what is still in it
+            else:
+                self._queue = queue.Queue(maxsize=self.max_queue)
+            self._writer = threading.Thread(target=self._writer_loop, args=(self._queue,), daemon=True,
+                                            name="sop-store-writer")
+            self._writer.start()
+            self._writer_pid = os.getpid()
+
+    def _enqueue(self, statements):
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(statements)
+        except queue.Full:
+            self._write_batch([statements])  # Slower, but never drop a record
+
+    def _writer_loop(self, pending):
+        while True:
+            batch = [pending.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                # Never let one bad batch kill the writer: everything queued after it would wait forever
+                print(f"SOP store writer error, {len(batch)} queued writes lost: {str(e)}")
+                traceback.print_exc()
+            finally:
+                for _ in batch:
+                    pending.task_done()
+
+    def _write_batch(self, batch):
+        """Commit a batch in one transaction; if it fails, retry record by record so one bad row loses only itself"""
+        try:
+            self._execute(self._connect(), [statement for statements in batch for statement in statements])
+            return
+        except sqlite3.Error as e:
+            print(f"SOP store batch write failed, retrying individually: {str(e)}")
+        for statements in batch:
+            try:
+                self._execute(self._connect(), statements)
+            except sqlite3.Error as e:
+                print(f"SOP store write failed: {str(e)}")
+                traceback.print_exc()
+
+    @staticmethod
+    def _execute(conn, statements):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                if isinstance(params, list):
+                    conn.executemany(sql, params)
+                else:
+                    conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def flush(self, timeout=10):
+        """Wait (up to timeout seconds) for this process's queued writes to be committed"""
+        if self._writer_pid != os.getpid():
+            return
+        self._ensure_writer()  # Restarts a dead writer so the queue can drain
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.02)
+
+    @staticmethod
+    def _applicant_statements(applicant_id, user_data, created_at):
+        name = user_data.get('name') or 'unnamed'
+        return [(
+            "INSERT OR REPLACE INTO applicants (id, name, name_key, created_at, data) VALUES (?, ?, ?, ?, ?)",
+            (applicant_id, name, name_key(name), created_at, json.dumps(user_data, ensure_ascii=False))
+        )]
+
+    @staticmethod
+    def _generation_statements(generation_id, applicant_id, name, complete_sop, sections, section_stats,
+                               generation_time, origin, created_at):
+        section_stats = section_stats or {}
+        section_rows = []
+        for position, (section_key, content) in enumerate((sections or {}).items()):
+            stats = section_stats.get(section_key, {})
+            section_rows.append((
+                generation_id, section_key, position, content, stats.get("source"), stats.get("time"),
+                stats.get("eval_count"), stats.get("prompt_eval_count"),
+                None if stats.get("cached") is None else int(bool(stats.get("cached")))
+            ))
+        statements = [(
+            "INSERT OR REPLACE INTO generations "
+            "(id, applicant_id, name, name_key, created_at, generation_time, origin, complete_sop) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (generation_id, applicant_id, name or 'unnamed', name_key(name), created_at, generation_time, origin,
+             complete_sop)
+        )]
+        if section_rows:
+            statements.append((
+                "INSERT OR REPLACE INTO sections (generation_id, section_key, position, content, source, time, "
+                "eval_count, prompt_eval_count, cached) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                section_rows
+            ))
+        return statements
+
+    def save_applicant(self, user_data):
+        """Queue an applicant's form data and return its id"""
+        applicant_id = uuid.uuid4().hex
+        self._enqueue(self._applicant_statements(applicant_id, dict(user_data), time.time()))
+        return applicant_id
+
+    def save_generation(self, name, complete_sop, sections=None, applicant_id=None, section_stats=None,
+                        generation_time=None, origin="app"):
+        """Queue a generated SOP with its sections and return the generation id"""
+        generation_id = uuid.uuid4().hex
+        self._enqueue(self._generation_statements(
+            generation_id, applicant_id, name, complete_sop, sections, section_stats,
+            generation_time, origin, time.time()
+        ))
+        return generation_id
+
+    # Reads
+
+    @staticmethod
+    def _name_range(name):
+        # Prefix match expressed as a range so it can use the (name_key, created_at) index
+        prefix = name_key(name)
+        return prefix, prefix + "\uffff"
+
+    def find_applicants(self, name=None, since=None, until=None, limit=50):
+        """Applicants whose name starts with name, created within [since, until) (epoch seconds), newest first"""
+        clauses, params = [], []
+        if name:
+            clauses.append("name_key >= ? AND name_key < ?")
+            params.extend(self._name_range(name))
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT id, name, created_at, data FROM applicants {where} ORDER BY created_at DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return [{"id": row["id"], "name": row["name"], "created_at": row["created_at"],
+                 "data": json.loads(row["data"])} for row in rows]
+
+    def find_generations(self, name=None, since=None, until=None, limit=50):
+        """Generation summaries (without text) filtered like find_applicants, newest first"""
+        clauses, params = [], []
+        if name:
+            clauses.append("name_key >= ? AND name_key < ?")
+            params.extend(self._name_range(name))
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT id, applicant_id, name, created_at, generation_time, origin FROM generations {where} "
+            f"ORDER BY created_at DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_generation(self, generation_id):
+        """Return a generation with its applicant data and sections, or None"""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM generations WHERE id = ?", (generation_id,)).fetchone()
+        if row is None:
+            return None
+        generation = dict(row)
+        del generation["name_key"]
+        generation["sections"] = [
+            dict(section) for section in conn.execute(
+                "SELECT section_key, content, source, time, eval_count, prompt_eval_count, cached "
+                "FROM sections WHERE generation_id = ? ORDER BY position", (generation_id,)
+            )
+        ]
+        applicant = conn.execute("SELECT data FROM applicants WHERE id = ?", (generation["applicant_id"],)).fetchone()
+        generation["user_data"] = json.loads(applicant["data"]) if applicant else None
+        return generation
+
+    def stats(self):
+        conn = self._connect()
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("applicants", "generations", "sections")}
+        counts["queued_writes"] = self._queue.unfinished_tasks if self._writer_pid == os.getpid() else 0
+        return counts
+
+    # One-time import of the JSON/TXT files written before this store existed
+
+    def import_legacy_files(self, data_dir="data", saved_data_dir="saved_data", generated_dir="generated_sops"):
+        """Import old per-request files, pairing each SOP with the latest earlier applicant of the same name"""
+        conn = self._connect()
+        already = {row[0] for row in conn.execute("SELECT path FROM imported_files")}
+
+        def timestamp_of(path):
+            match = FILENAME_TIMESTAMP.search(os.path.basename(path))
+            if match:
+                return datetime.datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+            return os.path.getmtime(path)
+
+        def sop_name(path, prefix):
+            # sop_<name>_<timestamp>.json / SOP_<name>_<timestamp>.txt
+            stem = os.path.splitext(os.path.basename(path))[0][len(prefix):]
+            return FILENAME_TIMESTAMP.sub('', stem).strip('_') or 'unnamed'
+
+        applicant_files = glob.glob(os.path.join(data_dir, "user_data_*.json")) + \
+            glob.glob(os.path.join(saved_data_dir, "user_data_*.json"))
+        sop_files = [(path, "sop_") for path in glob.glob(os.path.join(data_dir, "sop_*.json"))] + \
+            [(path, "SOP_") for path in glob.glob(os.path.join(generated_dir, "SOP_*.txt"))]
+
+        applicants_by_name = {}
+        imported = {"applicants": 0, "generations": 0, "skipped": 0}
+        statements = []
+
+        for path in sorted(applicant_files, key=timestamp_of):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    user_data = json.load(f)
+            except Exception as e:
+                print(f"Skipping {path}: {str(e)}")
+                imported["skipped"] += 1
+                continue
+            applicant_id = uuid.uuid5(uuid.NAMESPACE_URL, os.path.abspath(path)).hex
+            created_at = timestamp_of(path)
+            applicants_by_name.setdefault(name_key(user_data.get('name')), []).append((created_at, applicant_id))
+            if path in already:
+                continue
+            statements += self._applicant_statements(applicant_id, user_data, created_at)
+            statements.append(("INSERT OR IGNORE INTO imported_files (path, imported_at) VALUES (?, ?)", (path, time.time())))
+            imported["applicants"] += 1
+
+        for path, prefix in sorted(sop_files, key=lambda item: timestamp_of(item[0])):
+            if path in already:
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    if path.endswith('.json'):
+                        data = json.load(f)
+                        complete_sop, sections, origin = data.get("complete_sop", ""), data.get("sections"), "import:app"
+                    else:
+                        complete_sop, sections, origin = f.read(), None, "import:app_web"
+            except Exception as e:
+                print(f"Skipping {path}: {str(e)}")
+                imported["skipped"] += 1
+                continue
+
+            name = sop_name(path, prefix).replace('_', ' ')
+            created_at = timestamp_of(path)
+            earlier = [entry for entry in applicants_by_name.get(name_key(name), []) if entry[0] <= created_at]
+            applicant_id = max(earlier)[1] if earlier else None
+            generation_id = uuid.uuid5(uuid.NAMESPACE_URL, os.path.abspath(path)).hex
+
+            statements += self._generation_statements(generation_id, applicant_id, name, complete_sop, sections,
+                                                      None, None, origin, created_at)
+            statements.append(("INSERT OR IGNORE INTO imported_files (path, imported_at) VALUES (?, ?)", (path, time.time())))
+            imported["generations"] += 1
+
+        if statements:
+            self._execute(conn, statements)
+        return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the per-request JSON/TXT files into the SQLite SOP store")
+    parser.add_argument('--db', default=os.environ.get("SOP_STORE_PATH", "data/sop_store.db"))
+    parser.add_argument('--data-dir', default="data", help="app.py's user_data_*.json and sop_*.json files")
+    parser.add_argument('--saved-data-dir', default="saved_data", help="app_web.py's user_data_*.json files")
+    parser.add_argument('--generated-dir', default="generated_sops", help="app_web.py's SOP_*.txt files")
+    args = parser.parse_args()
+
+    store = SopStore(args.db)
+    imported = store.import_legacy_files(args.data_dir, args.saved_data_dir, args.generated_dir)
+    print(f"Imported {imported['applicants']} applicants and {imported['generations']} SOPs "
+          f"({imported['skipped']} unreadable files skipped) into {args.db}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from ollama_pool import OllamaHostPool  # noqa: E402
+
+MODEL = "llama3.2"
+
+
+def open_breaker(pool, reset_timeout):
+    """Fail three calls in a row on the only host, then wait until its breaker allows a trial"""
+    for _ in range(3):
+        host = pool.acquire(MODEL)
+        pool.release(host, False, model=MODEL)
+    assert pool.hosts[0].breaker.state == CircuitBreaker.OPEN
+    time.sleep(reset_timeout)
+    return pool.hosts[0]
+
+
+def test_unanswered_uncounted_call_does_not_close_breaker():
+    # A prompt-context prime that gets connection refused from a dead host: count_failure=False, no response
+    pool = OllamaHostPool(hosts=["http://dead:11434"], failure_threshold=3, reset_timeout=0.05)
+    dead = open_breaker(pool, 0.05)
+
+    host = pool.acquire(MODEL)
+    assert host is dead  # The half-open trial
+    pool.release(host, False, model=MODEL, count_failure=False, responded=False)
+
+    snapshot = dead.breaker.snapshot()
+    assert snapshot["state"] != CircuitBreaker.CLOSED
+    assert snapshot["consecutive_failures"] == 3
+
+
+def test_unanswered_uncounted_call_frees_the_trial():
+    pool = OllamaHostPool(hosts=["http://dead:11434"], failure_threshold=3, reset_timeout=0.05)
+    dead = open_breaker(pool, 0.05)
+
+    pool.release(pool.acquire(MODEL), False, model=MODEL, count_failure=False, responded=False)
+
+    # The next section request still gets a trial, and its failure reopens the breaker
+    host = pool.acquire(MODEL)
+    assert host is dead
+    pool.release(host, False, model=MODEL)
+    assert dead.breaker.state == CircuitBreaker.OPEN
+
+
+def test_answered_uncounted_call_closes_half_open_trial():
+    # A 4xx is not the host's fault, but the host answered, so it is reachable
+    pool = OllamaHostPool(hosts=["http://slow:11434"], failure_threshold=3, reset_timeout=0.05)
+    host = open_breaker(pool, 0.05)
+
+    pool.release(pool.acquire(MODEL), False, model=MODEL, count_failure=False, responded=True)
+
+    snapshot = host.breaker.snapshot()
+    assert snapshot["state"] == CircuitBreaker.CLOSED
+    assert snapshot["consecutive_failures"] == 0
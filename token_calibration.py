@@ -0,0 +1,123 @@
+import json
+import math
+import os
+import threading
+import time
+import traceback
+from collections import deque
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class TokenCalibrationStore:
+    """Learn tokens-per-word and output length per (section, model) from Ollama's eval_count and size num_predict from them
+
+    Only outputs that finished on their own should be recorded: one cut off at num_predict understates both.
+    """
+
+    def __init__(self, path, history_size=200, pct=95, headroom=1.15, min_samples=5,
+                 min_tokens=64, max_tokens=3000, round_to=64, save_every=10):
+        self.path = path
+        self.history_size = history_size
+        self.pct = pct  # Percentile of observed tokens/word used for the budget
+        self.headroom = headroom
+        self.min_samples = min_samples  # Below this, callers get their default budget
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.round_to = round_to  # Keeps budgets (and so completion cache keys) stable between samples
+        self.save_every = save_every
+        self._history = {}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def _key(section_key, model):
+        return f"{model}|{section_key}"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            for key, samples in data.get("samples", {}).items():
+                self._history[key] = deque((tuple(sample) for sample in samples), maxlen=self.history_size)
+        except Exception as e:
+            print(f"Could not load token calibration from {self.path}: {str(e)}")
+
+    def save(self):
+        """Merge this process's samples with the file on disk and write it back atomically"""
+        with self._lock:
+            merged = {key: set(samples) for key, samples in self._history.items()}
+            self._unsaved = 0
+        try:
+            if os.path.exists(self.path):
+                with open(self.path) as f:
+                    for key, samples in json.load(f).get("samples", {}).items():
+                        merged.setdefault(key, set()).update(tuple(sample) for sample in samples)
+
+            data = {"samples": {key: sorted(samples)[-self.history_size:] for key, samples in merged.items()}}
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"Could not save token calibration: {str(e)}")
+            traceback.print_exc()
+
+    def record(self, section_key, model, eval_count, word_count):
+        """Record one complete (not truncated) generation's real token usage"""
+        if not eval_count or not word_count:
+            return
+        sample = (round(time.time(), 3), round(eval_count / word_count, 4), eval_count)
+        with self._lock:
+            key = self._key(section_key, model)
+            if key not in self._history:
+                self._history[key] = deque(maxlen=self.history_size)
+            self._history[key].append(sample)
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def _samples(self, section_key, model):
+        """(ratios, eval_counts) recorded for a section; files written before eval_count was kept have only ratios"""
+        with self._lock:
+            samples = list(self._history.get(self._key(section_key, model), ()))
+        return [sample[1] for sample in samples], [sample[2] for sample in samples if len(sample) > 2]
+
+    def budget(self, section_key, model, word_limit, default):
+        """Return num_predict for a section, or default until calibrated: the larger of word_limit x high-percentile
+        tokens/word and the high-percentile output length actually observed (models overshoot the word limit)"""
+        ratios, eval_counts = self._samples(section_key, model)
+        if len(ratios) < self.min_samples:
+            return default
+        tokens = word_limit * percentile(ratios, self.pct)
+        if eval_counts:
+            tokens = max(tokens, percentile(eval_counts, self.pct))
+        tokens = math.ceil(tokens * self.headroom / self.round_to) * self.round_to
+        return int(min(max(tokens, self.min_tokens), self.max_tokens))
+
+    def snapshot(self, word_limits, model, defaults):
+        """Describe the learned ratios and budgets for every section of a model"""
+        report = {}
+        for section_key, word_limit in word_limits.items():
+            ratios, eval_counts = self._samples(section_key, model)
+            report[section_key] = {
+                "samples": len(ratios),
+                "tokens_per_word_p50": percentile(ratios, 50) if ratios else None,
+                f"tokens_per_word_p{self.pct:g}": percentile(ratios, self.pct) if ratios else None,
+                f"eval_count_p{self.pct:g}": percentile(eval_counts, self.pct) if eval_counts else None,
+                "word_limit": word_limit,
+                "default_budget": defaults[section_key],
+                "budget": self.budget(section_key, model, word_limit, defaults[section_key]),
+                "calibrated": len(ratios) >= self.min_samples
+            }
+        return report
@@ -0,0 +1,173 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, trace, name, parent, attrs):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.parent = parent
+        self.attrs = dict(attrs)
+        self.start = time.time()
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start,
+            "offset_ms": round((self.start - self.trace.start) * 1000, 2),
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs,
+            "error": self.error
+        }
+
+
+class Trace:
+    def __init__(self, max_spans):
+        self.trace_id = uuid.uuid4().hex
+        self.start = time.time()
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped_spans = 0
+        self.root = None
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+
+    def to_dict(self, spans=True):
+        data = {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start": self.start,
+            "duration_ms": self.root.duration_ms,
+            "attrs": self.root.attrs,
+            "error": self.root.error,
+            "span_count": len(self.spans)
+        }
+        if spans:
+            with self._lock:
+                data["spans"] = [span.to_dict() for span in sorted(self.spans, key=lambda span: span.start)]
+            data["dropped_spans"] = self.dropped_spans
+        return data
+
+
+class Tracer:
+    """Span-based request tracing; finished traces go into a ring buffer and optionally a JSONL file"""
+
+    def __init__(self, max_traces=200, export_path=None, max_spans=500):
+        self.max_spans = max_spans
+        self.export_path = export_path
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+        if export_path:
+            os.makedirs(os.path.dirname(os.path.abspath(export_path)), exist_ok=True)
+
+    def start_span(self, name, new_trace=False, root=False, **attrs):
+        """Start a span under the current one; without a current span, start a trace only if new_trace.
+        root always starts a new trace, ignoring whatever span the context still holds."""
+        parent = None if root else _current_span.get()
+        new_trace = new_trace or root
+        if parent is None:
+            if not new_trace:
+                return None
+            trace = Trace(self.max_spans)
+        else:
+            trace = parent.trace
+        span = Span(trace, name, parent, attrs)
+        if parent is None:
+            trace.root = span
+        trace.add(span)
+        _current_span.set(span)
+        return span
+
+    def end_span(self, span, error=None):
+        if span is None:
+            return
+        span.duration_ms = round((time.time() - span.start) * 1000, 2)
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        # Restore the parent explicitly rather than with a reset token: generators and Flask teardown
+        # may end a span from a different context than the one that started it
+        _current_span.set(span.parent)
+        if span.parent is None:
+            self._finish(span.trace)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Child span of the active trace; a no-op (yielding None) outside of one"""
+        span = self.start_span(name, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        self.end_span(span)
+
+    @contextmanager
+    def trace(self, name, **attrs):
+        """Child span of the active trace, or the root of a new trace when there is none"""
+        span = self.start_span(name, new_trace=True, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        self.end_span(span)
+
+    @staticmethod
+    def current_trace_id():
+        span = _current_span.get()
+        return span.trace.trace_id if span else None
+
+    @staticmethod
+    def wrap(fn):
+        """Bind fn to a copy of the current context so spans it opens in a worker thread join this trace.
+        Call once per submitted task: one context cannot run in two threads at once."""
+        context = contextvars.copy_context()
+        return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+    def _finish(self, trace):
+        with self._lock:
+            self._traces.append(trace)
+        if self.export_path:
+            try:
+                line = json.dumps(trace.to_dict(), default=str)
+                with self._lock, open(self.export_path, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+            except Exception as e:
+                print(f"Could not export trace {trace.trace_id}: {str(e)}")
+
+    def recent(self, limit=50, min_duration_ms=0, name=None):
+        """Summaries of the most recent finished traces, newest first"""
+        with self._lock:
+            traces = list(self._traces)
+        traces = [trace for trace in reversed(traces)
+                  if (trace.root.duration_ms or 0) >= min_duration_ms and (name is None or trace.root.name == name)]
+        return [trace.to_dict(spans=False) for trace in traces[:limit]]
+
+    def get(self, trace_id):
+        with self._lock:
+            for trace in self._traces:
+                if trace.trace_id == trace_id:
+                    return trace.to_dict()
+        return None